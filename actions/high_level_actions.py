@@ -9,14 +9,28 @@ Released to be used in the project entitled "Autonomous multi-agent decision mak
 in Capture the Flag game" for the Advanced Topics in Computer Science course at the
 University of Adelaide.
 """
-##needed for calculating distance between agents
-from scipy.spatial.distance import cdist
-
-from guidance_laws.proportional_navigation import proportional_navigation
+from guidance_laws.proportional_navigation import proportional_navigation, proportional_navigation_batch
 from guidance_laws.all_aspect_proportional_navigation import all_aspect_proportional_navigation
 import numpy as np
 from gym import spaces
 
+# Integer codes of the high level actions (their index in HighLevelActionSet.action_set)
+GO_TO_ENEMY_FLAG, GO_TO_BASE, WAIT_AT_ENEMY_FLAG, GO_TAG_AGENT, ATTACK_CENTRE, ATTACK_BOTTOM, ATTACK_TOP, \
+    RETURN_CENTRE, RETURN_BOTTOM, RETURN_TOP = range(10)
+
+# Waypoints of HighLevelActionSet.get_accelerations (rows of its points array) for each action, while on the way to
+# a path point and after it (attackers on the way are at home, returners are in enemy territory). Agents tagging
+# head for their target.
+_ENEMY_FLAG, _HOME_FLAG, _CENTRE, _BOTTOM, _TOP, _SMART_WAYPOINT = range(6)
+_IS_RETURN = np.zeros(10, bool)
+_IS_RETURN[[RETURN_CENTRE, RETURN_BOTTOM, RETURN_TOP]] = True
+_RED_WAYPOINT_TABLES = np.array([[_ENEMY_FLAG, _HOME_FLAG, _ENEMY_FLAG, _HOME_FLAG, _CENTRE, _BOTTOM, _TOP, _CENTRE,
+                                  _BOTTOM, _TOP],
+                                 [_ENEMY_FLAG, _HOME_FLAG, _ENEMY_FLAG, _HOME_FLAG, _ENEMY_FLAG, _ENEMY_FLAG,
+                                  _ENEMY_FLAG, _HOME_FLAG, _HOME_FLAG, _HOME_FLAG]])
+_BLUE_WAYPOINT_TABLES = _RED_WAYPOINT_TABLES.copy()
+_BLUE_WAYPOINT_TABLES[1, [ATTACK_CENTRE, ATTACK_BOTTOM, ATTACK_TOP]] = _SMART_WAYPOINT
+
 
 class HighLevelActionSet:
 
@@ -32,6 +46,85 @@ class HighLevelActionSet:
                                     "return_top"])
         self.action_space = spaces.Discrete(len(self.action_set))
 
+    def get_accelerations(self, actions, team, enemy_team, home_flags, enemy_flags, target_idx, delta_time,
+                          flag_idx=0):
+        """Get the acceleration commands of a whole team from one high level action per agent. Every agent's waypoint
+        is looked up from tables indexed by its action (see get_waypoints), then the team is steered with one call to
+        take_direct_path_batch (and proportional_navigation_batch for taggers facing their target). The commands are
+        the same as calling the per agent functions (go_to_enemy_flag, attack_top, return_bottom, ...).
+
+        Territory checks use env.world_queries, so this has to be called before the agents move in a time step.
+
+        :param actions: int array (team.n,) of indices into action_set.
+        :param team: Agents object being controlled.
+        :param enemy_team: Agents object of the enemy.
+        :param home_flags: the team's Flags object.
+        :param enemy_flags: the enemy's Flags object.
+        :param target_idx: int array (team.n,) of the enemy each agent tags with go_tag_agent.
+        :param delta_time: step time.
+        :param flag_idx: which flag to attack/return to.
+        :return: ndarray (team.n, 2) of acceleration commands.
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        waypoints = self.get_waypoints(actions, team, enemy_team, home_flags, enemy_flags, target_idx, flag_idx)
+        tagging = np.flatnonzero(actions == GO_TAG_AGENT)
+        targets = np.asarray(target_idx)[tagging]
+
+        acceleration = take_direct_path_batch(team.positions, waypoints, team.speed, team.azimuths, delta_time)
+
+        # Taggers facing their target use proportional navigation
+        if len(tagging) > 0:
+            facing = get_angle_diff_batch(team.positions[tagging], waypoints[tagging],
+                                          team.azimuths[tagging]) < np.pi / 2
+            tagging, targets = tagging[facing], targets[facing]
+            acceleration[tagging] = proportional_navigation_batch(team.positions[tagging], team.velocities[tagging],
+                                                                  enemy_team.positions[targets],
+                                                                  enemy_team.velocities[targets])
+        return acceleration
+
+    def get_waypoints(self, actions, team, enemy_team, home_flags, enemy_flags, target_idx, flag_idx=0):
+        """Get the point each agent of a team is heading for with its high level action (the enemy flag, home flag,
+        a path point, or the target of agents tagging).
+
+        :param actions: int array (team.n,) of indices into action_set.
+        :param team: Agents object being controlled.
+        :param enemy_team: Agents object of the enemy.
+        :param home_flags: the team's Flags object.
+        :param enemy_flags: the enemy's Flags object.
+        :param target_idx: int array (team.n,) of the enemy each agent tags with go_tag_agent.
+        :param flag_idx: which flag to attack/return to.
+        :return: ndarray (team.n, 2) of waypoints.
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        if ((actions < 0) | (actions >= len(self.action_set))).any():
+            raise Exception("Invalid high level action")
+
+        world_queries = team.env.world_queries
+        if team.color == 'red':
+            in_home_territory = world_queries.in_red_territory(team)
+            in_enemy_territory = world_queries.in_blue_territory(team)
+            point_tables = _RED_WAYPOINT_TABLES
+        elif team.color == 'blue':
+            in_home_territory = world_queries.in_blue_territory(team)
+            in_enemy_territory = world_queries.in_red_territory(team)
+            point_tables = _BLUE_WAYPOINT_TABLES
+        else:
+            raise Exception("Invalid Team")
+
+        # Attackers head for their path point while at home and returners while in enemy territory
+        on_path = np.where(_IS_RETURN[actions], in_enemy_territory, in_home_territory)
+        point_idx = np.where(on_path, point_tables[0][actions], point_tables[1][actions])
+        points = np.array([enemy_flags.positions[flag_idx], home_flags.positions[flag_idx], team.env.centre,
+                           team.env.bottom, team.env.top, (0.0, 0.0)], dtype=float)
+        # Blue attackers out of their territory go for the flag avoiding the defender
+        if (point_idx == _SMART_WAYPOINT).any():
+            points[_SMART_WAYPOINT] = smart_enemy_flag_waypoint(team, enemy_team, enemy_flags, flag_idx)
+        waypoints = points[point_idx]
+
+        tagging = actions == GO_TAG_AGENT
+        waypoints[tagging] = enemy_team.positions[np.asarray(target_idx)[tagging]]
+        return waypoints
+
 
 def go_to_enemy_flag(team, enemy_flags, agent_idx, flag_idx, delta_time):
     """Determine the acceleration commands for an agent to take the direct path to the enemy flag.
@@ -63,6 +156,20 @@ def go_to_enemy_flag_smart(team, enemy_team, enemy_flags, agent_idx, enemy_idx,
     :param delta_time: step time.
     :return:
     """
+    waypoint = smart_enemy_flag_waypoint(team, enemy_team, enemy_flags, flag_idx)
+    return take_direct_path(team.positions[agent_idx], waypoint, team.speed, team.azimuths[agent_idx], delta_time)
+
+
+def smart_enemy_flag_waypoint(team, enemy_team, enemy_flags, flag_idx):
+    """Point that go_to_enemy_flag_smart steers towards. The choice only depends on the team's attacker (agent 1) and
+    the enemy defender (agent 0), so it is the same for every agent of the team.
+
+    :param team:
+    :param enemy_team:
+    :param enemy_flags:
+    :param flag_idx:
+    :return: x, y position to travel to.
+    """
     #variables for ease of control
     enemy_avoidance_radius = 40
 
@@ -74,41 +181,36 @@ def go_to_enemy_flag_smart(team, enemy_team, enemy_flags, agent_idx, enemy_idx,
     defenderTail = enemy_team.positions[0] - enemy_team.velocities[0]*8
 
     #distance between attackers and defenders
-    dist = cdist(team.positions, enemy_team.positions, metric='euclidean')
+    dist = team.env.world_queries.distances(team, enemy_team)
     #attackers and flag
-    distFlags = cdist(team.positions, enemy_flags.positions, metric='euclidean')
+    distFlags = team.env.world_queries.distances(team, enemy_flags)
     #defenders and flag
-    distFlagsE = cdist(enemy_team.positions, enemy_flags.positions, metric='euclidean')
+    distFlagsE = team.env.world_queries.distances(enemy_team, enemy_flags)
 
     ##go for flag when safe
     if distFlags[1][0] < 15 and distFlagsE[0][0] > 15:
         #print("Going for flag")
-        return take_direct_path(team.positions[agent_idx], enemy_flags.positions[flag_idx], team.speed,
-                            team.azimuths[agent_idx], delta_time)
+        return enemy_flags.positions[flag_idx]
 
     ##if enemy defender x-component velocity is strong negative (moving left), swerve attacker.
     elif enemy_team.velocities[0][0] < -0.6 and dist[1][0] < enemy_avoidance_radius:
         if enemy_team.velocities[0][1] < 0:
             #swerves north if enemy y-component is negative
             #print("Swerving North")
-            return take_direct_path(team.positions[agent_idx], enemy_top_flank, team.speed,
-                                team.azimuths[agent_idx], delta_time)
+            return enemy_top_flank
         else:
             #swerves south if enemy y-component is positive
             #print("Swerving South")
-            return take_direct_path(team.positions[agent_idx], enemy_bottom_flank, team.speed,
-                                    team.azimuths[agent_idx], delta_time)
+            return enemy_bottom_flank
 
     ##dist[1][0] should be comparing blue attacker with red defender
     ##dist[1][1] compares blue attacker with red attacker
     elif dist[1][0] < enemy_avoidance_radius:
         #print("Tailing")
-        return take_direct_path(team.positions[agent_idx], defenderTail, team.speed,
-                                team.azimuths[agent_idx], delta_time)
+        return defenderTail
 
     else:
-        return take_direct_path(team.positions[agent_idx], enemy_flags.positions[flag_idx], team.speed,
-                            team.azimuths[agent_idx], delta_time)
+        return enemy_flags.positions[flag_idx]
 
 #difficulty 2
 def go_to_enemy_flag_smarter(team, enemy_team, enemy_flags, agent_idx, enemy_idx, flag_idx, delta_time):
@@ -223,9 +325,9 @@ def go_to_enemy_flag_smartest(team, enemy_team, enemy_flags, agent_idx, enemy_id
     evade_bottom = [80, 5]
 
     # distance between attackers and defenders
-    dist = cdist(team.positions, enemy_team.positions, metric='euclidean')
+    dist = team.env.world_queries.distances(team, enemy_team)
     # attackers and flag
-    distFlags = cdist(team.positions, enemy_flags.positions, metric='euclidean')
+    distFlags = team.env.world_queries.distances(team, enemy_flags)
     #prevents 'zigzagging'
     dist_buffer = 5
 
@@ -311,7 +413,7 @@ def return_smart(team, enemy_team, home_flags, enemy_flags, agent_idx, enemy_idx
     """
 
     if team.color == 'blue':
-        distFlags = cdist(team.positions, enemy_flags.positions, metric='euclidean')
+        distFlags = team.env.world_queries.distances(team, enemy_flags)
 
         if team.env.in_red_territory(team, agent_idx):
             #finds the relative vector from blue attacker to red defender
@@ -350,7 +452,7 @@ def return_smarter(team, enemy_team, home_flags, enemy_flags, agent_idx, enemy_i
     :param delta_time:
     :return:
     """
-    distFlags = cdist(team.positions, enemy_flags.positions, metric='euclidean')
+    distFlags = team.env.world_queries.distances(team, enemy_flags)
 
     #how close to the edges, along middle boundary that the flag capturer escapes to
     #default: 10. Lower values should increase the success rate of escape
@@ -635,18 +737,22 @@ def get_angle_diff(current_position, desired_position, azimuth):
      :param azimuth: heading angle of agent.
      :return: angle between unit vectors.
      """
-    unit_vector_heading = np.array([np.cos(azimuth), np.sin(azimuth)])
+    return get_angle_diff_batch(current_position, desired_position, azimuth)[()]
+
 
-    y_diff = desired_position[1] - current_position[1]
-    x_diff = desired_position[0] - current_position[0]
-    unit_vector_diff = np.array([x_diff, y_diff])
-    unit_vector_diff = unit_vector_diff / np.linalg.norm(unit_vector_diff)
+def get_angle_diff_batch(current_positions, desired_positions, azimuths):
+    """Array form of get_angle_diff for many agent/point pairs at once.
 
-    dot_product = np.dot(unit_vector_heading, unit_vector_diff)
-    dot_product = np.clip(dot_product, -1.0, 1.0)
+    :param current_positions: ndarray (..., 2) of agent positions.
+    :param desired_positions: ndarray (..., 2) of other points.
+    :param azimuths: ndarray (...) of agent azimuths.
+    :return: ndarray (...) of angles between the headings and the lines of sight.
+    """
+    unit_vector_los = _unit_vector_los(current_positions, desired_positions)
+    dot_product = np.cos(azimuths) * unit_vector_los[..., 0] + np.sin(azimuths) * unit_vector_los[..., 1]
+    dot_product = np.minimum(np.maximum(dot_product, -1.0), 1.0)  # np.clip is slow on small arrays
 
-    angle = np.arccos(dot_product)
-    return angle
+    return np.arccos(dot_product)
 
 
 def take_direct_path(current_position, desired_position, speed, azimuth, delta_time):
@@ -660,23 +766,43 @@ def take_direct_path(current_position, desired_position, speed, azimuth, delta_t
     :param delta_time:
     :return:
     """
+    return take_direct_path_batch(current_position, desired_position, speed, azimuth, delta_time)
 
-    unit_vector_heading = np.array([np.cos(azimuth), np.sin(azimuth)])
-    los_y = desired_position[1] - current_position[1]
-    los_x = desired_position[0] - current_position[0]
-    unit_vector_los = np.array([los_x, los_y])
-    unit_vector_los = unit_vector_los / np.linalg.norm(unit_vector_los)
 
-    angle = get_angle_diff(current_position, desired_position, azimuth)
+def take_direct_path_batch(current_positions, desired_positions, speed, azimuths, delta_time):
+    """Array form of take_direct_path for many agents at once.
 
-    lateral_acceleration = angle * speed / delta_time
-    if np.cross(unit_vector_los, unit_vector_heading) < 0:
-        # Turning Left
-        pass
-    else:
-        # Turning Right
-        lateral_acceleration = lateral_acceleration * -1
+    :param current_positions: ndarray (..., 2) of agent positions.
+    :param desired_positions: ndarray (..., 2) of positions to travel to.
+    :param speed: speed of the agents.
+    :param azimuths: ndarray (...) of agent azimuths.
+    :param delta_time: step time.
+    :return: ndarray (..., 2) of acceleration commands.
+    """
+    cos_azimuth = np.cos(azimuths)
+    sin_azimuth = np.sin(azimuths)
+    unit_vector_los = _unit_vector_los(current_positions, desired_positions)
+
+    dot_product = cos_azimuth * unit_vector_los[..., 0] + sin_azimuth * unit_vector_los[..., 1]
+    dot_product = np.minimum(np.maximum(dot_product, -1.0), 1.0)  # np.clip is slow on small arrays
+    lateral_acceleration = np.arccos(dot_product) * speed / delta_time
+
+    # Turn left if the line of sight is to the left of the heading, otherwise turn right
+    cross = unit_vector_los[..., 0] * sin_azimuth - unit_vector_los[..., 1] * cos_azimuth
+    lateral_acceleration = np.where(cross < 0, lateral_acceleration, -lateral_acceleration)
 
-    acceleration_x = lateral_acceleration * -1 * np.sin(azimuth)
-    acceleration_y = lateral_acceleration * np.cos(azimuth)
-    return np.array([acceleration_x, acceleration_y])
\ No newline at end of file
+    acceleration = np.empty(lateral_acceleration.shape + (2,))
+    acceleration[..., 0] = lateral_acceleration * -1 * sin_azimuth
+    acceleration[..., 1] = lateral_acceleration * cos_azimuth
+    return acceleration
+
+
+def _unit_vector_los(current_positions, desired_positions):
+    """Unit vectors along the lines of sight from agents to points.
+
+    :param current_positions: ndarray (..., 2) of agent positions.
+    :param desired_positions: ndarray (..., 2) of points.
+    :return: ndarray (..., 2) of unit vectors.
+    """
+    los = np.subtract(desired_positions, current_positions)
+    return los / np.sqrt(los[..., 0] * los[..., 0] + los[..., 1] * los[..., 1])[..., None]
@@ -0,0 +1,122 @@
+"""
+capture_the_flag
+This file turns the high level actions into options that run for many time steps until they terminate.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import numpy as np
+from actions.high_level_actions import GO_TO_ENEMY_FLAG, GO_TO_BASE, WAIT_AT_ENEMY_FLAG, GO_TAG_AGENT, \
+    ATTACK_CENTRE, ATTACK_BOTTOM, ATTACK_TOP, RETURN_CENTRE, RETURN_BOTTOM, RETURN_TOP
+
+# Conditions that end an option (columns of _TERMINATES)
+REACHED, FLAG_CHANGED, CROSSED_TO_ENEMY, CROSSED_HOME, TARGET_DONE = range(5)
+_ATTACKS = [ATTACK_CENTRE, ATTACK_BOTTOM, ATTACK_TOP]
+_RETURNS = [RETURN_CENTRE, RETURN_BOTTOM, RETURN_TOP]
+
+# Which conditions end each high level action (rows). Every option also ends when its agent's tagged status changes
+# or after max_duration steps.
+_TERMINATES = np.zeros((10, 5), bool)
+_TERMINATES[GO_TO_ENEMY_FLAG, [REACHED, FLAG_CHANGED]] = True
+_TERMINATES[GO_TO_BASE, [REACHED, FLAG_CHANGED]] = True
+_TERMINATES[WAIT_AT_ENEMY_FLAG, FLAG_CHANGED] = True
+_TERMINATES[GO_TAG_AGENT, TARGET_DONE] = True
+_TERMINATES[np.ix_(_ATTACKS, [REACHED, FLAG_CHANGED, CROSSED_TO_ENEMY])] = True
+_TERMINATES[np.ix_(_RETURNS, [REACHED, FLAG_CHANGED, CROSSED_HOME])] = True
+
+
+class OptionSet:
+    def __init__(self, action_set, n_agents, max_duration=50, arrival_radius=None):
+        """The options of a team's agents. Each agent follows its high level action (see HighLevelActionSet) until
+        the action's termination condition holds:
+
+        go_to_enemy_flag, go_to_base: the waypoint is reached or the agent picks up/loses the flag.
+        wait_at_enemy_flag: the agent picks up the flag.
+        go_tag_agent: the target is tagged, dead or back in its own territory.
+        attack_*: the agent crosses into enemy territory, reaches its waypoint or picks up the flag.
+        return_*: the agent crosses into home territory, reaches its waypoint or loses the flag.
+
+        :param action_set: HighLevelActionSet of the team.
+        :param n_agents: number of agents in the team.
+        :param max_duration: number of steps after which any option ends.
+        :param arrival_radius: distance within which a waypoint is reached (None uses the flag capture distance).
+        """
+        self.action_set = action_set
+        self.max_duration = max_duration
+        self.arrival_radius = arrival_radius
+        self.options = np.zeros(n_agents, dtype=np.int64)
+        self.durations = np.zeros(n_agents, dtype=np.int64)
+        self.start_has_flag = np.zeros(n_agents, bool)
+        self.start_is_tagged = np.zeros(n_agents, bool)
+        self.start_in_home = np.zeros(n_agents, bool)
+        self.start_in_enemy = np.zeros(n_agents, bool)
+        self.conditions = np.zeros((n_agents, 5), bool)
+
+    def _territories(self, team):
+        """Masks of the agents in home and in enemy territory.
+
+        :param team: Agents object.
+        :return: tuple (in home territory, in enemy territory).
+        """
+        world_queries = team.env.world_queries
+        if team.color == 'red':
+            return world_queries.in_red_territory(team), world_queries.in_blue_territory(team)
+        elif team.color == 'blue':
+            return world_queries.in_blue_territory(team), world_queries.in_red_territory(team)
+        else:
+            raise Exception("Invalid Team")
+
+    def start(self, mask, actions, team):
+        """Start new options.
+
+        :param mask: bool array (team.n,) of the agents starting an option.
+        :param actions: int array (team.n,) of high level actions (only read where mask is set).
+        :param team: Agents object.
+        :return: None.
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        if ((actions[mask] < 0) | (actions[mask] >= len(self.action_set.action_set))).any():
+            raise Exception("Invalid high level action")
+        in_home, in_enemy = self._territories(team)
+        self.options[mask] = actions[mask]
+        self.durations[mask] = 0
+        self.start_has_flag[mask] = team.has_flag[mask] != 0
+        self.start_is_tagged[mask] = team.is_tagged[mask] != 0
+        self.start_in_home[mask] = in_home[mask]
+        self.start_in_enemy[mask] = in_enemy[mask]
+
+    def step(self, team, enemy_team, home_flags, enemy_flags, target_idx, flag_idx=0):
+        """Count a step of the options and check which ended. This is called after the environment has been updated.
+
+        :param team: Agents object.
+        :param enemy_team: Agents object of the enemy.
+        :param home_flags: the team's Flags object.
+        :param enemy_flags: the enemy's Flags object.
+        :param target_idx: int array (team.n,) of the enemy each agent tags with go_tag_agent.
+        :param flag_idx: which flag to attack/return to.
+        :return: bool array (team.n,) of the agents whose option ended.
+        """
+        self.durations += 1
+        in_home, in_enemy = self._territories(team)
+        waypoints = self.action_set.get_waypoints(self.options, team, enemy_team, home_flags, enemy_flags,
+                                                  target_idx, flag_idx)
+        arrival_radius = home_flags.capture_distance if self.arrival_radius is None else self.arrival_radius
+        targets = np.asarray(target_idx)
+        enemy_in_own_territory, _ = self._territories(enemy_team)
+
+        conditions = self.conditions
+        conditions[:, REACHED] = np.hypot(*(team.positions - waypoints).T) < arrival_radius
+        conditions[:, FLAG_CHANGED] = (team.has_flag != 0) != self.start_has_flag
+        conditions[:, CROSSED_TO_ENEMY] = in_enemy & ~self.start_in_enemy
+        conditions[:, CROSSED_HOME] = in_home & ~self.start_in_home
+        conditions[:, TARGET_DONE] = ((enemy_team.is_tagged[targets] != 0) | (enemy_team.alive[targets] == 0) |
+                                      enemy_in_own_territory[targets])
+
+        ended = (_TERMINATES[self.options] & conditions).any(axis=1)
+        ended |= (team.is_tagged != 0) != self.start_is_tagged
+        ended |= self.durations >= self.max_duration
+        return ended
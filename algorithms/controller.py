@@ -21,12 +21,18 @@ from environment.reinforcement_learning_training_interface import ReinforcementL
 
 
 class Controller:
-    def __init__(self, goal, team, sensor, action_set, controller_type, trainable=False):
+    # Attributes that carry decisions from one time step to the next (saved by SnapshotRingBuffer)
+    memory_fields = ('last_action', 'target_idx', 'dones')
+
+    def __init__(self, goal, team, sensor, action_set, controller_type, trainable=False, model_config=None):
         """Controller that works out the acceleration commands to apply to the agents.
 
         :param goal: what is each agent trying to do.
         :param team: which team is being controlled
         :param sensor: what is the view of the environment.
+        :param model_config: keyword arguments of the model (for 'nn' the arguments of TorchPolicy other than
+        action_space, e.g. {"model_path": "red_policy.pt", "n_threads": 1}, for 'remote' the arguments of
+        RemotePolicy, e.g. {"socket_path": "/tmp/red_policy.sock"}).
         """
 
         self.goal = goal
@@ -39,9 +45,12 @@ class Controller:
         self.n_agents = team.n
         self.target_idx = np.zeros(self.n_agents, np.int)
         self.dones = np.zeros(self.n_agents, np.int)
-        self.last_action = ["None"] * self.n_agents
+        self.last_action = np.zeros(self.n_agents, np.int64)  # state code of the last action (0 is none)
         self.doing_joint_actions = False
 
+        # Random number generator for stochastic decisions (the environment replaces it when seeded)
+        self.rng = np.random.default_rng()
+
         if action_set == 'discrete':
             self.action_set = DiscreteActionSet(self.team.acceleration_limit)
             self.action_space = self.action_set.action_space
@@ -67,6 +76,16 @@ class Controller:
         if controller_type == 'custom':
             self.model = None
             self.is_reinforcement_learning = False
+        elif controller_type == 'nn':
+            # torch is only needed by teams that use a neural network
+            from algorithms.torch_policy import TorchPolicy
+            self.model = TorchPolicy(action_space=self.action_space, **(model_config or {}))
+            self.is_reinforcement_learning = True
+        elif controller_type == 'remote':
+            # The policy is held by an inference server shared with other processes
+            from algorithms.inference_server import RemotePolicy
+            self.model = RemotePolicy(action_space=self.action_space, **(model_config or {}))
+            self.is_reinforcement_learning = True
         else:
             raise Exception("Invalid control method")
 
@@ -90,7 +109,7 @@ class Controller:
         """
         if self.model is not None:
             self.model.reset()
-        self.last_action = ["None"] * self.n_agents
+        self.last_action[:] = 0
 
     def train(self, epochs):
         if self.training_env is not None:
@@ -132,6 +151,10 @@ class Controller:
             else:
                 raise Exception("Model not specified")
         self.actions = None
+        if isinstance(self.action_set, HighLevelActionSet):
+            return self.action_set.get_accelerations(actions, self.sensor.team, self.sensor.enemy_team,
+                                                     self.sensor.team_flags, self.sensor.enemy_flags, self.target_idx,
+                                                     self.sensor.env.delta_time)
         lateral_accelerations = self.action_set.get_lateral_acceleration(actions)
 
         for idx in range(self.n_agents):
@@ -0,0 +1,367 @@
+"""
+capture_the_flag
+This file runs the custom controllers' decision tables as policies of the batched environment.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import numpy as np
+import actions.high_level_actions as hla
+from actions.high_level_actions import take_direct_path_batch, get_angle_diff_batch
+from guidance_laws.proportional_navigation import proportional_navigation_batch
+from utils.utils import sample_categorical
+from algorithms.custom import compiled_policies
+from algorithms.custom.compiled_policies import INVALID, NO_ACTION, RETURN_SMART, RETURN_SMARTER, \
+    GO_TO_ENEMY_FLAG_SMARTER, GO_TO_ENEMY_FLAG_SMARTEST
+
+# Rows of the points array of high_level_waypoints: the waypoint tables of HighLevelActionSet.get_waypoints followed
+# by the fixed points of the smart behaviours
+_ENEMY_FLAG, _HOME_FLAG, _CENTRE, _BOTTOM, _TOP, _SMART_WAYPOINT = range(6)
+_FIXED_POINTS = {"smarter_top_flank": [130, 70], "smarter_bottom_flank": [130, 10],
+                 "smartest_top_wait": [70, 70], "smartest_bottom_wait": [70, 10],
+                 "smartest_top_flank": [130, 65], "smartest_bottom_flank": [130, 15],
+                 "evade_top": [80, 75], "evade_bottom": [80, 5],
+                 "retreat_bottom": [140, 10], "retreat_top": [140, 70],
+                 "escape_south": [80, 1], "escape_north": [80, 79]}
+
+
+def _lane_points(points, shape):
+    """Broadcast points to every agent of every game.
+
+    :param points: ndarray (2,), (n_envs, 2) or (n_envs, n, 2).
+    :param shape: (n_envs, n).
+    :return: ndarray (n_envs, n, 2).
+    """
+    points = np.asarray(points, dtype=float)
+    if points.ndim == 2:
+        points = points[:, None, :]
+    return np.broadcast_to(points, shape + (2,))
+
+
+def _select(conditions, choices, default):
+    """np.select for points: the first condition that holds gives the point.
+
+    :param conditions: list of bool ndarrays (n_envs, n).
+    :param choices: list of points, one per game or per agent (see _lane_points).
+    :param default: point where no condition holds.
+    :return: ndarray (n_envs, n, 2).
+    """
+    shape = np.shape(conditions[0])
+    result = np.array(_lane_points(default, shape))
+    for condition, choice in zip(reversed(conditions), reversed(choices)):
+        result = np.where(condition[..., None], _lane_points(choice, shape), result)
+    return result
+
+
+def smart_enemy_flag_waypoints(batched_env, team, enemy_team, enemy_flags):
+    """Array form of high_level_actions.smart_enemy_flag_waypoint (one point per game).
+
+    :param batched_env: BatchedGameEnvironment.
+    :param team: BatchedTeam.
+    :param enemy_team: BatchedTeam of the enemy.
+    :param enemy_flags: BatchedFlags of the enemy.
+    :return: ndarray (n_envs, 2).
+    """
+    enemy_avoidance_radius = 40
+    flag = enemy_flags.positions[:, 0]
+    defender = enemy_team.positions[:, 0]
+    defender_velocity = enemy_team.velocities[:, 0]
+    attacker_to_defender = np.linalg.norm(team.positions[:, 1] - defender, axis=-1)
+    attacker_to_flag = np.linalg.norm(team.positions[:, 1] - flag, axis=-1)
+    defender_to_flag = np.linalg.norm(defender - flag, axis=-1)
+
+    swerve = np.where((defender_velocity[:, 1] < 0)[:, None], [100.0, 70.0], [100.0, 10.0])
+    conditions = [(attacker_to_flag < 15) & (defender_to_flag > 15),
+                  (defender_velocity[:, 0] < -0.6) & (attacker_to_defender < enemy_avoidance_radius),
+                  attacker_to_defender < enemy_avoidance_radius]
+    choices = [flag, swerve, defender - defender_velocity * 8]
+    return _select([condition[:, None] for condition in conditions], choices, flag)[:, 0]
+
+
+def _smart_waypoints(batched_env, team, enemy_team, home_flags, enemy_flags, actions):
+    """Waypoints of the blue smart behaviours (compiled_policies.RETURN_SMART, ...), which depend on the fixed roles
+    of agents 0 and 1. Every one of them takes the direct path to its waypoint, so they are run as waypoints.
+
+    :param batched_env: BatchedGameEnvironment.
+    :param team: BatchedTeam (blue).
+    :param enemy_team: BatchedTeam of the enemy.
+    :param home_flags: BatchedFlags of the team.
+    :param enemy_flags: BatchedFlags of the enemy.
+    :param actions: int ndarray (n_envs, n) of action codes.
+    :return: ndarray (n_envs, n, 2) of waypoints (only meaningful where actions is a smart behaviour).
+    """
+    positions = team.positions
+    agent_idx = np.arange(team.n)
+    is_zero = agent_idx == 0
+    is_one = agent_idx == 1
+    home_flag = home_flags.positions[:, 0]
+    flag = enemy_flags.positions[:, 0]
+    defender = enemy_team.positions[:, 0]
+    in_home = batched_env.in_blue_territory(positions)
+    in_enemy = batched_env.in_red_territory(positions)
+    to_flag = np.linalg.norm(positions - flag[:, None], axis=-1)
+    to_defender = np.linalg.norm(positions - defender[:, None], axis=-1)
+    points = _FIXED_POINTS
+    waypoints = np.empty(positions.shape)
+
+    # go_to_enemy_flag_smarter: agent 0 is a distraction on the side away from the flag, agent 1 goes for the flag
+    smarter = actions == GO_TO_ENEMY_FLAG_SMARTER
+    if smarter.any():
+        flag_low = (flag[:, 1] < 40)[:, None]
+        zero_flank = np.where(flag_low, points["smarter_top_flank"], points["smarter_bottom_flank"])
+        zero_mid = np.where(flag_low, batched_env.top, batched_env.bottom)
+        in_home_point = _select([in_home & is_zero, in_home & is_one, in_home], [zero_mid, flag, batched_env.centre],
+                                flag)
+        point = _select([in_home, positions[..., 0] > 130, is_zero[None, :]],
+                        [in_home_point, flag, zero_flank], flag)
+        waypoints[smarter] = point[smarter]
+
+    # go_to_enemy_flag_smartest: the two attackers stay level with each other and evade the defender
+    smartest = actions == GO_TO_ENEMY_FLAG_SMARTEST
+    if smartest.any():
+        zero_ahead = (to_flag[:, 0] < to_flag[:, 1] - 5)[:, None]
+        one_ahead = (to_flag[:, 1] < to_flag[:, 0] - 5)[:, None]
+        south = (positions[..., 1] < defender[:, None, 1])[..., None]
+        evade_point = np.where(south, points["evade_bottom"], points["evade_top"])
+        in_home_point = _select([is_zero & zero_ahead, is_zero, is_one & one_ahead, is_one],
+                                [points["smartest_top_wait"], batched_env.top, points["smartest_bottom_wait"],
+                                 batched_env.bottom], batched_env.centre)
+        closer_than_other = np.stack([to_flag[:, 0] < to_flag[:, 1], to_flag[:, 1] < to_flag[:, 0]], axis=1)
+        evading = (to_defender[:, :2] < 41) & closer_than_other
+        flank_point = np.array(_lane_points(flag, in_home.shape))
+        flank_point[:, 0] = np.where(evading[:, 0, None], evade_point[:, 0], points["smartest_top_flank"])
+        if team.n > 1:
+            flank_point[:, 1] = np.where(evading[:, 1, None], evade_point[:, 1], points["smartest_bottom_flank"])
+        go_for_flag = (positions[..., 0] > 130) | team.is_tagged[:, :2].any(axis=1)[:, None]
+        point = _select([in_home, go_for_flag], [in_home_point, flag], flank_point)
+        waypoints[smartest] = point[smartest]
+
+    # return_smart: agent 1 leaves the flag away from the defender
+    returning = actions == RETURN_SMART
+    if returning.any():
+        near_flag = (to_flag[:, 1] < 10)[:, None]
+        defender_above = ((defender[:, 1] - positions[:, 1, 1]) > 0)[:, None]
+        point = _select([in_enemy & near_flag & defender_above, in_enemy & near_flag],
+                        [points["retreat_bottom"], points["retreat_top"]], home_flag)
+        waypoints[returning] = point[returning]
+
+    # return_smarter: escape along the middle boundary away from the defender
+    returning = actions == RETURN_SMARTER
+    if returning.any():
+        defender_y = defender[:, None, 1]
+        point = _select([in_enemy & (defender_y > positions[..., 1]), in_enemy & (defender_y < positions[..., 1])],
+                        [points["escape_south"], points["escape_north"]], home_flag)
+        waypoints[returning] = point[returning]
+    return waypoints
+
+
+def high_level_waypoints(batched_env, team, enemy_team, home_flags, enemy_flags, actions, targets):
+    """Array form of HighLevelActionSet.get_waypoints over the games of a batch, extended with the smart behaviours
+    of the blue custom controller.
+
+    :param batched_env: BatchedGameEnvironment.
+    :param team: BatchedTeam.
+    :param enemy_team: BatchedTeam of the enemy.
+    :param home_flags: BatchedFlags of the team.
+    :param enemy_flags: BatchedFlags of the enemy.
+    :param actions: int ndarray (n_envs, n) of high level action codes or smart behaviours.
+    :param targets: int ndarray (n_envs, n) of the enemy each go_tag_agent agent tags.
+    :return: ndarray (n_envs, n, 2) of waypoints.
+    """
+    smart = actions >= RETURN_SMART
+    table_actions = np.where(smart, hla.GO_TO_BASE, actions)
+    if (table_actions < 0).any():
+        raise Exception("Invalid high level action")
+
+    if team.color == 'red':
+        in_home = batched_env.in_red_territory(team.positions)
+        in_enemy = batched_env.in_blue_territory(team.positions)
+        point_tables = hla._RED_WAYPOINT_TABLES
+    elif team.color == 'blue':
+        in_home = batched_env.in_blue_territory(team.positions)
+        in_enemy = batched_env.in_red_territory(team.positions)
+        point_tables = hla._BLUE_WAYPOINT_TABLES
+    else:
+        raise Exception("Invalid Team")
+
+    # Attackers head for their path point while at home and returners while in enemy territory
+    on_path = np.where(hla._IS_RETURN[table_actions], in_enemy, in_home)
+    point_idx = np.where(on_path, point_tables[0][table_actions], point_tables[1][table_actions])
+    n_envs = batched_env.n_envs
+    points = np.empty((n_envs, 6, 2))
+    points[:, _ENEMY_FLAG] = enemy_flags.positions[:, 0]
+    points[:, _HOME_FLAG] = home_flags.positions[:, 0]
+    points[:, _CENTRE] = batched_env.centre
+    points[:, _BOTTOM] = batched_env.bottom
+    points[:, _TOP] = batched_env.top
+    points[:, _SMART_WAYPOINT] = 0.0
+    if (point_idx == _SMART_WAYPOINT).any():
+        points[:, _SMART_WAYPOINT] = smart_enemy_flag_waypoints(batched_env, team, enemy_team, enemy_flags)
+    waypoints = points[np.arange(n_envs)[:, None], point_idx]
+
+    tagging = table_actions == hla.GO_TAG_AGENT
+    if tagging.any():
+        lanes = np.nonzero(tagging)[0]
+        waypoints[tagging] = enemy_team.positions[lanes, targets[tagging]]
+    if smart.any():
+        waypoints[smart] = _smart_waypoints(batched_env, team, enemy_team, home_flags, enemy_flags, actions)[smart]
+    return waypoints
+
+
+def high_level_accelerations(batched_env, team, enemy_team, home_flags, enemy_flags, actions, targets):
+    """Array form of HighLevelActionSet.get_accelerations (and of compiled_policies.get_accelerations) over the games
+    of a batch: every agent takes the direct path to its waypoint and taggers facing their target use proportional
+    navigation.
+
+    :param batched_env: BatchedGameEnvironment.
+    :param team: BatchedTeam.
+    :param enemy_team: BatchedTeam of the enemy.
+    :param home_flags: BatchedFlags of the team.
+    :param enemy_flags: BatchedFlags of the enemy.
+    :param actions: int ndarray (n_envs, n) of high level action codes or smart behaviours.
+    :param targets: int ndarray (n_envs, n) of the enemy each go_tag_agent agent tags.
+    :return: ndarray (n_envs, n, 2) of acceleration commands.
+    """
+    actions = np.asarray(actions, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    if (actions == INVALID).any():
+        raise Exception("Invalid action")
+    tagging = actions == hla.GO_TAG_AGENT
+    if (targets[tagging] < 0).any():
+        raise Exception("No enemy to tag")
+
+    waypoints = high_level_waypoints(batched_env, team, enemy_team, home_flags, enemy_flags, actions, targets)
+    acceleration = take_direct_path_batch(team.positions, waypoints, team.speed, team.azimuths,
+                                          batched_env.delta_time)
+    if tagging.any():
+        lanes, agents = np.nonzero(tagging)
+        facing = get_angle_diff_batch(team.positions[lanes, agents], waypoints[lanes, agents],
+                                      team.azimuths[lanes, agents]) < np.pi / 2
+        lanes, agents = lanes[facing], agents[facing]
+        enemies = targets[lanes, agents]
+        acceleration[lanes, agents] = proportional_navigation_batch(
+            team.positions[lanes, agents], team.velocities[lanes, agents], enemy_team.positions[lanes, enemies],
+            enemy_team.velocities[lanes, enemies])
+    return acceleration
+
+
+def remove_tagged_enemies_batch(in_territory, enemy_is_tagged):
+    """Array form of compiled_policies.remove_tagged_enemies over the games of a batch, for enemies listed in index
+    order. The enemy after a removed one is not checked, as in the original.
+
+    :param in_territory: bool ndarray (n_envs, m) of the enemies in territory.
+    :param enemy_is_tagged: bool ndarray (n_envs, m).
+    :return: tuple (remaining, n_removed, first remaining after the last removal that left any, or INVALID), the
+    first a bool ndarray (n_envs, m) and the others int ndarrays (n_envs,).
+    """
+    remaining = np.array(in_territory, bool)
+    skip = np.zeros(len(remaining), bool)
+    after_removal = np.full(len(remaining), INVALID)
+    for enemy in range(remaining.shape[1]):
+        present = in_territory[:, enemy]
+        removed = present & ~skip & enemy_is_tagged[:, enemy]
+        skip = np.where(present, removed, skip)
+        if removed.any():
+            remaining[removed, enemy] = False
+            first = _first(remaining)
+            after_removal = np.where(removed & (first != INVALID), first, after_removal)
+    return remaining, (in_territory & ~remaining).sum(axis=1), after_removal
+
+
+def _first(mask):
+    """Index of the first True of each row.
+
+    :param mask: bool ndarray (n_envs, m).
+    :return: int ndarray (n_envs,), INVALID where a row has none.
+    """
+    return np.where(mask.any(axis=1), mask.argmax(axis=1), INVALID)
+
+
+class BatchedCustomPolicy:
+    def __init__(self, batched_env, color):
+        """Policy of the batched environment that plays like the custom controllers (CustomControllerR for red and
+        CustomControllerB for blue): the decision tables of compiled_policies are evaluated for every game at once and
+        the actions are steered with high_level_accelerations. Route picks are drawn from batched_env.rng, so games
+        follow the same distribution as the scalar controllers but not the same random draws.
+
+        The policy keeps the controllers' states (last_action) per game. They are reset in games at time step 0 and
+        only updated in games where the team makes a decision.
+
+        :param batched_env: BatchedGameEnvironment the policy plays in.
+        :param color: red or blue.
+        """
+        if color not in ('red', 'blue'):
+            raise Exception("Invalid Team")
+        self.color = color
+        n = batched_env.red_team.n if color == 'red' else batched_env.blue_team.n
+        self.last_action = np.full((batched_env.n_envs, n), NO_ACTION, np.int64)
+
+    def __call__(self, batched_env, team):
+        """Acceleration commands of the team in every game.
+
+        :param batched_env: BatchedGameEnvironment.
+        :param team: BatchedTeam of the policy's color.
+        :return: ndarray (n_envs, team.n, 2).
+        """
+        if team.color != self.color:
+            raise Exception("Policy is for the " + self.color + " team")
+        if self.color == 'red':
+            enemy_team, home_flags, enemy_flags = batched_env.blue_team, batched_env.red_flags, batched_env.blue_flags
+            team_time_step = batched_env.red_time_step
+        else:
+            enemy_team, home_flags, enemy_flags = batched_env.red_team, batched_env.blue_flags, batched_env.red_flags
+            team_time_step = batched_env.blue_time_step
+        self.last_action[batched_env.time_step == 0] = NO_ACTION
+
+        if self.color == 'red':
+            actions, targets, states = self._red_decisions(batched_env, team, enemy_team, home_flags, enemy_flags)
+        else:
+            actions, targets, states = self._blue_decisions(batched_env, team, enemy_team, enemy_flags)
+        decide = batched_env.time_step % team_time_step == 0
+        np.copyto(self.last_action, states, where=decide[:, None])
+        return high_level_accelerations(batched_env, team, enemy_team, home_flags, enemy_flags, actions, targets)
+
+    def _red_decisions(self, batched_env, team, enemy_team, home_flags, enemy_flags):
+        """Inputs of compiled_policies.red_decisions for every game (see CustomControllerR.get_acceleration).
+
+        :return: tuple (actions, targets, states).
+        """
+        n_envs = batched_env.n_envs
+        route_uniforms = batched_env.rng.random((n_envs, team.n))
+        routes_2 = sample_categorical(batched_env.rng, [1 / 2] * 2, uniforms=route_uniforms)
+        routes_3 = sample_categorical(batched_env.rng, [1 / 3] * 3, uniforms=route_uniforms)
+
+        threats, _, after_removal = remove_tagged_enemies_batch(batched_env.in_red_territory(enemy_team.positions),
+                                                                enemy_team.is_tagged)
+        to_flag = np.linalg.norm(enemy_team.positions - home_flags.positions[:, :1], axis=-1)
+        closest_threat = np.where(to_flag.min(axis=1) < 10000, to_flag.argmin(axis=1), INVALID)
+        heights = enemy_team.positions[..., 1]
+        top_threat = np.where(heights.max(axis=1) > 0, heights.argmax(axis=1), INVALID)
+        bottom_threat = np.where(heights.min(axis=1) < 1000, heights.argmin(axis=1), INVALID)
+        override = after_removal != INVALID
+        closest_threat, top_threat, bottom_threat = (np.where(override, after_removal, threat)
+                                                     for threat in (closest_threat, top_threat, bottom_threat))
+        holders = enemy_team.has_flag
+        flag_holder = np.where(holders.any(axis=1), enemy_team.n - 1 - holders[:, ::-1].argmax(axis=1), 0)
+
+        return compiled_policies.red_decisions(
+            batched_env.difficulty, team.is_tagged, team.has_flag, self.last_action, enemy_flags.is_captured[:, 0],
+            home_flags.is_captured[:, 0], routes_2, routes_3, threats.sum(axis=1), _first(threats), closest_threat,
+            top_threat, bottom_threat, flag_holder)
+
+    def _blue_decisions(self, batched_env, team, enemy_team, enemy_flags):
+        """Inputs of compiled_policies.blue_decisions for every game (see CustomControllerB.get_acceleration).
+
+        :return: tuple (actions, targets, states).
+        """
+        routes = sample_categorical(batched_env.rng, [1 / 3] * 3, size=(batched_env.n_envs, team.n))
+        threats, tagged_threats, _ = remove_tagged_enemies_batch(
+            batched_env.in_blue_territory(enemy_team.positions), enemy_team.is_tagged)
+        return compiled_policies.blue_decisions(
+            batched_env.difficulty, team.is_tagged, team.has_flag, self.last_action,
+            batched_env.in_blue_territory(team.positions), enemy_flags.is_captured[:, 0], tagged_threats,
+            threats.sum(axis=1), _first(threats), routes)
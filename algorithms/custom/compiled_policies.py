@@ -0,0 +1,249 @@
+"""
+capture_the_flag
+This file defines the decision logic of the custom controllers as tables over integer coded states and actions.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import numpy as np
+import actions.high_level_actions as hla
+
+# What an agent did last (Controller.last_action). The attack and return states are the route an agent has committed
+# to, which it keeps until it changes mode.
+NO_ACTION, TAGGED, WAIT, GO_TAG, ATTACK_TOP, ATTACK_BOTTOM, ATTACK_CENTRE, RETURN_TOP, RETURN_BOTTOM, \
+    RETURN_CENTRE = range(10)
+STATE_NAMES = ("None", "tagged", "wait", "go_tag", "attack_top", "attack_bottom", "attack_centre", "return_top",
+               "return_bottom", "return_centre")
+
+# Routes picked at random (indexed by a categorical draw)
+ATTACK_ROUTES = np.array([ATTACK_TOP, ATTACK_BOTTOM, ATTACK_CENTRE])
+ATTACK_FLANK_ROUTES = np.array([ATTACK_TOP, ATTACK_BOTTOM])
+RETURN_ROUTES = np.array([RETURN_TOP, RETURN_BOTTOM, RETURN_CENTRE])
+
+# Behaviours that are not in the high level action set. They depend on fixed agent indices so they are run per agent.
+RETURN_SMART, RETURN_SMARTER, GO_TO_ENEMY_FLAG_SMARTER, GO_TO_ENEMY_FLAG_SMARTEST = range(10, 14)
+INVALID = -1
+
+# Below this team size the per call overhead of the tables is more than walking the decision tree per agent
+MIN_AGENTS = 8
+
+# High level action taken on each route state (indexed by state). Red follows the bottom path when it picks the
+# centre route.
+RED_ROUTE_ACTIONS = np.full(len(STATE_NAMES), INVALID)
+RED_ROUTE_ACTIONS[[ATTACK_TOP, ATTACK_BOTTOM, ATTACK_CENTRE, RETURN_TOP, RETURN_BOTTOM, RETURN_CENTRE]] = \
+    [hla.ATTACK_TOP, hla.ATTACK_BOTTOM, hla.ATTACK_BOTTOM, hla.RETURN_TOP, hla.RETURN_BOTTOM, hla.RETURN_CENTRE]
+BLUE_ROUTE_ACTIONS = np.full(len(STATE_NAMES), INVALID)
+BLUE_ROUTE_ACTIONS[[ATTACK_TOP, ATTACK_BOTTOM, ATTACK_CENTRE]] = [hla.ATTACK_TOP, hla.ATTACK_BOTTOM, hla.ATTACK_CENTRE]
+
+
+def _membership(states):
+    """Lookup table of which states are in a set of states.
+
+    :param states: the set of states.
+    :return: bool ndarray indexed by state.
+    """
+    table = np.zeros(len(STATE_NAMES), bool)
+    table[states] = True
+    return table
+
+
+IS_ATTACK_ROUTE = _membership(ATTACK_ROUTES)
+IS_ATTACK_FLANK_ROUTE = _membership(ATTACK_FLANK_ROUTES)
+IS_RETURN_ROUTE = _membership(RETURN_ROUTES)
+
+
+def remove_tagged_enemies(enemies, enemy_is_tagged):
+    """Removes the tagged enemies from a list of enemies the way the custom controllers always have: the list is
+    changed while it is iterated over, so the enemy after a removed one is never checked.
+
+    :param enemies: list of enemy indices.
+    :param enemy_is_tagged: is_tagged array of the enemy team.
+    :return: tuple (remaining enemies, removed enemies, remaining enemies after each removal).
+    """
+    remaining = list(enemies)
+    removed = []
+    after_removal = []
+    for enemy in remaining:
+        if enemy_is_tagged[enemy]:
+            remaining.remove(enemy)
+            removed.append(enemy)
+            after_removal.append(list(remaining))
+    return remaining, removed, after_removal
+
+
+def _evaluate(rules, default):
+    """Evaluates an ordered rule table. For every agent the first rule whose condition holds gives its columns.
+
+    :param rules: list of (boolean mask, column values...) rows in priority order.
+    :param default: column values used where no rule holds.
+    :return: tuple of ndarrays, one per column.
+    """
+    columns = default
+    for rule in reversed(rules):
+        columns = [np.where(rule[0], value, column) for value, column in zip(rule[1:], columns)]
+    return tuple(columns)
+
+
+def _keep_route(last_action, routes, is_route, picks):
+    """The route of each agent: the one it committed to if it is one of routes, otherwise a new random pick.
+
+    :param last_action: int array (..., n) of states.
+    :param routes: route states to choose from.
+    :param is_route: membership table of routes (see _membership).
+    :param picks: int array (..., n) of indices into routes.
+    :return: int array (..., n) of route states.
+    """
+    return np.where(is_route[last_action], last_action, routes[picks])
+
+
+def red_decisions(difficulty, is_tagged, has_flag, last_action, enemy_flag_captured, team_flag_captured, routes_2,
+                  routes_3, n_threats, first_threat, closest_threat, top_threat, bottom_threat, flag_holder):
+    """Decision table of CustomControllerR. Every argument can have leading batch dimensions (one per game); per agent
+    arrays have shape (..., n) and per team values have shape (...).
+
+    Agent 0 defends (every agent at difficulty 5). It waits at the flag unless difficulty > 1 and an enemy is in the
+    territory, in which case it tags the first enemy in territory (difficulty 2), the enemy closest to the flag
+    (difficulty 3 and 4) or at difficulty 5 agents 0 and 1 tag the top and bottom enemies. The other agents attack
+    along a random route, return along a random route when they hold the flag, wait at the enemy flag while a team
+    mate holds it and at difficulty 4 chase the enemy holding their flag.
+
+    :param difficulty: difficulty level (1 to 5).
+    :param is_tagged: bool array (..., n).
+    :param has_flag: bool array (..., n).
+    :param last_action: int array (..., n) of states.
+    :param enemy_flag_captured: is the enemy flag held by the team.
+    :param team_flag_captured: is the team flag held by the enemy.
+    :param routes_2: int array (..., n) of picks between the two flank routes.
+    :param routes_3: int array (..., n) of picks between the three routes.
+    :param n_threats: number of untagged enemies in territory (see remove_tagged_enemies).
+    :param first_threat: first untagged enemy in territory.
+    :param closest_threat: enemy the defenders tag at difficulty 3 and 4.
+    :param top_threat: enemy agent 0 tags at difficulty 5.
+    :param bottom_threat: enemy agent 1 tags at difficulty 5.
+    :param flag_holder: enemy holding the team flag.
+    :return: tuple (high level action codes, tag targets, new states), int arrays (..., n).
+    """
+    is_tagged = np.asarray(is_tagged, bool)
+    has_flag = np.asarray(has_flag, bool)
+    agent_idx = np.arange(is_tagged.shape[-1])
+    difficulty = np.asarray(difficulty)[..., None]
+    enemy_flag_captured = np.asarray(enemy_flag_captured, bool)[..., None]
+    team_flag_captured = np.asarray(team_flag_captured, bool)[..., None]
+    n_threats, first_threat, closest_threat, top_threat, bottom_threat, flag_holder = (
+        np.asarray(value)[..., None] for value in (n_threats, first_threat, closest_threat, top_threat,
+                                                   bottom_threat, flag_holder))
+
+    defending = (agent_idx == 0) | (difficulty == 5)
+    waiting = (difficulty <= 1) | (n_threats == 0)
+    return_route = _keep_route(last_action, RETURN_ROUTES, IS_RETURN_ROUTE, routes_3)
+    flank_route = _keep_route(last_action, ATTACK_FLANK_ROUTES, IS_ATTACK_FLANK_ROUTE, routes_2)
+    attack_route = _keep_route(last_action, ATTACK_ROUTES, IS_ATTACK_ROUTE, routes_3)
+
+    defender_target, = _evaluate([(difficulty == 2, first_threat),
+                                  ((difficulty == 5) & (agent_idx == 0), top_threat),
+                                  ((difficulty == 5) & (agent_idx == 1), bottom_threat)], (closest_threat,))
+
+    # (condition, action, target, state) in priority order
+    rules = [(is_tagged, hla.GO_TO_BASE, INVALID, TAGGED),
+             (defending & waiting, hla.GO_TO_BASE, INVALID, WAIT),
+             (defending & (difficulty == 2), hla.GO_TAG_AGENT, defender_target, GO_TAG),
+             (defending, hla.GO_TAG_AGENT, defender_target, last_action),
+             (enemy_flag_captured & has_flag, RED_ROUTE_ACTIONS[return_route], INVALID, return_route),
+             (enemy_flag_captured, hla.WAIT_AT_ENEMY_FLAG, INVALID, last_action),
+             (team_flag_captured & (difficulty == 4), hla.GO_TAG_AGENT, flag_holder, last_action),
+             (difficulty == 4, RED_ROUTE_ACTIONS[flank_route], INVALID, flank_route)]
+    default = (RED_ROUTE_ACTIONS[attack_route], INVALID, attack_route)
+    return _evaluate(rules, default)
+
+
+def blue_decisions(difficulty, is_tagged, has_flag, last_action, in_home_territory, enemy_flag_captured,
+                   tagged_threats, n_threats, first_threat, routes):
+    """Decision table of CustomControllerB. Every argument can have leading batch dimensions (one per game); per agent
+    arrays have shape (..., n) and per team values have shape (...).
+
+    Agents in their own territory defend (tag the first enemy in territory or wait at the flag) until an enemy in
+    territory is tagged or the enemy flag is captured (at difficulty 1 only agent 0 defends and at difficulty 5 no
+    agent does). The other agents attack with the smart attack behaviours, or along a random route at difficulty 1,
+    and bring the flag home with the smart return behaviours.
+
+    :param difficulty: difficulty level (1 to 5).
+    :param is_tagged: bool array (..., n).
+    :param has_flag: bool array (..., n).
+    :param last_action: int array (..., n) of states.
+    :param in_home_territory: bool array (..., n) of agents in blue territory.
+    :param enemy_flag_captured: is the enemy flag held by the team.
+    :param tagged_threats: number of tagged enemies removed from the enemies in territory.
+    :param n_threats: number of untagged enemies in territory (see remove_tagged_enemies).
+    :param first_threat: first untagged enemy in territory.
+    :param routes: int array (..., n) of picks between the three routes.
+    :return: tuple (action codes, tag targets, new states), int arrays (..., n). Action codes are high level action
+    codes or one of the smart behaviours (RETURN_SMART, ...).
+    """
+    is_tagged = np.asarray(is_tagged, bool)
+    has_flag = np.asarray(has_flag, bool)
+    agent_idx = np.arange(is_tagged.shape[-1])
+    difficulty = np.asarray(difficulty)[..., None]
+    enemy_flag_captured = np.asarray(enemy_flag_captured, bool)[..., None]
+    tagged_threats, n_threats, first_threat = (np.asarray(value)[..., None]
+                                               for value in (tagged_threats, n_threats, first_threat))
+
+    defending = (difficulty != 5) & (((tagged_threats == 0) & in_home_territory & ~enemy_flag_captured &
+                                      (difficulty > 1)) | ((agent_idx == 0) & (difficulty < 2)))
+    attack_route = _keep_route(last_action, ATTACK_ROUTES, IS_ATTACK_ROUTE, routes)
+
+    # (condition, action, target, state) in priority order
+    rules = [(is_tagged, hla.GO_TO_BASE, INVALID, TAGGED),
+             (defending & (n_threats == 0), hla.GO_TO_BASE, INVALID, WAIT),
+             (defending, hla.GO_TAG_AGENT, first_threat, GO_TAG),
+             (enemy_flag_captured & has_flag & (difficulty > 1), RETURN_SMARTER, INVALID, last_action),
+             (enemy_flag_captured & has_flag, RETURN_SMART, INVALID, last_action),
+             (enemy_flag_captured, hla.WAIT_AT_ENEMY_FLAG, INVALID, last_action),
+             (difficulty == 2, GO_TO_ENEMY_FLAG_SMARTER, INVALID, last_action),
+             (difficulty > 2, GO_TO_ENEMY_FLAG_SMARTEST, INVALID, last_action),
+             (difficulty == 1, BLUE_ROUTE_ACTIONS[attack_route], INVALID, attack_route)]
+    default = (INVALID, INVALID, last_action)
+    return _evaluate(rules, default)
+
+
+def get_accelerations(controller, actions, targets):
+    """Turns the decisions of a custom controller into acceleration commands. The high level actions of the whole
+    team are steered at once by HighLevelActionSet.get_accelerations and the smart behaviours are run per agent.
+
+    :param controller: the custom controller.
+    :param actions: int array (n,) of action codes.
+    :param targets: int array (n,) of the enemy each tagging agent goes for.
+    :return: ndarray (n, 2) of acceleration commands.
+    """
+    sensor = controller.sensor
+    delta_time = sensor.env.delta_time
+    if (actions == INVALID).any():
+        raise Exception("Invalid action")
+    tagging = actions == hla.GO_TAG_AGENT
+    if (targets[tagging] < 0).any():
+        raise Exception("No enemy to tag")
+
+    smart = actions >= len(controller.action_set.action_set)
+    if smart.all():
+        acceleration = np.zeros((len(actions), 2))
+    else:
+        acceleration = controller.action_set.get_accelerations(np.where(smart, hla.GO_TO_BASE, actions), sensor.team,
+                                                               sensor.enemy_team, sensor.team_flags,
+                                                               sensor.enemy_flags, targets, delta_time)
+    for idx in np.flatnonzero(smart):
+        if actions[idx] == RETURN_SMART:
+            acceleration[idx] = hla.return_smart(sensor.team, sensor.enemy_team, sensor.team_flags,
+                                                 sensor.enemy_flags, idx, 0, 0, delta_time)
+        elif actions[idx] == RETURN_SMARTER:
+            acceleration[idx] = hla.return_smarter(sensor.team, sensor.enemy_team, sensor.team_flags,
+                                                   sensor.enemy_flags, idx, 0, 0, delta_time)
+        elif actions[idx] == GO_TO_ENEMY_FLAG_SMARTER:
+            acceleration[idx] = hla.go_to_enemy_flag_smarter(sensor.team, sensor.enemy_team, sensor.enemy_flags,
+                                                             idx, 0, 0, delta_time)
+        else:
+            acceleration[idx] = hla.go_to_enemy_flag_smartest(sensor.team, sensor.enemy_team, sensor.enemy_flags,
+                                                              idx, 0, 0, delta_time)
+    return acceleration
@@ -11,9 +11,12 @@ University of Adelaide.
 """
 
 import numpy as np
-from utils.utils import choices
+from utils.utils import sample_categorical
 from algorithms.controller import Controller
 import actions.high_level_actions as hla
+from algorithms.custom import compiled_policies
+from algorithms.custom.compiled_policies import TAGGED, WAIT, GO_TAG, ATTACK_TOP, ATTACK_BOTTOM, ATTACK_CENTRE, \
+    ATTACK_ROUTES
 
 
 class CustomControllerB(Controller):
@@ -25,20 +28,49 @@ class CustomControllerB(Controller):
 
         super().__init__(goal, team, sensor, action_set='high_level', controller_type='custom')
 
+        # Evaluate the decision table for the whole team (False runs the original per agent decision tree)
+        self.use_compiled_policy = self.n_agents >= compiled_policies.MIN_AGENTS
+
     def get_acceleration(self):
-        """Get acceleration commands based on the proportional navigation algorithm.
+        """Get acceleration commands for the whole team from the decision table in compiled_policies.blue_decisions.
+
+        :return: ndarray of acceleration commands.
+        """
+        if not self.use_compiled_policy:
+            return self.get_acceleration_tree()
+
+        env = self.sensor.env
+        enemy_flag_captured = self.sensor.enemy_flags.is_captured[0]
+        # Route picks for every agent this tick
+        routes = sample_categorical(self.rng, [1 / 3] * 3, size=self.n_agents)
+
+        # Enemies the defenders go for
+        threats, tagged_threats, _ = compiled_policies.remove_tagged_enemies(
+            env.check_for_enemies_in_territory(self.team), self.sensor.enemy_team.is_tagged)
+
+        actions, targets, self.last_action[:] = compiled_policies.blue_decisions(
+            env.difficulty, self.sensor.team.is_tagged, self.sensor.team.has_flag, self.last_action,
+            env.world_queries.in_blue_territory(self.team), enemy_flag_captured, len(tagged_threats), len(threats),
+            threats[0] if len(threats) != 0 else compiled_policies.INVALID, routes)
+        return compiled_policies.get_accelerations(self, actions, targets)
+
+    def get_acceleration_tree(self):
+        """Get acceleration commands by walking the decision tree one agent at a time (the reference for the
+        decision table in compiled_policies.blue_decisions).
 
         :return: ndarray of acceleration commands.
         """
 
         enemy_flag_captured = self.sensor.enemy_flags.is_captured[0]
         acceleration = np.zeros((self.n_agents, 2))
+        # Route picks for every agent this tick
+        routes = sample_categorical(self.rng, [1 / 3] * 3, size=self.n_agents)
         for idx in range(self.n_agents):
             if self.sensor.team.is_tagged[idx]:
                 # If tagged then return to base
                 acceleration[idx] = hla.go_to_base(self.sensor.team, self.sensor.team_flags, idx, 0,
                                                    self.sensor.env.delta_time)
-                self.last_action[idx] = "tagged"
+                self.last_action[idx] = TAGGED
 
             else:
                 # Check if any enemy agents in territory
@@ -73,12 +105,12 @@ class CustomControllerB(Controller):
                     if len(enemies_in_territory) == 0:
                         acceleration[idx] = hla.wait_at_team_flag(self.sensor.team, self.sensor.team_flags,
                                                                 idx, 0, self.sensor.env.delta_time)
-                        self.last_action[idx] = 'wait'
+                        self.last_action[idx] = WAIT
                     else:
                         acceleration[idx] = hla.go_tag_agent(self.team, self.sensor.enemy_team, idx,
                                                             enemies_in_territory[0], self.sensor.env.delta_time)
                                                             #use "idx % len(enemies_in_territory)" instead of "0". This allows multiple attackers to be targeted by different defenders.
-                        self.last_action[idx] = 'go_tag'
+                        self.last_action[idx] = GO_TAG
 
                 else:
                     # Attacker agent
@@ -108,18 +140,18 @@ class CustomControllerB(Controller):
 
                         #for difficulty 1
                         elif self.sensor.env.difficulty == 1:
-                            if not (self.last_action[idx] == 'attack_top' or self.last_action[idx] == 'attack_bottom' or
-                                    self.last_action[idx] == 'attack_centre'):
-                                action = choices(['attack_top', 'attack_bottom', 'attack_centre'], [1 / 3] * 3)[0]
+                            if not (self.last_action[idx] == ATTACK_TOP or self.last_action[idx] == ATTACK_BOTTOM or
+                                    self.last_action[idx] == ATTACK_CENTRE):
+                                action = ATTACK_ROUTES[routes[idx]]
                                 self.last_action[idx] = action
 
-                            if self.last_action[idx] == 'attack_top':
+                            if self.last_action[idx] == ATTACK_TOP:
                                 acceleration[idx] = hla.attack_top(self.sensor.team, self.sensor.enemy_team, self.sensor.enemy_flags,
                                                                    idx, 0, 0, self.sensor.env.delta_time)
-                            elif self.last_action[idx] == 'attack_bottom':
+                            elif self.last_action[idx] == ATTACK_BOTTOM:
                                 acceleration[idx] = hla.attack_bottom(self.sensor.team, self.sensor.enemy_team, self.sensor.enemy_flags,
                                                                    idx, 0, 0, self.sensor.env.delta_time)
-                            elif self.last_action[idx] == 'attack_centre':
+                            elif self.last_action[idx] == ATTACK_CENTRE:
                                 acceleration[idx] = hla.attack_centre(self.sensor.team, self.sensor.enemy_team, self.sensor.enemy_flags,
                                                                    idx, 0, 0, self.sensor.env.delta_time)
                         else:
@@ -16,11 +16,13 @@ This code file was edited by a1798441
 """
 
 ##needed for calculating distance between agents
-from scipy.spatial.distance import cdist
 import numpy as np
-from utils.utils import choices
+from utils.utils import sample_categorical
 from algorithms.controller import Controller
 import actions.high_level_actions as hla
+from algorithms.custom import compiled_policies
+from algorithms.custom.compiled_policies import TAGGED, WAIT, GO_TAG, ATTACK_TOP, ATTACK_BOTTOM, ATTACK_CENTRE, \
+    RETURN_TOP, RETURN_BOTTOM, RETURN_CENTRE, ATTACK_ROUTES, ATTACK_FLANK_ROUTES, RETURN_ROUTES
 
 
 class CustomControllerR(Controller):
@@ -32,8 +34,49 @@ class CustomControllerR(Controller):
 
         super().__init__(goal, team, sensor, action_set='high_level', controller_type='custom')
 
+        # Evaluate the decision table for the whole team (False runs the original per agent decision tree)
+        self.use_compiled_policy = self.n_agents >= compiled_policies.MIN_AGENTS
+
     def get_acceleration(self):
-        """Get acceleration commands based on the proportional navigation algorithm.
+        """Get acceleration commands for the whole team from the decision table in compiled_policies.red_decisions.
+
+        :return: ndarray of acceleration commands.
+        """
+        if not self.use_compiled_policy:
+            return self.get_acceleration_tree()
+
+        env = self.sensor.env
+        enemy_flag_captured = self.sensor.enemy_flags.is_captured[0]
+        team_flag_captured = self.sensor.team_flags.is_captured[0]
+        # Route picks for every agent this tick (one uniform per agent shared by the two and three way choices)
+        route_uniforms = self.rng.random(self.n_agents)
+        routes_2 = sample_categorical(self.rng, [1 / 2] * 2, uniforms=route_uniforms)
+        routes_3 = sample_categorical(self.rng, [1 / 3] * 3, uniforms=route_uniforms)
+
+        # Enemies the defenders go for
+        threats, _, after_removal = compiled_policies.remove_tagged_enemies(
+            env.check_for_enemies_in_territory(self.team), self.sensor.enemy_team.is_tagged)
+        closest_threat = env.closest_to_flag(self.team)
+        top_threat = env.top_enemy(self.team)
+        bottom_threat = env.bot_enemy(self.team)
+        after_removal = [remaining for remaining in after_removal if len(remaining) != 0]
+        if len(after_removal) != 0:
+            closest_threat = top_threat = bottom_threat = after_removal[-1][0]
+
+        first_threat = threats[0] if len(threats) != 0 else None
+        first_threat, closest_threat, top_threat, bottom_threat, flag_holder = (
+            compiled_policies.INVALID if enemy is None else enemy
+            for enemy in (first_threat, closest_threat, top_threat, bottom_threat, env.flag_holder(self.team)))
+
+        actions, targets, self.last_action[:] = compiled_policies.red_decisions(
+            env.difficulty, self.sensor.team.is_tagged, self.sensor.team.has_flag, self.last_action,
+            enemy_flag_captured, team_flag_captured, routes_2, routes_3, len(threats), first_threat, closest_threat,
+            top_threat, bottom_threat, flag_holder)
+        return compiled_policies.get_accelerations(self, actions, targets)
+
+    def get_acceleration_tree(self):
+        """Get acceleration commands by walking the decision tree one agent at a time (the reference for the
+        decision table in compiled_policies.red_decisions).
 
         :return: ndarray of acceleration commands.
         """
@@ -42,13 +85,17 @@ class CustomControllerR(Controller):
         team_flag_captured = self.sensor.team_flags.is_captured[0]
         ### a1798441 end
         acceleration = np.zeros((self.n_agents, 2))
-        Enemy_to_flags_dist = cdist(self.sensor.team_flags.positions, self.sensor.enemy_team.positions, metric='euclidean')
+        # Route picks for every agent this tick (one uniform per agent shared by the two and three way choices)
+        route_uniforms = self.rng.random(self.n_agents)
+        routes_2 = sample_categorical(self.rng, [1 / 2] * 2, uniforms=route_uniforms)
+        routes_3 = sample_categorical(self.rng, [1 / 3] * 3, uniforms=route_uniforms)
+        Enemy_to_flags_dist = self.sensor.env.world_queries.distances(self.sensor.enemy_team, self.sensor.team_flags).T
         for idx in range(self.n_agents):
             if self.sensor.team.is_tagged[idx]:
                 # If tagged then return to base
                 acceleration[idx] = hla.go_to_base(self.sensor.team, self.sensor.team_flags, idx, 0,
                                                    self.sensor.env.delta_time)
-                self.last_action[idx] = "tagged"
+                self.last_action[idx] = TAGGED
             else:
                 ### a1798441 start
                 if idx == 0 or self.sensor.env.difficulty == 5:
@@ -86,20 +133,20 @@ class CustomControllerR(Controller):
                         # Defender agent
                         acceleration[idx] = hla.wait_at_team_flag(self.sensor.team, self.sensor.team_flags,
                                                                   idx, 0, self.sensor.env.delta_time)
-                        self.last_action[idx] = 'wait'
+                        self.last_action[idx] = WAIT
                     #PN applied to defender to intercept blue agent 0
                     elif self.sensor.env.difficulty > 1:
                         if len(enemies_in_territory) == 0:
                             # Defender agent
                             acceleration[idx] = hla.wait_at_team_flag(self.sensor.team, self.sensor.team_flags,
                                                                       idx, 0, self.sensor.env.delta_time)
-                            self.last_action[idx] = 'wait'
+                            self.last_action[idx] = WAIT
                         else:
                             # attacks id counter final if difficulty is 3
                             if self.sensor.env.difficulty == 2:
                                 acceleration[idx] = hla.go_tag_agent(self.team, self.sensor.enemy_team, idx,
                                                                      enemies_in_territory[0], self.sensor.env.delta_time)
-                                self.last_action[idx] = 'go_tag'
+                                self.last_action[idx] = GO_TAG
                             elif self.sensor.env.difficulty >= 3:
                                 acceleration[idx] = hla.go_tag_agent(self.team, self.sensor.enemy_team, idx,
                                                                      closest_flag, self.sensor.env.delta_time)
@@ -114,7 +161,7 @@ class CustomControllerR(Controller):
                     else:
                         acceleration[idx] = hla.wait_at_team_flag(self.sensor.team, self.sensor.team_flags,
                                                                   idx, 0, self.sensor.env.delta_time)
-                        self.last_action[idx] = 'wait'
+                        self.last_action[idx] = WAIT
 
                 elif self.sensor.env.difficulty != 5:
                     # Attacker agent
@@ -122,19 +169,19 @@ class CustomControllerR(Controller):
                     if enemy_flag_captured:
                         if self.sensor.team.has_flag[idx]:
 
-                            if not (self.last_action[idx] == 'return_top' or
-                                    self.last_action[idx] == 'return_bottom' or
-                                    self.last_action[idx] == 'return_centre'):
-                                action = choices(['return_top', 'return_bottom', 'return_centre'], [1 / 3] * 3)[0]
+                            if not (self.last_action[idx] == RETURN_TOP or
+                                    self.last_action[idx] == RETURN_BOTTOM or
+                                    self.last_action[idx] == RETURN_CENTRE):
+                                action = RETURN_ROUTES[routes_3[idx]]
                                 self.last_action[idx] = action
 
-                            if self.last_action[idx] == 'return_top':
+                            if self.last_action[idx] == RETURN_TOP:
                                 acceleration[idx] = hla.return_top(self.sensor.team, self.sensor.team_flags, idx, 0,
                                                                    self.sensor.env.delta_time)
-                            elif self.last_action[idx] == 'return_bottom':
+                            elif self.last_action[idx] == RETURN_BOTTOM:
                                 acceleration[idx] = hla.return_bottom(self.sensor.team, self.sensor.team_flags, idx, 0,
                                                                       self.sensor.env.delta_time)
-                            elif self.last_action[idx] == 'return_centre':
+                            elif self.last_action[idx] == RETURN_CENTRE:
                                 acceleration[idx] = hla.return_centre(self.sensor.team, self.sensor.team_flags, idx, 0,
                                                                       self.sensor.env.delta_time)
                             else:
@@ -148,34 +195,34 @@ class CustomControllerR(Controller):
                             acceleration[idx] = hla.go_tag_agent(self.team, self.sensor.enemy_team, idx,
                                         holder, self.sensor.env.delta_time)
                     elif self.sensor.env.difficulty == 4 and not team_flag_captured:
-                        if not (self.last_action[idx] == 'attack_top' or self.last_action[idx] == 'attack_bottom'):
-                            action = choices(['attack_top', 'attack_bottom'], [1 / 2] * 2)[0]
+                        if not (self.last_action[idx] == ATTACK_TOP or self.last_action[idx] == ATTACK_BOTTOM):
+                            action = ATTACK_FLANK_ROUTES[routes_2[idx]]
                             self.last_action[idx] = action
 
-                        if self.last_action[idx] == 'attack_top':
+                        if self.last_action[idx] == ATTACK_TOP:
                             acceleration[idx] = hla.attack_top(self.sensor.team, self.sensor.enemy_team,
                                                                self.sensor.enemy_flags,
                                                                idx, 0, 0, self.sensor.env.delta_time)
-                        elif self.last_action[idx] == 'attack_bottom':
+                        elif self.last_action[idx] == ATTACK_BOTTOM:
                             acceleration[idx] = hla.attack_bottom(self.sensor.team, self.sensor.enemy_team,
                                                                   self.sensor.enemy_flags,
                                                                   idx, 0, 0, self.sensor.env.delta_time)
                     ### a1798441 end
                     else:
-                        if not (self.last_action[idx] == 'attack_top' or self.last_action[idx] == 'attack_bottom' or
-                                self.last_action[idx] == 'attack_centre'):
-                            action = choices(['attack_top', 'attack_bottom', 'attack_centre'], [1 / 3] * 3)[0]
+                        if not (self.last_action[idx] == ATTACK_TOP or self.last_action[idx] == ATTACK_BOTTOM or
+                                self.last_action[idx] == ATTACK_CENTRE):
+                            action = ATTACK_ROUTES[routes_3[idx]]
                             self.last_action[idx] = action
 
-                        if self.last_action[idx] == 'attack_top':
+                        if self.last_action[idx] == ATTACK_TOP:
                             acceleration[idx] = hla.attack_top(self.sensor.team, self.sensor.enemy_team,
                                                                self.sensor.enemy_flags,
                                                                idx, 0, 0, self.sensor.env.delta_time)
-                        elif self.last_action[idx] == 'attack_bottom':
+                        elif self.last_action[idx] == ATTACK_BOTTOM:
                             acceleration[idx] = hla.attack_bottom(self.sensor.team, self.sensor.enemy_team,
                                                                   self.sensor.enemy_flags,
                                                                   idx, 0, 0, self.sensor.env.delta_time)
-                        elif self.last_action[idx] == 'attack_centre':
+                        elif self.last_action[idx] == ATTACK_CENTRE:
                             acceleration[idx] = hla.attack_bottom(self.sensor.team, self.sensor.enemy_team,
                                                                   self.sensor.enemy_flags,
                                                                   idx, 0, 0, self.sensor.env.delta_time)
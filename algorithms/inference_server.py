@@ -0,0 +1,354 @@
+"""
+capture_the_flag
+This file defines a local inference server that batches the policy requests of many environment processes.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import asyncio
+import multiprocessing
+import os
+import pickle
+import socket
+import struct
+import time
+import traceback
+import numpy as np
+
+_HEADER = struct.Struct("!Q")
+
+# Upper edges of the histogram bins (the last bin holds everything larger)
+BATCH_SIZE_BINS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, np.inf)
+QUEUE_LATENCY_BINS = (1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2, 1e-1, np.inf)
+
+
+class Histogram:
+    def __init__(self, bins):
+        """Counts of values falling in each bin.
+
+        :param bins: increasing upper edges of the bins.
+        """
+        self.bins = np.asarray(bins, dtype=np.double)
+        self.counts = np.zeros(len(self.bins), dtype=np.int64)
+
+    def add(self, values):
+        """Count values.
+
+        :param values: value or ndarray of values.
+        :return: None.
+        """
+        np.add.at(self.counts, np.searchsorted(self.bins, values), 1)
+
+    def as_dict(self):
+        """Copy of the histogram.
+
+        :return: dictionary of the bin edges and counts.
+        """
+        return {"bins": self.bins.copy(), "counts": self.counts.copy()}
+
+
+async def _read_message(reader):
+    """Read a length prefixed pickle.
+
+    :param reader: asyncio StreamReader.
+    :return: the unpickled message.
+    """
+    header = await reader.readexactly(_HEADER.size)
+    return pickle.loads(await reader.readexactly(_HEADER.unpack(header)[0]))
+
+
+def _write_message(writer, message):
+    """Write a length prefixed pickle.
+
+    :param writer: asyncio StreamWriter.
+    :param message: object to send.
+    :return: None.
+    """
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    writer.write(_HEADER.pack(len(data)) + data)
+
+
+class InferenceServer:
+    def __init__(self, policy, socket_path, max_batch_size=256, max_latency=0.002):
+        """Serves the actions of a policy over a Unix socket. Requests from every connected process are collected by
+        an asyncio event loop and run as one batched forward pass, once max_batch_size observations are waiting or
+        the oldest request has waited max_latency seconds.
+
+        Messages are length prefixed pickles: ("act", observations (..., obs_dim)) is answered with the actions
+        (...), ("stats", None) with the histograms (see stats) and ("close", None) stops the server. Answers are
+        ("ok", result), or ("error", traceback) when the request failed (e.g. the policy raised), which
+        RemotePolicy raises in the client. Observations must all have the width (obs_dim) of the first ones served.
+
+        :param policy: object with get_actions(observations) for a batch (n, obs_dim), e.g. a TorchPolicy.
+        :param socket_path: path of the Unix socket.
+        :param max_batch_size: number of observations that triggers a forward pass without waiting.
+        :param max_latency: longest time in seconds a request waits for other requests.
+        """
+        self.policy = policy
+        self.socket_path = socket_path
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.batch_sizes = Histogram(BATCH_SIZE_BINS)
+        self.queue_latencies = Histogram(QUEUE_LATENCY_BINS)
+        self.pending = []
+        self.pending_size = 0
+        self.obs_dim = None  # Width of the observations, set by the first act request
+        self.wakeup = None
+        self.stopped = None
+
+    def stats(self):
+        """Histograms of the number of observations per forward pass and of the time in seconds requests waited
+        before their forward pass.
+
+        :return: dictionary {"batch_size": ..., "queue_latency": ...} (see Histogram.as_dict).
+        """
+        return {"batch_size": self.batch_sizes.as_dict(), "queue_latency": self.queue_latencies.as_dict()}
+
+    async def _handle(self, reader, writer):
+        """Answers the requests of one client.
+
+        :param reader: asyncio StreamReader.
+        :param writer: asyncio StreamWriter.
+        :return: None.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    command, data = await _read_message(reader)
+                except (asyncio.IncompleteReadError, ConnectionResetError):
+                    break
+                try:
+                    if command == "act":
+                        observations = np.asarray(data, dtype=np.float32)
+                        if observations.ndim == 0:
+                            raise Exception("Observations need an obs_dim axis")
+                        if self.obs_dim is None:
+                            self.obs_dim = observations.shape[-1]
+                        elif observations.shape[-1] != self.obs_dim:
+                            raise Exception("Observations have obs_dim %d but the server serves obs_dim %d"
+                                            % (observations.shape[-1], self.obs_dim))
+                        future = loop.create_future()
+                        self.pending.append((observations.reshape(-1, observations.shape[-1]), time.perf_counter(),
+                                             future))
+                        self.pending_size += len(self.pending[-1][0])
+                        self.wakeup.set()
+                        actions = await future
+                        reply = actions.reshape(observations.shape[:-1] + actions.shape[1:])
+                    elif command == "stats":
+                        reply = self.stats()
+                    elif command == "close":
+                        reply = None
+                    else:
+                        raise Exception("Invalid command " + str(command))
+                except Exception:
+                    _write_message(writer, ("error", traceback.format_exc()))
+                else:
+                    _write_message(writer, ("ok", reply))
+                await writer.drain()
+                if command == "close":
+                    self.stopped.set()
+                    break
+        except asyncio.CancelledError:
+            pass  # The server stopped while the client was connected
+        finally:
+            writer.close()
+
+    async def _batch(self):
+        """Runs the waiting requests as batched forward passes.
+
+        :return: None.
+        """
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            if not self.pending:
+                continue
+            deadline = self.pending[0][1] + self.max_latency
+            while self.pending_size < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                self.wakeup.clear()
+
+            requests, self.pending, self.pending_size = self.pending, [], 0
+            start = time.perf_counter()
+            self.queue_latencies.add([start - received for _, received, _ in requests])
+            # Any failure is passed to every waiting request, so that the batcher keeps running
+            try:
+                observations = np.concatenate([request[0] for request in requests])
+                self.batch_sizes.add(len(observations))
+                actions = np.asarray(self.policy.get_actions(observations))
+                results = []
+                first = 0
+                for request, _, _ in requests:
+                    results.append(actions[first:first + len(request)])
+                    first += len(request)
+            except Exception as error:
+                for _, _, future in requests:
+                    future.set_exception(error)
+                continue
+            for result, (_, _, future) in zip(results, requests):
+                future.set_result(result)
+
+    async def serve(self, ready=None):
+        """Serve until a client sends close.
+
+        :param ready: optional multiprocessing Event set once the socket is listening.
+        :return: None.
+        """
+        self.wakeup = asyncio.Event()
+        self.stopped = asyncio.Event()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        batcher = asyncio.ensure_future(self._batch())
+        if ready is not None:
+            ready.set()
+        try:
+            await self.stopped.wait()
+        finally:
+            batcher.cancel()
+            server.close()  # Not waiting for the clients to disconnect
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+def _serve(policy, socket_path, max_batch_size, max_latency, ready):
+    """Entry point of the server process (see start_inference_server).
+
+    :return: None.
+    """
+    if hasattr(policy, "load_model"):
+        policy.load_model()
+    asyncio.run(InferenceServer(policy, socket_path, max_batch_size, max_latency).serve(ready))
+
+
+def start_inference_server(policy, socket_path, max_batch_size=256, max_latency=0.002, start_method=None):
+    """Start an InferenceServer in a new process and wait until it is listening. The policy is pickled to the
+    process and loaded there, so it is held once however many processes use it.
+
+    :param policy: policy to serve (see InferenceServer), e.g. TorchPolicy(model_path, action_space).
+    :param socket_path: path of the Unix socket.
+    :param max_batch_size: see InferenceServer.
+    :param max_latency: see InferenceServer.
+    :param start_method: multiprocessing start method (None uses the platform default).
+    :return: the server Process (stop it with RemotePolicy(socket_path).close_server()).
+    """
+    context = multiprocessing.get_context(start_method)
+    ready = context.Event()
+    process = context.Process(target=_serve, args=(policy, socket_path, max_batch_size, max_latency, ready),
+                              daemon=True)
+    process.start()
+    while not ready.wait(0.1):
+        if not process.is_alive():
+            raise Exception("Inference server failed to start")
+    return process
+
+
+class RemotePolicy:
+    def __init__(self, socket_path, action_space=None):
+        """Policy whose actions are computed by an InferenceServer. Used by the 'remote' controller type, so
+        environment processes do not each hold a copy of the network.
+
+        :param socket_path: path of the server's Unix socket.
+        :param action_space: gym space of the actions of one agent (unused, kept for the controller interface).
+        """
+        self.socket_path = socket_path
+        self.action_space = action_space
+        self.connection = None
+
+    def load_model(self):
+        """Connect to the server (done on the first request if not called before).
+
+        :return: None.
+        """
+        if self.connection is None:
+            self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.connection.connect(self.socket_path)
+
+    def _request(self, command, data=None):
+        """Send a message to the server and wait for the answer.
+
+        :param command: act, stats or close.
+        :param data: data of the message.
+        :return: the answer. Raises an exception if the server could not answer the request.
+        """
+        self.load_model()
+        message = pickle.dumps((command, data), protocol=pickle.HIGHEST_PROTOCOL)
+        self.connection.sendall(_HEADER.pack(len(message)) + message)
+        header = self._receive(_HEADER.size)
+        status, answer = pickle.loads(self._receive(_HEADER.unpack(header)[0]))
+        if status == "error":
+            raise Exception("Inference server failed to answer " + command + ":\n" + answer)
+        return answer
+
+    def _receive(self, n_bytes):
+        """Read exactly n_bytes from the connection.
+
+        :param n_bytes: number of bytes.
+        :return: bytes.
+        """
+        data = bytearray()
+        while len(data) < n_bytes:
+            chunk = self.connection.recv(n_bytes - len(data))
+            if not chunk:
+                raise Exception("Inference server closed the connection")
+            data.extend(chunk)
+        return bytes(data)
+
+    def reset(self):
+        """The policy has no memory between episodes.
+
+        :return: None.
+        """
+        pass
+
+    def train(self, env, epochs):
+        raise Exception("RemotePolicy is only used for inference")
+
+    def get_actions(self, observations):
+        """Get the actions of observations from the server, batched with the requests of other processes.
+
+        :param observations: ndarray (..., obs_dim).
+        :return: ndarray of actions (see TorchPolicy.get_actions).
+        """
+        return self._request("act", observations)
+
+    def get_stats(self):
+        """Get the server's histograms.
+
+        :return: batch size and queue latency histograms (see InferenceServer.stats).
+        """
+        return self._request("stats")
+
+    def close_server(self):
+        """Stop the server.
+
+        :return: None.
+        """
+        self._request("close")
+        self.close()
+
+    def close(self):
+        """Close the connection.
+
+        :return: None.
+        """
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def __getstate__(self):
+        # Connections are per process
+        state = dict(self.__dict__)
+        state["connection"] = None
+        return state
@@ -0,0 +1,351 @@
+"""
+capture_the_flag
+This file defines the asynchronous actor-learner loop that trains the teams against each other.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import multiprocessing
+import os
+import queue
+import traceback
+from collections import OrderedDict
+import numpy as np
+
+
+def _get_model(training_env):
+    """Get the model of the team a training interface trains.
+
+    :param training_env: ReinforcementLearningTrainingInterface.
+    :return: the model of the team's controller.
+    """
+    model = training_env.team.controller.model
+    if model is None:
+        raise Exception("Team " + training_env.team.color + " has no model to train")
+    return model
+
+
+class _Rollout:
+    def __init__(self, training_env, rollout_length):
+        """One game played by a rollout worker and the buffers its transitions are recorded into.
+
+        :param training_env: ReinforcementLearningTrainingInterface of the trained team.
+        :param rollout_length: number of steps sent to the learner at a time.
+        """
+        self.training_env = training_env
+        self.observations = None
+        self.rollout_length = rollout_length
+        self.buffers = None
+
+    def run(self, rng, opponents):
+        """Play rollout_length steps with the trained team's model.
+
+        :param rng: numpy Generator used to pick opponents.
+        :param opponents: cached (version, weights) snapshots of the opponent team.
+        :return: dictionary of transition arrays (observations, actions, rewards, dones, truncated,
+        next_observations), each with rollout_length rows.
+        """
+        training_env = self.training_env
+        model = _get_model(training_env)
+        if self.observations is None:
+            self._reset(rng, opponents)
+        for t in range(self.rollout_length):
+            actions = model.get_actions(self.observations)
+            next_observations, rewards, dones, infos = training_env.step(actions)
+            if self.buffers is None:
+                self.buffers = {name: np.zeros((self.rollout_length,) + np.shape(value), np.asarray(value).dtype)
+                                for name, value in (("observations", self.observations), ("actions", actions),
+                                                    ("rewards", rewards), ("dones", dones),
+                                                    ("truncated", infos['truncated']),
+                                                    ("next_observations", next_observations))}
+            self.buffers["observations"][t] = self.observations
+            self.buffers["actions"][t] = actions
+            self.buffers["rewards"][t] = rewards
+            self.buffers["dones"][t] = dones
+            self.buffers["truncated"][t] = infos['truncated']
+            self.buffers["next_observations"][t] = next_observations
+            if np.all(dones):
+                self._reset(rng, opponents)
+            else:
+                self.observations = next_observations
+        # Queues pickle in a background thread, so the batch must not share the reused buffers
+        return {name: values.copy() for name, values in self.buffers.items()}
+
+    def _reset(self, rng, opponents):
+        """Reset the game against a random opponent snapshot (if the opponent has a model).
+
+        :param rng: numpy Generator.
+        :param opponents: cached (version, weights) snapshots of the opponent team.
+        :return: None.
+        """
+        enemy_model = self.training_env.team.sensor.enemy_team.controller.model
+        if enemy_model is not None and len(opponents) > 0:
+            snapshots = list(opponents.values())
+            enemy_model.set_weights(snapshots[rng.integers(len(snapshots))])
+        # The sensor reuses its buffer, so keep a copy of the observations between steps
+        self.observations = np.array(self.training_env.reset())
+
+
+def _rollout_worker(worker_idx, init_args, teams, n_envs, rollout_length, opponent_cache_size, seed, start_states,
+                    shared_weights, weights_queue, transition_queue, stop_event):
+    """Plays games with frozen snapshots of the trained team's model and streams the transitions to the learner.
+
+    The learner publishes the weights of the trained team to shared_weights, which are picked up before each batch
+    when their version changes. It sends ("train", team, None, None) when the team being trained switches and
+    ("opponent", team, version, weights) when it snapshots a team for the other team to play against. The latest
+    snapshots of each team are cached in memory. If the worker fails it sends {"error": traceback, "worker":
+    worker_idx} to the learner and exits.
+
+    :param worker_idx: index of the worker.
+    :param init_args: arguments used to build the environments (GameEnvironment.init_args).
+    :param teams: teams that can be trained.
+    :param n_envs: number of games per team played by the worker.
+    :param rollout_length: number of steps per batch of transitions.
+    :param opponent_cache_size: number of opponent snapshots kept per team.
+    :param seed: base seed.
+    :param start_states: optional path of a start state bank.
+    :param shared_weights: dictionary of team to the SharedWeights of its latest weights.
+    :param weights_queue: queue the learner sends team switches and opponent snapshots to.
+    :param transition_queue: queue the transitions are sent to.
+    :param stop_event: set by the learner when training is over.
+    :return: None.
+    """
+    try:
+        _run_rollout_worker(worker_idx, init_args, teams, n_envs, rollout_length, opponent_cache_size, seed,
+                            start_states, shared_weights, weights_queue, transition_queue, stop_event)
+    except Exception:
+        transition_queue.put({"error": traceback.format_exc(), "worker": worker_idx})
+
+
+def _run_rollout_worker(worker_idx, init_args, teams, n_envs, rollout_length, opponent_cache_size, seed,
+                        start_states, shared_weights, weights_queue, transition_queue, stop_event):
+    """The loop of _rollout_worker (same parameters).
+
+    :return: None.
+    """
+    from environment.vector_env import make_training_interface
+    rollouts = {team: [_Rollout(make_training_interface(init_args, team, [seed, worker_idx, team_idx, env_idx],
+                                                        start_states=start_states), rollout_length)
+                       for env_idx in range(n_envs)]
+                for team_idx, team in enumerate(teams)}
+    opponents = {'red': OrderedDict(), 'blue': OrderedDict()}
+    rng = np.random.default_rng([seed, worker_idx])
+    training = None
+    versions = {team: None for team in teams}
+
+    while not stop_event.is_set():
+        # Take every message published since the last batch (wait for the first one)
+        while True:
+            try:
+                message = weights_queue.get(timeout=0.1) if training is None else weights_queue.get_nowait()
+            except queue.Empty:
+                break
+            kind, team, team_version, weights = message
+            if kind == "train":
+                training = team
+            elif kind == "opponent":
+                opponents[team][team_version] = weights
+                while len(opponents[team]) > opponent_cache_size:
+                    opponents[team].popitem(last=False)
+            else:
+                raise Exception("Invalid message " + str(kind))
+        if training is None:
+            continue
+
+        version = shared_weights[training].version
+        if version != versions[training]:
+            version, weights = shared_weights[training].copy()
+            for rollout in rollouts[training]:
+                _get_model(rollout.training_env).set_weights(weights)
+            versions[training] = version
+
+        enemy = 'blue' if training == 'red' else 'red'
+        for rollout in rollouts[training]:
+            batch = dict(rollout.run(rng, opponents[enemy]), team=training, version=version, worker=worker_idx)
+            while not stop_event.is_set():
+                try:
+                    transition_queue.put(batch, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+
+class SelfPlayTrainer:
+    def __init__(self, env, teams=('red', 'blue'), n_workers=2, n_envs=1, rollout_length=128, publish_every=10,
+                 opponent_cache_size=5, queue_size=32, seed=None, start_states=None):
+        """Trains the models of the teams of env against each other with asynchronous actors and one learner. Rollout
+        worker processes play headless copies of env with frozen snapshots of the trained team's model and stream
+        batches of transitions through a queue to the learner (this process), which updates the models of env. The
+        learner publishes new weights every publish_every updates, so rollouts and learning overlap. Weights of the
+        trained teams are published to shared weights files the workers attach to (see SharedWeights), so publishing
+        does not pickle a copy per worker.
+
+        The teams are trained in turn. When a team's turn ends its weights are snapshotted and the snapshots are
+        cached in the workers, which pick a random one of the latest opponent_cache_size snapshots for the enemy
+        team at every reset (if the enemy has a model). Models are never reloaded from disk.
+
+        The workers build their games from env.init_args, so the controllers of the trained teams must create their
+        models themselves (e.g. the 'nn' controller type). A model attached to env after it was built is not seen by
+        the workers, which then fail with "has no model to train". Errors in a worker are raised by train.
+
+        The models (controller.model of the trained teams) need get_actions(observations), get_weights(),
+        set_weights(weights) and learn(batch), where batch is a dictionary of transition arrays (observations,
+        actions, rewards, dones, truncated (done only because of the time limit), next_observations with
+        rollout_length rows) plus team, version (of the weights the batch was played with) and worker.
+
+        :param env: the GameEnvironment whose models are trained.
+        :param teams: teams to train ('red' and/or 'blue').
+        :param n_workers: number of rollout worker processes.
+        :param n_envs: number of games per team played by each worker.
+        :param rollout_length: number of steps per batch of transitions.
+        :param publish_every: number of learner updates between publishing weights.
+        :param opponent_cache_size: number of opponent snapshots kept per team.
+        :param queue_size: maximum number of batches waiting for the learner.
+        :param seed: base seed. If None a random base seed is drawn.
+        :param start_states: optional path of a start state bank the games reset from.
+        """
+        self.env = env
+        self.teams = tuple(teams)
+        for team in self.teams:
+            if team not in ('red', 'blue'):
+                raise Exception("Invalid team color")
+        self.n_workers = n_workers
+        self.n_envs = n_envs
+        self.rollout_length = rollout_length
+        self.publish_every = publish_every
+        self.opponent_cache_size = opponent_cache_size
+        self.queue_size = queue_size
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.seed = seed
+        self.start_states = start_states
+        self.versions = {'red': 0, 'blue': 0}
+        self.weights_queues = []
+        self.shared_weights = {}
+
+    def _get_model(self, team):
+        """Get the model of one of env's teams.
+
+        :param team: red or blue.
+        :return: the model.
+        """
+        agents = self.env.red_team if team == 'red' else self.env.blue_team
+        if agents is None or agents.controller.model is None:
+            raise Exception("Team " + team + " has no model to train")
+        return agents.controller.model
+
+    def _publish(self, kind, team):
+        """Send the current weights of a team to every worker.
+
+        :param kind: "train" (published to the team's shared weights) or "opponent".
+        :param team: red or blue.
+        :return: None.
+        """
+        weights = self._get_model(team).get_weights()
+        if kind == "train":
+            self.shared_weights[team].publish(weights)
+        else:
+            for weights_queue in self.weights_queues:
+                weights_queue.put((kind, team, self.versions[team], weights))
+
+    def _switch(self, team):
+        """Tell every worker to train a team.
+
+        :param team: red or blue.
+        :return: None.
+        """
+        for weights_queue in self.weights_queues:
+            weights_queue.put(("train", team, None, None))
+
+    def _get_batch(self, transition_queue, workers, timeout=1.0):
+        """Wait for the next batch of transitions, checking that the workers are still running.
+
+        :param transition_queue: queue the workers send transitions to.
+        :param workers: the worker processes.
+        :param timeout: seconds between checks of the workers.
+        :return: dictionary of transition arrays (see _Rollout.run).
+        """
+        while True:
+            try:
+                batch = transition_queue.get(timeout=timeout)
+            except queue.Empty:
+                for worker_idx, worker in enumerate(workers):
+                    if worker.exitcode is not None:
+                        raise Exception("Rollout worker " + str(worker_idx) + " exited with code " +
+                                        str(worker.exitcode))
+                continue
+            if "error" in batch:
+                raise Exception("Rollout worker " + str(batch["worker"]) + " failed:\n" + batch["error"])
+            return batch
+
+    def train(self, n_updates, phase_updates=100):
+        """Train the teams.
+
+        :param n_updates: total number of learner updates.
+        :param phase_updates: number of updates of a team before the other team's turn.
+        :return: None. Raises an exception if a worker fails.
+        """
+        from algorithms.shared_weights import SharedWeights, default_weights_path
+        context = multiprocessing.get_context()
+        transition_queue = context.Queue(self.queue_size)
+        stop_event = context.Event()
+        self.weights_queues = [context.Queue() for _ in range(self.n_workers)]
+        self.shared_weights = {team: SharedWeights.create(default_weights_path("ctf_self_play_" + team + "_" +
+                                                                               str(os.getpid()) + ".weights"),
+                                                          self._get_model(team).get_weights())
+                               for team in self.teams}
+        workers = [context.Process(target=_rollout_worker,
+                                   args=(worker_idx, self.env.init_args, self.teams, self.n_envs,
+                                         self.rollout_length, self.opponent_cache_size, self.seed,
+                                         self.start_states, self.shared_weights, self.weights_queues[worker_idx],
+                                         transition_queue, stop_event), daemon=True)
+                   for worker_idx in range(self.n_workers)]
+        for worker in workers:
+            worker.start()
+
+        try:
+            for team in ('red', 'blue'):
+                agents = self.env.red_team if team == 'red' else self.env.blue_team
+                if agents is not None and agents.controller.model is not None:
+                    self._publish("opponent", team)
+
+            updates = 0
+            phase = 0
+            while updates < n_updates:
+                team = self.teams[phase % len(self.teams)]
+                model = self._get_model(team)
+                self._publish("train", team)
+                self._switch(team)
+                phase_end = min(updates + phase_updates, n_updates)
+                while updates < phase_end:
+                    batch = self._get_batch(transition_queue, workers)
+                    if batch["team"] != team:
+                        continue  # Played before the turn changed
+                    model.learn(batch)
+                    updates += 1
+                    if updates % self.publish_every == 0:
+                        self.versions[team] += 1
+                        self._publish("train", team)
+                self.versions[team] += 1
+                self._publish("opponent", team)
+                phase += 1
+        finally:
+            stop_event.set()
+            # Empty the queue so that workers blocked on it can stop
+            while any(worker.is_alive() for worker in workers):
+                try:
+                    transition_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            for worker in workers:
+                worker.join()
+            for weights_queue in self.weights_queues:
+                weights_queue.cancel_join_thread()  # Weights the workers did not read are dropped
+            self.weights_queues = []
+            for weights in self.shared_weights.values():
+                weights.unlink()
+            self.shared_weights = {}
@@ -0,0 +1,176 @@
+"""
+capture_the_flag
+This file defines model weights that are published once and shared by every worker process.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import json
+import os
+import tempfile
+import numpy as np
+
+# File layout: int64 version, int64 length of the layout, int64 sequence number of each of the two slots, the
+# layout as json, then (aligned) the two slots of weights
+_HEADER_SIZE = 32
+_ALIGNMENT = 64
+
+
+def _aligned(n_bytes):
+    """Round a number of bytes up to the alignment of the arrays.
+
+    :param n_bytes: number of bytes.
+    :return: int.
+    """
+    return -(-n_bytes // _ALIGNMENT) * _ALIGNMENT
+
+
+def default_weights_path(name):
+    """Path of a weights file in shared memory (/dev/shm) if available, otherwise in the temporary directory.
+
+    :param name: file name.
+    :return: path.
+    """
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, name)
+
+
+class SharedWeights:
+    def __init__(self, path):
+        """Weights in a memory mapped file, attached to by every process that uses them (see create). The arrays are
+        views of the file, so attaching copies nothing and the pages are shared by all the processes.
+
+        The file has two slots. Version v of the weights is in slot v % 2 and publish writes the other slot before
+        bumping the version, so readers keep consistent weights while a new version is written. A reader still
+        using version v when v + 2 is published would see its slot change, so every slot has a sequence number
+        (a seqlock) that is odd while the slot is written and changes with every write. Readers check with
+        unchanged that the slot they used was not written meanwhile and retry otherwise (see copy and
+        TorchPolicy.get_actions).
+
+        :param path: path of a file written by SharedWeights.create.
+        """
+        self.path = path
+        self.buffer = np.memmap(path, dtype=np.uint8, mode='r+')
+        self.version_array = np.ndarray((1,), np.int64, self.buffer, 0)
+        self.sequences = np.ndarray((2,), np.int64, self.buffer, 16)
+        layout_size = int(np.ndarray((1,), np.int64, self.buffer, 8)[0])
+        self.layout = json.loads(bytes(self.buffer[_HEADER_SIZE:_HEADER_SIZE + layout_size]).decode())
+        data_start = _aligned(_HEADER_SIZE + layout_size)
+        self.slots = [{name: np.ndarray(tuple(shape), np.dtype(dtype), self.buffer,
+                                        data_start + slot * self.layout["slot_size"] + offset)
+                       for name, dtype, shape, offset in self.layout["arrays"]}
+                      for slot in range(2)]
+
+    @staticmethod
+    def create(path, weights):
+        """Write a weights file.
+
+        :param path: path of the file (see default_weights_path).
+        :param weights: dictionary of parameter name to ndarray (version 0).
+        :return: SharedWeights attached to the file.
+        """
+        arrays = []
+        offset = 0
+        for name, value in weights.items():
+            value = np.asarray(value)
+            arrays.append((name, value.dtype.str, list(value.shape), offset))
+            offset += _aligned(value.nbytes)
+        layout = {"arrays": arrays, "slot_size": max(offset, _ALIGNMENT)}
+        encoded = json.dumps(layout).encode()
+        data_start = _aligned(_HEADER_SIZE + len(encoded))
+
+        buffer = np.memmap(path, dtype=np.uint8, mode='w+', shape=(data_start + 2 * layout["slot_size"],))
+        np.ndarray((4,), np.int64, buffer, 0)[:] = (0, len(encoded), 0, 0)
+        buffer[_HEADER_SIZE:_HEADER_SIZE + len(encoded)] = np.frombuffer(encoded, dtype=np.uint8)
+        buffer.flush()
+        del buffer
+        shared_weights = SharedWeights(path)
+        shared_weights._write(0, weights)
+        return shared_weights
+
+    @property
+    def version(self):
+        """Version of the latest published weights (0 when created).
+
+        :return: int.
+        """
+        return int(self.version_array[0])
+
+    def get(self):
+        """Get the latest published weights without copying them.
+
+        :return: tuple (version, dictionary of parameter name to ndarray view of the file, sequence number of the
+        slot). The views must not be written to, and they are only the published weights as long as
+        unchanged(version, sequence) holds.
+        """
+        while True:
+            version = self.version
+            sequence = int(self.sequences[version % 2])
+            # Retry if the slot is being written (odd) or the version moved on while reading the sequence number
+            if sequence % 2 == 0 and self.version == version:
+                return version, self.slots[version % 2], sequence
+
+    def unchanged(self, version, sequence):
+        """Check that the slot of a version has not been written since get returned sequence.
+
+        :param version: version returned by get.
+        :param sequence: sequence number returned by get.
+        :return: bool.
+        """
+        return int(self.sequences[version % 2]) == sequence
+
+    def copy(self):
+        """Get a copy of the latest published weights (retried if they are overwritten while copying).
+
+        :return: tuple (version, dictionary of parameter name to ndarray).
+        """
+        while True:
+            version, views, sequence = self.get()
+            weights = {name: np.array(value) for name, value in views.items()}
+            if self.unchanged(version, sequence):
+                return version, weights
+
+    def publish(self, weights):
+        """Publish new weights. Readers pick them up the next time they check the version.
+
+        :param weights: dictionary of parameter name to ndarray, with the names and shapes the file was created with.
+        :return: the new version.
+        """
+        version = self.version + 1
+        self._write(version % 2, weights)
+        self.version_array[0] = version
+        return version
+
+    def _write(self, slot, weights):
+        """Copy weights into a slot, bumping its sequence number before (to odd) and after (to even).
+
+        :param slot: 0 or 1.
+        :param weights: dictionary of parameter name to ndarray.
+        :return: None.
+        """
+        views = self.slots[slot]
+        if set(weights) != set(views):
+            raise Exception("Weights do not match the shared weights file")
+        self.sequences[slot] += 1
+        for name, value in weights.items():
+            views[name][...] = value
+        self.sequences[slot] += 1
+
+    def unlink(self):
+        """Delete the file (processes still attached keep their mapping).
+
+        :return: None.
+        """
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def __getstate__(self):
+        # Other processes attach to the file rather than receiving a copy of the weights
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
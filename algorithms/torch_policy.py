@@ -0,0 +1,212 @@
+"""
+capture_the_flag
+This file defines the neural network policy used by the 'nn' controller type.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import numpy as np
+import torch
+from gym import spaces
+
+
+class PolicyNetwork(torch.nn.Module):
+    def __init__(self, layer_sizes):
+        """Fully connected network with tanh activations between the layers.
+
+        :param layer_sizes: sizes of the layers, from the observation size to the number of outputs.
+        """
+        super().__init__()
+        layers = []
+        for idx in range(len(layer_sizes) - 1):
+            if idx > 0:
+                layers.append(torch.nn.Tanh())
+            layers.append(torch.nn.Linear(layer_sizes[idx], layer_sizes[idx + 1]))
+        self.layers = torch.nn.Sequential(*layers)
+
+    def forward(self, observations):
+        return self.layers(observations)
+
+    @staticmethod
+    def from_state_dict(state_dict):
+        """Builds a network with the layer sizes of a state dict saved from a PolicyNetwork and loads it.
+
+        :param state_dict: state dict of a PolicyNetwork.
+        :return: PolicyNetwork.
+        """
+        network = PolicyNetwork(PolicyNetwork.layer_sizes(state_dict))
+        network.load_state_dict(state_dict)
+        return network
+
+    @staticmethod
+    def layer_sizes(state_dict):
+        """Works out the layer sizes of a PolicyNetwork from its state dict.
+
+        :param state_dict: state dict (or dictionary of ndarrays) of a PolicyNetwork.
+        :return: list of layer sizes.
+        """
+        weights = [state_dict[key] for key in sorted((key for key in state_dict if key.endswith(".weight")),
+                                                     key=lambda key: int(key.split(".")[1]))]
+        return [weights[0].shape[1]] + [weight.shape[0] for weight in weights]
+
+
+class TorchPolicy:
+    def __init__(self, model_path, action_space, network=None, device='cpu', n_threads=None, shared_weights=None):
+        """Policy that picks actions with a neural network. The network is loaded once, either as TorchScript or as
+        a state dict (into network, or into a PolicyNetwork sized from the state dict), and is only run for
+        inference.
+
+        :param model_path: file of the TorchScript module or state dict.
+        :param action_space: gym space of the actions of one agent (Discrete: the action is the argmax of the
+        outputs, Box: the outputs are clipped to the bounds).
+        :param network: optional torch.nn.Module the state dict is loaded into.
+        :param device: device inference is run on.
+        :param n_threads: number of intra-op threads used by torch (None keeps torch's default).
+        :param shared_weights: optional SharedWeights (or the path of its file) the parameters are taken from instead
+        of model_path. On the cpu the parameters are views of the shared file and newer published weights are picked
+        up before the next forward pass.
+        """
+        self.model_path = model_path
+        self.action_space = action_space
+        self.network = network
+        self.device = torch.device(device)
+        self.n_threads = n_threads
+        self.shared_weights = shared_weights
+        self.weights_version = None
+        self.weights_sequence = None  # Sequence number of the shared slot the parameters were attached to
+        self.loaded = False
+
+    def load_model(self):
+        """Load the network (done on the first call to get_actions if not called before).
+
+        :return: None.
+        """
+        if self.n_threads is not None:
+            torch.set_num_threads(self.n_threads)
+        if self.shared_weights is not None:
+            if isinstance(self.shared_weights, str):
+                from algorithms.shared_weights import SharedWeights
+                self.shared_weights = SharedWeights(self.shared_weights)
+            if self.network is None:
+                self.network = PolicyNetwork(PolicyNetwork.layer_sizes(self.shared_weights.get()[1]))
+            self.network = self.network.to(self.device).eval()
+            self._attach_weights()
+            self.loaded = True
+            return
+        try:
+            network = torch.jit.load(self.model_path, map_location=self.device)
+        except RuntimeError:
+            # Not TorchScript, so a state dict
+            state_dict = torch.load(self.model_path, map_location=self.device)
+            if self.network is None:
+                network = PolicyNetwork.from_state_dict(state_dict)
+            else:
+                network = self.network
+                network.load_state_dict(state_dict)
+        self.network = network.to(self.device).eval()
+        self.loaded = True
+
+    def _attach_weights(self):
+        """Point the parameters at the latest version of the shared weights (copied when not on the cpu, retried if
+        the slot is overwritten while copying).
+
+        :return: None.
+        """
+        while True:
+            version, weights, sequence = self.shared_weights.get()
+            self.network.load_state_dict({name: torch.from_numpy(value) for name, value in weights.items()},
+                                         assign=self.device.type == 'cpu')
+            if self.device.type == 'cpu' or self.shared_weights.unchanged(version, sequence):
+                break
+        self.weights_version = version
+        self.weights_sequence = sequence
+
+    def _weights_stale(self):
+        """Whether the parameters no longer are the latest shared weights, because a new version was published or the
+        attached slot was overwritten (by the version after next).
+
+        :return: bool.
+        """
+        return (self.shared_weights.version != self.weights_version or
+                not self.shared_weights.unchanged(self.weights_version, self.weights_sequence))
+
+    def share_weights(self, path):
+        """Publish the parameters to a SharedWeights file that policies in other processes can be given instead of
+        model_path, and use the shared copy from now on.
+
+        :param path: path of the file (see default_weights_path).
+        :return: SharedWeights, or None for TorchScript networks (whose architecture is only in their file).
+        """
+        from algorithms.shared_weights import SharedWeights
+        if not self.loaded:
+            self.load_model()
+        if isinstance(self.network, torch.jit.ScriptModule):
+            return None
+        self.shared_weights = SharedWeights.create(path, self.get_weights())
+        self._attach_weights()
+        return self.shared_weights
+
+    def reset(self):
+        """The policy has no memory between episodes.
+
+        :return: None.
+        """
+        pass
+
+    def train(self, env, epochs):
+        raise Exception("TorchPolicy is only used for inference")
+
+    def get_actions(self, observations):
+        """Pick the actions of a batch of observations with one forward pass.
+
+        :param observations: ndarray (..., obs_dim), e.g. (n_agents, obs_dim) for a team or
+        (n_envs, n_agents, obs_dim) for the teams of a vectorised environment.
+        :return: ndarray of actions (...) for discrete and one dimensional continuous actions, otherwise
+        (..., action size).
+        """
+        if not self.loaded:
+            self.load_model()
+        observations = torch.as_tensor(np.asarray(observations, dtype=np.float32), device=self.device)
+        while True:
+            if self.shared_weights is not None and self._weights_stale():
+                self._attach_weights()
+            with torch.inference_mode():
+                outputs = self.network(observations)
+            # On the cpu the parameters are views of the shared slot, so redo the pass if it was written meanwhile
+            if (self.shared_weights is None or self.device.type != 'cpu' or
+                    self.shared_weights.unchanged(self.weights_version, self.weights_sequence)):
+                break
+        outputs = outputs.cpu().numpy()
+        if isinstance(self.action_space, spaces.Discrete):
+            return np.argmax(outputs, axis=-1)
+        outputs = np.clip(outputs, self.action_space.low.reshape(-1), self.action_space.high.reshape(-1))
+        return outputs[..., 0] if outputs.shape[-1] == 1 else outputs
+
+    def get_weights(self):
+        """Get the parameters of the network (used to snapshot the policy, see SelfPlayTrainer).
+
+        :return: dictionary of parameter name to ndarray.
+        """
+        if not self.loaded:
+            self.load_model()
+        return {name: value.detach().cpu().numpy().copy() for name, value in self.network.state_dict().items()}
+
+    def set_weights(self, weights):
+        """Set the parameters of the network (the policy stops following shared weights).
+
+        :param weights: dictionary of parameter name to ndarray (see get_weights).
+        :return: None.
+        """
+        if not self.loaded:
+            self.load_model()
+        if self.shared_weights is not None:
+            # The parameters may be views of the shared file, so replace rather than write them
+            self.shared_weights = None
+            self.network.load_state_dict({name: torch.tensor(value, device=self.device)
+                                          for name, value in weights.items()}, assign=True)
+            return
+        self.network.load_state_dict({name: torch.as_tensor(value) for name, value in weights.items()})
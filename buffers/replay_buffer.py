@@ -0,0 +1,242 @@
+"""
+capture_the_flag
+This file defines the replay buffer that stores the transitions of reinforcement learning agents.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import os
+import numpy as np
+from gym import spaces
+from buffers.sum_tree import SumTree
+
+
+class ReplayBuffer:
+    def __init__(self, capacity, observation_shape, action_shape=(), action_dtype=np.int64, n_streams=1, n_step=1,
+                 gamma=0.99, alpha=0.0, epsilon=1e-6, path=None):
+        """Ring buffer of transitions held in preallocated arrays (memory mapped .npy files when path is given), so
+        no Python object is kept per transition.
+
+        Transitions are added a step at a time for every stream, where a stream is one agent (per agent training)
+        or one team (joint training) of one game. The arrays are indexed by (step, stream), so the transition
+        following (t, s) in its stream is (t + 1, s), which is what the n-step returns are computed from when
+        sampling.
+
+        Rows can be masked out when they are added (e.g. the agents whose option is still running with
+        OptionTrainingInterface) and each transition can have its own discount of the value of its next observation
+        (e.g. gamma ** duration of an option). Masked rows are never sampled and the n-step returns stop at them.
+
+        With alpha > 0 transitions are sampled in proportion to priority ** alpha through a SumTree (prioritised
+        experience replay). New transitions get the highest priority seen so far.
+
+        :param capacity: number of transitions (rounded down to a whole number of steps of the streams).
+        :param observation_shape: shape of the observation of one stream.
+        :param action_shape: shape of the action of one stream (() for discrete actions).
+        :param action_dtype: dtype of the actions.
+        :param n_streams: number of transitions added per step.
+        :param n_step: number of rewards summed into the returns.
+        :param gamma: discount factor.
+        :param alpha: prioritisation exponent (0 samples uniformly).
+        :param epsilon: added to the absolute priorities so that no transition has probability zero.
+        :param path: optional directory the arrays are memory mapped in.
+        """
+        self.n_streams = n_streams
+        self.steps = capacity // n_streams
+        if self.steps < 1:
+            raise Exception("Replay buffer capacity is smaller than the number of streams")
+        self.capacity = self.steps * n_streams
+        self.observation_shape = tuple(observation_shape)
+        self.action_shape = tuple(action_shape)
+        self.n_step = n_step
+        self.gamma = gamma
+        self.alpha = alpha
+        self.epsilon = epsilon
+        self.path = path
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+        rows = (self.steps, n_streams)
+        self.observations = self._allocate("observations", rows + self.observation_shape, np.float32)
+        self.next_observations = self._allocate("next_observations", rows + self.observation_shape, np.float32)
+        self.actions = self._allocate("actions", rows + self.action_shape, action_dtype)
+        self.rewards = self._allocate("rewards", rows, np.float32)
+        self.dones = self._allocate("dones", rows, np.bool_)
+        self.discounts = self._allocate("discounts", rows, np.double)
+        self.valid = self._allocate("valid", rows, np.bool_)
+        self.masked = False  # whether any row was added masked out
+
+        self.pos = 0
+        self.count = 0
+        self.tree = SumTree(self.capacity) if alpha > 0 else None
+        self.max_priority = 1.0
+
+    @staticmethod
+    def from_training_env(training_env, capacity, n_envs=1, **kwargs):
+        """Builds a replay buffer sized from a training interface's observation and action spaces.
+
+        :param training_env: ReinforcementLearningTrainingInterface.
+        :param capacity: number of transitions.
+        :param n_envs: number of games whose transitions are added each step (e.g. VectorCTFEnv.n_envs).
+        :param kwargs: other arguments of ReplayBuffer.
+        :return: ReplayBuffer.
+        """
+        action_space = training_env.action_space
+        if isinstance(action_space, spaces.Discrete):
+            action_shape, action_dtype = (), np.int64
+        else:
+            action_shape, action_dtype = action_space.shape, np.float32
+        n_streams = n_envs * (1 if training_env.joint else training_env.team.n)
+        return ReplayBuffer(capacity, training_env.observation_space.shape, action_shape, action_dtype, n_streams,
+                            **kwargs)
+
+    def _allocate(self, name, shape, dtype):
+        """Allocate one of the arrays.
+
+        :param name: name of the array (and of its file).
+        :param shape: shape.
+        :param dtype: dtype.
+        :return: ndarray (memmap if the buffer has a path).
+        """
+        if self.path is None:
+            return np.zeros(shape, dtype=dtype)
+        return np.lib.format.open_memmap(os.path.join(self.path, name + ".npy"), mode='w+', dtype=dtype,
+                                         shape=shape)
+
+    def __len__(self):
+        return self.count * self.n_streams
+
+    def add(self, observations, actions, rewards, dones, next_observations, mask=None, discounts=None):
+        """Add one step of every stream (as returned by the training interface's step). With
+        OptionTrainingInterface pass mask=infos['needs_action'] and discounts=infos['discounts'].
+
+        :param observations: observations the actions were taken in, (n_streams, ...) in any leading shape.
+        :param actions: actions.
+        :param rewards: rewards.
+        :param dones: dones.
+        :param next_observations: observations after the step (for games that were reset, the terminal observation).
+        :param mask: optional bool array of the streams whose row is a transition (the others are not stored).
+        :param discounts: optional discounts of the value of next_observations (gamma if not given).
+        :return: None.
+        """
+        self.extend(*(None if values is None else np.asarray(values)[None] for values in
+                      (observations, actions, rewards, dones, next_observations, mask, discounts)))
+
+    def extend(self, observations, actions, rewards, dones, next_observations, masks=None, discounts=None):
+        """Add consecutive steps of every stream, e.g. a batch of SelfPlayTrainer transitions.
+
+        :param observations: observations (n_steps, n_streams, ...) in any shape after the step axis.
+        :param actions: actions (n_steps, ...).
+        :param rewards: rewards (n_steps, ...).
+        :param dones: dones (n_steps, ...).
+        :param next_observations: observations after each step.
+        :param masks: optional bool array (n_steps, ...) of the rows that are transitions (see add).
+        :param discounts: optional discounts (n_steps, ...) of the value of next_observations (gamma if not given).
+        :return: None.
+        """
+        n_steps = len(rewards)
+        first = max(0, n_steps - self.steps)  # Only the last steps fit
+        rows = (self.pos + np.arange(n_steps - first)) % self.steps
+        if masks is None:
+            masks = np.ones((n_steps, self.n_streams), np.bool_)
+        if discounts is None:
+            discounts = np.full((n_steps, self.n_streams), self.gamma)
+        for array, values, shape in ((self.observations, observations, self.observation_shape),
+                                     (self.next_observations, next_observations, self.observation_shape),
+                                     (self.actions, actions, self.action_shape),
+                                     (self.rewards, rewards, ()),
+                                     (self.dones, dones, ()),
+                                     (self.discounts, discounts, ()),
+                                     (self.valid, masks, ())):
+            array[rows] = np.reshape(values, (n_steps, self.n_streams) + shape)[first:]
+        valid = self.valid[rows]
+        self.masked |= not valid.all()
+        if self.tree is not None:
+            self.tree.update((rows[:, None] * self.n_streams + np.arange(self.n_streams)).reshape(-1),
+                             np.where(valid, self.max_priority, 0.0).reshape(-1))
+        self.pos = (self.pos + len(rows)) % self.steps
+        self.count = min(self.count + len(rows), self.steps)
+
+    def _n_step_returns(self, steps, streams):
+        """Sum the discounted rewards of up to n_step transitions from (steps, streams), stopping at the end of an
+        episode, at a masked row or at the newest transition. Each reward is discounted by the product of the
+        discounts of the transitions before it.
+
+        :param steps: ndarray of steps.
+        :param streams: ndarray of streams.
+        :return: tuple (returns, step of the last transition summed, dones of the last transition, discount of the
+        bootstrapped value).
+        """
+        offsets = np.arange(self.n_step)
+        rows = (steps[:, None] + offsets) % self.steps
+        dones = self.dones[rows, streams[:, None]]
+        # Transitions written at or after each step (the ring runs from the oldest at pos to the newest)
+        available = (self.pos - steps - 1) % self.steps + 1
+        summed = (offsets < available[:, None]) & np.logical_and.accumulate(self.valid[rows, streams[:, None]],
+                                                                            axis=1)
+        summed[:, 1:] &= ~np.logical_or.accumulate(dones[:, :-1], axis=1)
+        discounts = np.cumprod(np.where(summed, self.discounts[rows, streams[:, None]], 1.0), axis=1)
+        reward_discounts = np.concatenate((np.ones((len(steps), 1)), discounts[:, :-1]), axis=1)
+        returns = (self.rewards[rows, streams[:, None]] * reward_discounts * summed).sum(axis=1)
+        n_summed = summed.sum(axis=1)
+        last = (steps + n_summed - 1) % self.steps
+        last_dones = self.dones[last, streams]
+        return returns, last, last_dones, discounts[:, -1] * ~last_dones
+
+    def sample(self, batch_size, rng, beta=0.4):
+        """Sample a batch of transitions.
+
+        :param batch_size: number of transitions.
+        :param rng: numpy Generator.
+        :param beta: importance sampling exponent of the weights (prioritised sampling only).
+        :return: dictionary of contiguous arrays with batch_size rows: observations, actions, rewards (n-step
+        returns), dones, next_observations (n steps later), discounts (of the value of next_observations), weights
+        (importance sampling weights, normalised by the largest in the batch) and indices (for update_priorities).
+        """
+        if self.count == 0:
+            raise Exception("Replay buffer is empty")
+        if self.tree is None:
+            if self.masked:
+                candidates = np.flatnonzero(self.valid[:self.count])
+                if len(candidates) == 0:
+                    raise Exception("Replay buffer is empty")
+                indices = candidates[rng.integers(len(candidates), size=batch_size)]
+            else:
+                indices = rng.integers(self.count * self.n_streams, size=batch_size)
+            steps, streams = np.divmod(indices, self.n_streams)
+            weights = np.ones(batch_size, dtype=np.float32)
+        else:
+            # Stratified: one value from each of batch_size equal ranges of the total priority
+            total = self.tree.total
+            if total <= 0:
+                raise Exception("Replay buffer is empty")
+            indices = self.tree.find((np.arange(batch_size) + rng.random(batch_size)) * (total / batch_size))
+            steps, streams = np.divmod(indices, self.n_streams)
+            weights = (len(self) * self.tree.get(indices) / total) ** -beta
+            weights = (weights / weights.max()).astype(np.float32)
+
+        returns, last, dones, discounts = self._n_step_returns(steps, streams)
+        return {"observations": self.observations[steps, streams],
+                "actions": self.actions[steps, streams],
+                "rewards": returns.astype(np.float32),
+                "dones": dones,
+                "next_observations": self.next_observations[last, streams],
+                "discounts": discounts.astype(np.float32),
+                "weights": weights,
+                "indices": indices}
+
+    def update_priorities(self, indices, priorities):
+        """Set the priorities of sampled transitions, e.g. to their TD errors.
+
+        :param indices: indices of the transitions (from sample).
+        :param priorities: ndarray of priorities (the absolute value is used).
+        :return: None.
+        """
+        if self.tree is None:
+            return
+        priorities = (np.abs(priorities) + self.epsilon) ** self.alpha
+        self.tree.update(indices, priorities)
+        self.max_priority = max(self.max_priority, float(priorities.max()))
@@ -0,0 +1,71 @@
+"""
+capture_the_flag
+This file defines the sum tree used to sample transitions in proportion to their priority.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import numpy as np
+
+
+class SumTree:
+    def __init__(self, capacity):
+        """Binary tree in a flat array whose leaves are priorities and whose nodes are the sums of their children.
+        Node 1 is the root and the children of node i are 2i and 2i + 1. Updates and lookups of a batch of leaves
+        walk the log2(capacity) levels with one vectorised step per level.
+
+        :param capacity: number of leaves.
+        """
+        self.capacity = capacity
+        self.n_leaves = 1 << max(0, (capacity - 1).bit_length())
+        self.depth = self.n_leaves.bit_length() - 1
+        self.nodes = np.zeros(2 * self.n_leaves, dtype=np.double)
+
+    @property
+    def total(self):
+        """Sum of every priority.
+
+        :return: float.
+        """
+        return self.nodes[1]
+
+    def get(self, indices):
+        """Priorities of leaves.
+
+        :param indices: ndarray of leaf indices.
+        :return: ndarray of priorities.
+        """
+        return self.nodes[self.n_leaves + np.asarray(indices)]
+
+    def update(self, indices, priorities):
+        """Set the priorities of leaves (the last one wins for repeated indices) and recompute their ancestors.
+
+        :param indices: ndarray of leaf indices.
+        :param priorities: ndarray of non-negative priorities.
+        :return: None.
+        """
+        nodes = self.n_leaves + np.asarray(indices, dtype=np.int64)
+        self.nodes[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes >> 1)
+            self.nodes[nodes] = self.nodes[2 * nodes] + self.nodes[2 * nodes + 1]
+
+    def find(self, values):
+        """Find the leaves whose cumulative priority ranges contain values.
+
+        :param values: ndarray of values in [0, total).
+        :return: ndarray of leaf indices.
+        """
+        values = np.minimum(np.asarray(values, dtype=np.double), np.nextafter(self.total, 0))
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            nodes <<= 1
+            left = self.nodes[nodes]
+            go_right = values >= left
+            values = values - np.where(go_right, left, 0.0)
+            nodes += go_right
+        return np.minimum(nodes - self.n_leaves, self.capacity - 1)
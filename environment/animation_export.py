@@ -0,0 +1,154 @@
+"""
+capture_the_flag
+This file exports games to mp4 files using a pool of worker processes and ffmpeg.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import multiprocessing
+import subprocess
+import numpy as np
+from environment.parallel_evaluation import _share_weights
+
+# The environment owned by each worker process
+_worker_env = None
+
+
+def record_episode(env):
+    """Plays one episode headless and records the world state before every time step. The episode ends at
+    max_episode_length, when the red team is wiped out or when the termination policy says so (the same as
+    GameEnvironment.generate_animation).
+
+    :param env: the GameEnvironment.
+    :return: ndarray (n_frames, env.world_state.size) of world state snapshots.
+    """
+    env.reset_env()
+    trajectory = np.zeros((env.max_episode_length, env.world_state.size), np.double)
+    n_frames = 0
+    for t in range(env.max_episode_length):
+        env.world_state.snapshot(out=trajectory[t])
+        n_frames = t + 1
+
+        env.update_environment()
+        if not env.red_team.alive.any() or env.is_episode_done():
+            break
+    return trajectory[:n_frames]
+
+
+def write_video(env, trajectory, file_name, fps=50, dpi=100, ffmpeg_path='ffmpeg'):
+    """Rasterizes a recorded trajectory with the Agg canvas and streams the raw frames to an ffmpeg process.
+
+    :param env: the GameEnvironment the trajectory was recorded in (its state is overwritten).
+    :param trajectory: ndarray (n_frames, env.world_state.size) from record_episode.
+    :param file_name: mp4 file to write.
+    :param fps: frames per second of the video.
+    :param dpi: resolution of the figure.
+    :param ffmpeg_path: ffmpeg executable.
+    :return: None.
+    """
+    renderer = env.get_renderer()
+    renderer.fig.set_dpi(dpi)
+    canvas = renderer.fig.canvas
+    canvas.draw()
+    width, height = canvas.get_width_height(physical=True)
+    # yuv420p needs even dimensions
+    width -= width % 2
+    height -= height % 2
+    frame = np.zeros((height, width, 3), np.uint8)
+
+    command = [ffmpeg_path, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+               '-s', '%dx%d' % (width, height), '-r', str(fps), '-i', '-', '-an', '-vcodec', 'libx264',
+               '-pix_fmt', 'yuv420p', file_name]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE)
+    try:
+        for snapshot in trajectory:
+            env.world_state.restore(snapshot)
+            renderer.draw_frame()
+            rgba = np.asarray(canvas.buffer_rgba())
+            np.copyto(frame, rgba[:height, :width, :3])
+            process.stdin.write(frame.data)
+    finally:
+        process.stdin.close()
+        if process.wait() != 0:
+            raise Exception("ffmpeg failed to write %s" % file_name)
+
+
+def _init_worker(init_args, difficulty, render_mode, video_args, shared_weights):
+    """Builds the environment used by a worker process. Frames are drawn with the non-interactive Agg backend.
+
+    :param init_args: arguments used to build the original environment (GameEnvironment.init_args).
+    :param difficulty: difficulty of the original environment.
+    :param render_mode: render mode of the original environment.
+    :param video_args: dictionary of fps, dpi and ffmpeg_path.
+    :param shared_weights: dictionary of team color to the SharedWeights its model attaches to instead of loading.
+    Only teams whose controllers have a model are loaded.
+    :return: None.
+    """
+    global _worker_env
+    import matplotlib
+    matplotlib.use('Agg')
+    from environment.game_environment import GameEnvironment
+    _worker_env = GameEnvironment(generate_graphics=True, render_mode=render_mode, **init_args)
+    _worker_env.difficulty = difficulty
+    _worker_env.video_args = video_args
+    for color, team in (('red', _worker_env.red_team), ('blue', _worker_env.blue_team)):
+        if team is None or team.controller.model is None:
+            continue
+        if color in shared_weights:
+            team.controller.model.shared_weights = shared_weights[color]
+        _worker_env.load(color)
+
+
+def _export_episode(task):
+    """Records one episode and writes it to a video in a worker process.
+
+    :param task: tuple (file name, episode index, base seed).
+    :return: tuple (file name, number of frames).
+    """
+    file_name, episode, seed = task
+    _worker_env.seed(np.random.SeedSequence([seed, episode]))
+    trajectory = record_episode(_worker_env)
+    write_video(_worker_env, trajectory, file_name, **_worker_env.video_args)
+    return file_name, len(trajectory)
+
+
+def export_animations(env, file_names, n_workers=None, seed=None, fps=50, dpi=100, ffmpeg_path='ffmpeg',
+                      share_weights=True):
+    """Writes one episode of env to each file. Every worker process records its episodes headless and then
+    rasterizes and encodes them, so several videos are produced at once. Episode i is seeded from (seed, i).
+
+    :param env: the GameEnvironment to export (the controllers are loaded in each worker).
+    :param file_names: list of mp4 file names.
+    :param n_workers: number of worker processes (defaults to one per file up to the number of cpus).
+    :param seed: base seed. If None a random base seed is drawn.
+    :param fps: frames per second of the videos.
+    :param dpi: resolution of the videos.
+    :param ffmpeg_path: ffmpeg executable.
+    :param share_weights: whether workers attach to shared copies of the models' weights (see
+    parallel_evaluation._share_weights).
+    :return: list of the number of frames written to each file.
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    if n_workers is None:
+        n_workers = min(len(file_names), multiprocessing.cpu_count())
+    tasks = [(file_name, episode, seed) for episode, file_name in enumerate(file_names)]
+    video_args = {"fps": fps, "dpi": dpi, "ffmpeg_path": ffmpeg_path}
+
+    shared_weights = _share_weights(env) if share_weights else {}
+    n_frames = {}
+    try:
+        with multiprocessing.Pool(n_workers, initializer=_init_worker,
+                                  initargs=(env.init_args, env.difficulty, env.render_mode, video_args,
+                                            shared_weights)) as pool:
+            for file_name, frames in pool.imap_unordered(_export_episode, tasks):
+                print("Wrote %s (%d frames)" % (file_name, frames))
+                n_frames[file_name] = frames
+    finally:
+        for weights in shared_weights.values():
+            weights.unlink()
+    return [n_frames[file_name] for file_name in file_names]
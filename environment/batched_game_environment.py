@@ -0,0 +1,406 @@
+"""
+capture_the_flag
+This file defines a batched version of the capture the flag environment that runs many games in lockstep.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import numpy as np
+from actions.high_level_actions import take_direct_path_batch
+from utils.kinematics import constant_speed_turn
+from utils.placement import sample_positions
+
+
+class BatchedTeam:
+    def __init__(self, team, n_envs):
+        """State of one team in every game of a batch. Arrays have shape (n_envs, n, ...).
+
+        :param team: Agents object from the template environment.
+        :param n_envs: number of games.
+        """
+        self.color = team.color
+        self.n = team.n
+        self.speed = team.speed
+        self.acceleration_limit = team.acceleration_limit
+        self.kill_distance = team.kill_distance
+        self.initial_azimuth = team.initial_azimuth
+        self.placement_choice = team.placement_choice
+        self.placement_bounds = team.placement_bounds
+        self.min_placement_distance = team.min_placement_distance
+
+        self.positions = np.zeros((n_envs, self.n, 2))
+        self.velocities = np.zeros((n_envs, self.n, 2))
+        self.accelerations = np.zeros((n_envs, self.n, 2))
+        self.azimuths = np.zeros((n_envs, self.n))
+        self.has_flag = np.zeros((n_envs, self.n), bool)
+        self.alive = np.ones((n_envs, self.n), bool)
+        self.is_tagged = np.zeros((n_envs, self.n), bool)
+
+
+class BatchedFlags:
+    def __init__(self, flags, n_envs):
+        """State of one team's flags in every game of a batch. Arrays have shape (n_envs, n, ...).
+
+        :param flags: Flags object from the template environment.
+        :param n_envs: number of games.
+        """
+        self.color = flags.color
+        self.n = flags.n
+        self.capture_distance = flags.capture_distance
+        self.placement_bounds = flags.placement_bounds
+        self.min_placement_distance = flags.min_placement_distance
+
+        self.positions = np.zeros((n_envs, self.n, 2))
+        self.is_captured = np.zeros((n_envs, self.n), bool)
+
+
+class BatchedGameEnvironment:
+    def __init__(self, env, n_envs=256, seed=None):
+        """Runs n_envs capture the flag games in lockstep. Each game follows the same rules as
+        GameEnvironment.update_environment_simultaneous_ctf but the state of all games is held in arrays of shape
+        (n_envs, n_agents, ...) and every step advances all games with array operations. Games that reach the end
+        of an episode are reset automatically.
+
+        The acceleration commands are supplied by policies. A policy is a callable policy(batched_env, team) that
+        returns an ndarray (n_envs, team.n, 2) of acceleration commands for the given BatchedTeam. The custom
+        controllers are available as policies through algorithms/custom/batched_policies.BatchedCustomPolicy (see
+        compare_with_scalar).
+
+        :param env: a (headless) GameEnvironment playing ctf that the rules and team parameters are taken from.
+        :param n_envs: number of games to run at once.
+        :param seed: seed for the random number generator (int, SeedSequence or None). Policies that need
+        randomness should draw from batched_env.rng so that a seeded run is reproducible.
+        """
+        if env.rules != 'ctf':
+            raise Exception("The batched environment only supports the ctf game.")
+        if env.red_team is None or env.blue_team is None or env.red_flags is None or env.blue_flags is None:
+            raise Exception("The batched environment needs both teams and both flags.")
+
+        self.n_envs = n_envs
+        self.rng = np.random.default_rng(seed)
+        self.difficulty = env.difficulty
+
+        # Rules taken from the template environment
+        self.game_boundary = env.game_boundary.copy()
+        self.centre = env.centre.copy()
+        self.top = env.top.copy()
+        self.bottom = env.bottom.copy()
+        self.delta_time = env.delta_time
+        self.red_time_step = env.red_time_step
+        self.blue_time_step = env.blue_time_step
+        self.max_episode_length = env.max_episode_length
+
+        # Flags are reset first since agents may be placed at their flags
+        self.red_flags = BatchedFlags(env.red_flags, n_envs)
+        self.blue_flags = BatchedFlags(env.blue_flags, n_envs)
+        self.red_team = BatchedTeam(env.red_team, n_envs)
+        self.blue_team = BatchedTeam(env.blue_team, n_envs)
+
+        self.red_score = np.zeros(n_envs, np.int64)
+        self.blue_score = np.zeros(n_envs, np.int64)
+        self.time_step = np.zeros(n_envs, np.int64)
+
+        # State of the games that finished on the last step, taken before they were reset
+        self.final_red_score = np.zeros(n_envs, np.int64)
+        self.final_blue_score = np.zeros(n_envs, np.int64)
+        self.final_red_is_tagged = np.zeros((n_envs, self.red_team.n), bool)
+        self.final_blue_is_tagged = np.zeros((n_envs, self.blue_team.n), bool)
+
+        # Acceleration commands are held between decisions
+        self.red_acceleration = np.zeros((n_envs, self.red_team.n, 2))
+        self.blue_acceleration = np.zeros((n_envs, self.blue_team.n, 2))
+
+        self.reset_env()
+
+    def reset_env(self, lanes=None):
+        """Reset some or all of the games.
+
+        :param lanes: ndarray of game indices (or boolean mask) to reset. None resets every game.
+        :return: None.
+        """
+        if lanes is None:
+            lanes = np.arange(self.n_envs)
+        elif lanes.dtype == bool:
+            lanes = np.flatnonzero(lanes)
+        n_lanes = len(lanes)
+        if n_lanes == 0:
+            return
+
+        for flags in (self.blue_flags, self.red_flags):
+            flags.positions[lanes] = sample_positions(self.rng, "random_constraint", flags.placement_bounds,
+                                                      n_lanes, flags.n, flags.min_placement_distance)
+            flags.is_captured[lanes] = False
+
+        for team, team_flags in ((self.blue_team, self.blue_flags), (self.red_team, self.red_flags)):
+            if team.placement_choice == 'flag':
+                if team_flags.n == 1:
+                    team.positions[lanes] = team_flags.positions[lanes, :1]
+                elif team_flags.n == team.n:
+                    team.positions[lanes] = team_flags.positions[lanes]
+                else:
+                    raise Exception("Haven't defined which flags to place each agent at.")
+            else:
+                team.positions[lanes] = sample_positions(self.rng, team.placement_choice, team.placement_bounds,
+                                                         n_lanes, team.n, team.min_placement_distance)
+            team.azimuths[lanes] = team.initial_azimuth
+            team.velocities[lanes] = [team.speed * np.cos(team.initial_azimuth),
+                                      team.speed * np.sin(team.initial_azimuth)]
+            team.accelerations[lanes] = 0.0
+            team.has_flag[lanes] = False
+            team.alive[lanes] = True
+            team.is_tagged[lanes] = False
+
+        self.red_score[lanes] = 0
+        self.blue_score[lanes] = 0
+        self.time_step[lanes] = 0
+
+    def in_red_territory(self, positions):
+        """Checks which positions are in red territory.
+
+        :param positions: ndarray (..., 2) of positions.
+        :return: boolean ndarray (...).
+        """
+        return (positions[..., 0] < self.game_boundary[0, 1]) & \
+               (positions[..., 0] > self.game_boundary[0, 1] / 2) & \
+               (positions[..., 1] > self.game_boundary[1, 0]) & \
+               (positions[..., 1] < self.game_boundary[1, 1])
+
+    def in_blue_territory(self, positions):
+        """Checks which positions are in blue territory.
+
+        :param positions: ndarray (..., 2) of positions.
+        :return: boolean ndarray (...).
+        """
+        return (positions[..., 0] > self.game_boundary[0, 0]) & \
+               (positions[..., 0] < self.game_boundary[0, 1] / 2) & \
+               (positions[..., 1] > self.game_boundary[1, 0]) & \
+               (positions[..., 1] < self.game_boundary[1, 1])
+
+    def step(self, red_policy, blue_policy):
+        """Advance every game by one time step. Games that finish are reset automatically, after their scores and
+        tagged status are copied to final_red_score, final_blue_score, final_red_is_tagged and final_blue_is_tagged
+        (only the finished games' entries are updated).
+
+        :param red_policy: callable returning red acceleration commands.
+        :param blue_policy: callable returning blue acceleration commands.
+        :return: boolean ndarray (n_envs) marking the games that finished (and were reset) on this step.
+        """
+        self.get_team_accelerations(red_policy, blue_policy)
+
+        # Apply red acceleration commands
+        self._apply_accelerations(self.red_team, self.red_acceleration)
+
+        # Attempt to tag agents
+        self.attempt_tag()
+
+        # Apply blue acceleration commands
+        self._apply_accelerations(self.blue_team, self.blue_acceleration)
+
+        # Flag capture and delivery
+        self.red_score += self._capture_or_deliver(self.red_team, self.red_flags, self.blue_flags)
+        self.blue_score += self._capture_or_deliver(self.blue_team, self.blue_flags, self.red_flags)
+
+        # red/blue attempt to tag blue/red
+        self.attempt_tag()
+
+        # Untag if back at base
+        self.untag_at_base()
+
+        # Increment time step
+        self.time_step += 1
+        finished = self.time_step >= self.max_episode_length
+        if finished.any():
+            np.copyto(self.final_red_score, self.red_score, where=finished)
+            np.copyto(self.final_blue_score, self.blue_score, where=finished)
+            np.copyto(self.final_red_is_tagged, self.red_team.is_tagged, where=finished[:, None])
+            np.copyto(self.final_blue_is_tagged, self.blue_team.is_tagged, where=finished[:, None])
+            self.reset_env(finished)
+        return finished
+
+    def get_team_accelerations(self, red_policy, blue_policy):
+        """Ask the policies for new acceleration commands in the games where the team is due to make a decision and
+        override the commands of tagged agents so that they return to base.
+
+        :param red_policy: callable returning red acceleration commands.
+        :param blue_policy: callable returning blue acceleration commands.
+        :return: None.
+        """
+        for team, flags, policy, acceleration, team_time_step in (
+                (self.red_team, self.red_flags, red_policy, self.red_acceleration, self.red_time_step),
+                (self.blue_team, self.blue_flags, blue_policy, self.blue_acceleration, self.blue_time_step)):
+            decide = self.time_step % team_time_step == 0
+            if decide.all():
+                acceleration[:] = policy(self, team)
+            elif decide.any():
+                acceleration[decide] = policy(self, team)[decide]
+
+            # Override actions if tagged
+            if team.is_tagged.any():
+                base_acceleration = take_direct_path_batch(team.positions, flags.positions[:, :1], team.speed,
+                                                           team.azimuths, self.delta_time)
+                acceleration[team.is_tagged] = base_acceleration[team.is_tagged]
+
+    def _apply_accelerations(self, team, acceleration):
+        """Applies acceleration commands to the live agents of a team in every game.
+
+        :param team: BatchedTeam.
+        :param acceleration: ndarray (n_envs, n, 2) of acceleration commands.
+        :return: None.
+        """
+        positions, velocities, accelerations, azimuths = constant_speed_turn(
+            team.positions, team.azimuths, acceleration, team.speed, team.acceleration_limit, self.delta_time)
+        alive = team.alive
+        np.copyto(team.positions, positions, where=alive[..., None])
+        np.copyto(team.velocities, velocities, where=alive[..., None])
+        np.copyto(team.accelerations, accelerations, where=alive[..., None])
+        np.copyto(team.azimuths, azimuths, where=alive)
+
+    def attempt_tag(self):
+        """To tag has to be in the corresponding territory. Applied to every pair of red and blue agents in every
+        game at once (see GameEnvironment.attempt_tag).
+
+        :return: None
+        """
+        red_positions = self.red_team.positions
+        blue_positions = self.blue_team.positions
+        dist = np.sqrt(((red_positions[:, :, None, :] - blue_positions[:, None, :, :]) ** 2).sum(axis=-1))
+        close = dist < self.red_team.kill_distance
+
+        red_in_red = self.in_red_territory(red_positions)
+        blue_in_red = self.in_red_territory(blue_positions)
+        red_in_blue = self.in_blue_territory(red_positions)
+        blue_in_blue = self.in_blue_territory(blue_positions)
+
+        blue_tagged = (close & red_in_red[:, :, None] & blue_in_red[:, None, :]).any(axis=1)
+        red_tagged = (close & red_in_blue[:, :, None] & blue_in_blue[:, None, :]).any(axis=2)
+
+        self._apply_tag(self.blue_team, self.red_flags, blue_tagged)
+        self._apply_tag(self.red_team, self.blue_flags, red_tagged)
+
+    @staticmethod
+    def _apply_tag(team, enemy_flags, tagged):
+        """Tag agents and make any tagged agent carrying the enemy flag drop it.
+
+        :param team: BatchedTeam being tagged.
+        :param enemy_flags: BatchedFlags the team may be carrying.
+        :param tagged: boolean ndarray (n_envs, n) of agents to tag.
+        :return: None.
+        """
+        team.is_tagged |= tagged
+        dropped = tagged & team.has_flag
+        team.has_flag &= ~dropped
+        enemy_flags.is_captured[dropped.any(axis=1), 0] = False
+
+    def _capture_or_deliver(self, team, team_flags, enemy_flags):
+        """In games where the enemy flag is captured the carrier attempts to deliver it home, otherwise the agents
+        attempt to capture the enemy flag (the lowest index agent in range gets it).
+
+        :param team: BatchedTeam.
+        :param team_flags: BatchedFlags of the team (delivery point).
+        :param enemy_flags: BatchedFlags of the enemy team.
+        :return: ndarray (n_envs) of points scored.
+        """
+        captured = enemy_flags.is_captured[:, 0].copy()
+
+        # Deliver
+        home_dist = np.sqrt(((team.positions - team_flags.positions[:, :1]) ** 2).sum(axis=-1))
+        deliver = captured[:, None] & team.has_flag & (home_dist <= team_flags.capture_distance)
+        team.has_flag &= ~deliver
+        points = deliver.sum(axis=1)
+        enemy_flags.is_captured[points > 0, 0] = False
+
+        # Capture
+        enemy_dist = np.sqrt(((team.positions - enemy_flags.positions[:, :1]) ** 2).sum(axis=-1))
+        eligible = ~captured[:, None] & ~team.has_flag & ~team.is_tagged & \
+            (enemy_dist <= enemy_flags.capture_distance)
+        capture = eligible.any(axis=1)
+        lanes = np.flatnonzero(capture)
+        team.has_flag[lanes, eligible[lanes].argmax(axis=1)] = True
+        enemy_flags.is_captured[capture, 0] = True
+        return points
+
+    def untag_at_base(self):
+        """Untag agents that are back at their base.
+
+        :return: None
+        """
+        for team, flags in ((self.red_team, self.red_flags), (self.blue_team, self.blue_flags)):
+            dist = np.sqrt(((team.positions[:, :, None, :] - flags.positions[:, None, :, :]) ** 2).sum(axis=-1))
+            team.is_tagged &= ~(dist < flags.capture_distance).any(axis=2)
+
+    def evaluate_ctf(self, red_policy, blue_policy, evaluation_eps=500):
+        """Runs at least evaluation_eps episodes across the batch and prints the same statistics as
+        GameEnvironment.evaluate_ctf.
+
+        :param red_policy: callable returning red acceleration commands.
+        :param blue_policy: callable returning blue acceleration commands.
+        :param evaluation_eps: Number of episodes to run.
+        :return: ndarray of per episode scores (1 red win, 0 draw, -1 blue win).
+        """
+        self.reset_env()
+        got_tagged = np.zeros(self.n_envs, bool)
+        red_wins = []
+        tags = 0
+        while len(red_wins) < evaluation_eps:
+            finished = self.step(red_policy, blue_policy)
+            got_tagged |= np.where(finished, self.final_red_is_tagged[:, 0], self.red_team.is_tagged[:, 0])
+            if finished.any():
+                lanes = np.flatnonzero(finished)
+                red_wins.extend(np.sign(self.final_red_score[lanes] - self.final_blue_score[lanes]).tolist())
+                tags += int(got_tagged[lanes].sum())
+                got_tagged[lanes] = False
+        red_score = np.array(red_wins[:evaluation_eps])
+
+        print("Tags: %s" % tags)
+        print("(Mean, Standard Deviation, Median)")
+        print("Score: (%f, %f, %f)" % (float(np.mean(red_score)), float(np.std(red_score)),
+                                       float(np.median(red_score))))
+        print("Red team difficulty: %d" % self.difficulty)
+        print("Scoreboard: B %d - %d - %d R" % (np.sum(red_score < 0), np.sum(red_score == 0), np.sum(red_score > 0)))
+        return red_score
+
+
+
+def compare_with_scalar(env, evaluation_eps=500, n_envs=256, seed=None):
+    """Plays the custom controllers of env in env and in a BatchedGameEnvironment built from it (with a
+    BatchedCustomPolicy for each team) and compares the outcomes. The two engines do not draw the same random numbers,
+    so the episodes differ but the distributions of blue wins, draws and red wins should not.
+
+    :param env: headless GameEnvironment playing ctf with the custom controllers for both teams and no
+    termination policy (the batched games always run for max_episode_length).
+    :param evaluation_eps: number of episodes played by each engine.
+    :param n_envs: number of games the batched engine runs at once.
+    :param seed: base seed of both engines.
+    :return: dictionary with "scalar" and "batched" ndarrays of the fractions of (blue wins, draws, red wins) and
+    "p_value" of a chi-squared test that both come from the same distribution.
+    """
+    from scipy.stats import chi2_contingency
+    from algorithms.custom.batched_policies import BatchedCustomPolicy
+    for team in (env.red_team, env.blue_team):
+        if team is None or team.controller.controller_type != 'custom':
+            raise Exception("Both teams need the custom controllers")
+    if env.termination_policy is not None:
+        raise Exception("The batched environment does not support termination policies")
+
+    scalar = []
+    for episode in range(evaluation_eps):
+        red_score, blue_score, _, _ = env.run_ctf_episode(episode, seed)
+        scalar.append(np.sign(red_score - blue_score))
+
+    batched_env = BatchedGameEnvironment(env, n_envs, seed)
+    batched = batched_env.evaluate_ctf(BatchedCustomPolicy(batched_env, 'red'),
+                                       BatchedCustomPolicy(batched_env, 'blue'), evaluation_eps)
+
+    counts = np.array([[np.sum(np.asarray(scores) == outcome) for outcome in (-1, 0, 1)]
+                       for scores in (scalar, batched)])
+    observed = counts[:, counts.sum(axis=0) > 0]
+    p_value = chi2_contingency(observed)[1] if observed.shape[1] > 1 else 1.0
+    fractions = counts / evaluation_eps
+    print("Scalar: B %d - %d - %d R" % tuple(counts[0]))
+    print("Batched: B %d - %d - %d R" % tuple(counts[1]))
+    print("Same distribution p-value: %f" % p_value)
+    return {"scalar": fractions[0], "batched": fractions[1], "p_value": float(p_value)}
@@ -11,9 +11,10 @@ University of Adelaide.
 """
 
 import numpy as np
-from matplotlib.patches import Wedge
-from environment.entities.entities import Entities
-from sensors.sensor import Sensor
+from environment.entities.entities import Entities, StateField
+from sensors.sensor import Sensor, OBSERVATION_FEATURES
+from utils.kinematics import constant_speed_turn
+from utils.spatial_hash import PROXIMITY_TOLERANCE
 
 from algorithms.controller import Controller
 from algorithms.custom.custom_controllerR import CustomControllerR
@@ -21,7 +22,12 @@ from algorithms.custom.custom_controllerB import CustomControllerB
 
 
 class Agents(Entities):
-    def __init__(self, env, team_var, placement_bounds, azimuth, team_flags):
+    state_fields = Entities.state_fields + ('has_flag', 'alive', 'is_tagged')
+    has_flag = StateField()
+    alive = StateField()
+    is_tagged = StateField()
+
+    def __init__(self, env, team_var, placement_bounds, azimuth, team_flags, rng=None):
         """Represents the agents in the game.
 
         :param env: the environment the agents are in.
@@ -29,6 +35,7 @@ class Agents(Entities):
         :param placement_bounds: bounds where agents can be placed.
         :param azimuth: azimuth of the agents.
         :param team_flags: flags of the team (used in placement).
+        :param rng: numpy Generator used for placement.
         """
 
         self.env = env
@@ -38,9 +45,12 @@ class Agents(Entities):
         super().__init__(n=team_var["n_agents"], initial_azimuth=azimuth, speed=team_var["speed"],
                          acceleration_limit=team_var["acceleration_limit"],
                          placement_choice=team_var["placement_choice"],
-                         placement_bounds=placement_bounds, color=team_var["color"])
+                         placement_bounds=placement_bounds, color=team_var["color"], rng=rng)
 
-        self.sensor, self.controller = self._add_controller_scanner(env, team_var["control"], team_var["action_set"])
+        self.sensor, self.controller = self._add_controller_scanner(env, team_var["control"], team_var["action_set"],
+                                                                    team_var.get("observation_features",
+                                                                                 OBSERVATION_FEATURES),
+                                                                    team_var.get("model"))
 
         self.do_dwta = False
         self.dwta_update = 5
@@ -51,24 +61,18 @@ class Agents(Entities):
         self.has_flag = np.zeros(self.n)  # If any of the drones have the flag
         self.alive = np.ones(self.n)  # Keeps track if drones are alive or dead
         self.is_tagged = np.zeros(self.n)
+        self.moves = 0  # Counts the changes of positions (used to know when the spatial index is out of date)
 
         self.kill_distance = 4.0
         #self.tag_distance = 4.0
 
-        # Specify the graphics of the drone
-        self.half_arc =20.0  # wedge is defined by 40 degree arc (for drawing)
-        for drone_idx in range(self.n):
-            ori_deg = self.azimuths[drone_idx] * 180.0 / np.pi + 180.0  # rad to deg
-            theta1 = ori_deg - self.half_arc
-            theta2 = ori_deg + self.half_arc
-            self.graphics.append(Wedge(center=(self.positions[drone_idx]), r=self.radius,
-                                       theta1=theta1, theta2=theta2, color=self.color))
-
-    def _add_controller_scanner(self, env, control_algorithm, action_set):
+    def _add_controller_scanner(self, env, control_algorithm, action_set, observation_features, model_config=None):
         """Generates a controller and sensor based on algorithm.
 
         :param env: environment under consideration.
         :param control_algorithm: algorithm to control the agents.
+        :param observation_features: groups of features the sensor observes (see Sensor.get_observations).
+        :param model_config: keyword arguments of the controller's model (see Controller).
         :return: sensor, controller objects,
         """
         if self.color == 'red':
@@ -85,13 +89,17 @@ class Agents(Entities):
             raise Exception("Invalid team color")
 
         if control_algorithm == 'custom':
-            sensor = Sensor(env=env, team_color=self.color)
+            sensor = Sensor(env=env, team_color=self.color, observation_features=observation_features)
             if self.color == 'blue':
                 controller = CustomControllerB(goal=self.goal, team=self, sensor=sensor)
             elif self.color == 'red':
                 controller = CustomControllerR(goal=self.goal, team=self, sensor=sensor)
             else:
                 raise Exception("Invalid team color")
+        elif control_algorithm in ('nn', 'remote'):
+            sensor = Sensor(env=env, team_color=self.color, observation_features=observation_features)
+            controller = Controller(goal=self.goal, team=self, sensor=sensor, action_set=action_set,
+                                    controller_type=control_algorithm, model_config=model_config)
         else:
             raise Exception("Control Algorithm not implemented.")
         return sensor, controller
@@ -123,6 +131,7 @@ class Agents(Entities):
         """
 
         self.positions = self.get_initial_positions()
+        self.moves += 1
         self.azimuths = self.get_initial_azimuths()
         self.velocities = self.get_initial_velocities()
         self.accelerations = self.get_initial_accelerations()
@@ -132,9 +141,6 @@ class Agents(Entities):
 
         if self.controller is not None:
             self.controller.reset()
-        for idx in range(self.n):
-            self.graphics[idx].set_color(self.color)
-            self.graphics[idx].set_alpha(1)
 
     def get_initial_positions(self):
         """Resets the position of the entities.
@@ -215,9 +221,33 @@ class Agents(Entities):
         # Update positions
         self.positions[idx][0] = new_x_pos
         self.positions[idx][1] = new_y_pos
+        self.moves += 1
 
         self.azimuths[idx] = np.arctan2(self.velocities[idx][1], self.velocities[idx][0])
 
+    def apply_accelerations(self, accelerations, delta_time):
+        """Applies an instantaneous constant acceleration for delta_time to every agent in the team at once. This
+        gives the same result as calling apply_acceleration for each agent (to within 1e-9, see
+        utils.kinematics.constant_speed_turn). Dead agents are left where kill has parked them.
+
+        :param accelerations: ndarray (n, 2) of acceleration commands.
+        :param delta_time: how long to apply acceleration for.
+        :return: none
+        """
+        active = self.alive.astype(bool)
+        if not active.any():
+            return
+
+        positions, velocities, accelerations, azimuths = constant_speed_turn(
+            self.positions[active], self.azimuths[active], np.asarray(accelerations)[active], self.speed,
+            self.acceleration_limit, delta_time)
+
+        self.positions[active] = positions
+        self.moves += 1
+        self.velocities[active] = velocities
+        self.accelerations[active] = accelerations
+        self.azimuths[active] = azimuths
+
     def kill(self, agent_idx):
         """This kills one of the agents.
 
@@ -228,8 +258,7 @@ class Agents(Entities):
         # Setting positions to large number to effectively remove from game
         self.positions[agent_idx][0] = float(10 ** 6)
         self.positions[agent_idx][1] = float(10 ** 6)
-        self.graphics[agent_idx].set_color("white")
-        self.graphics[agent_idx].set_alpha(0)
+        self.moves += 1
 
     def apply_tag(self, agent_idx):
         """Apply a tag to an agent.
@@ -238,7 +267,6 @@ class Agents(Entities):
         :return: None
         """
         self.is_tagged[agent_idx] = True
-        self.graphics[agent_idx].set_alpha(0.2)
 
     def untag(self, agent_idx):
         """Untag an agent.
@@ -247,7 +275,6 @@ class Agents(Entities):
         :return: None.
         """
         self.is_tagged[agent_idx] = False
-        self.graphics[agent_idx].set_alpha(1)
 
     def attempt_to_capture_the_flag(self, agent_idx):
         """Attempt to capture the flag.
@@ -310,7 +337,11 @@ class Agents(Entities):
 
         :return: none
         """
-        for agent_idx in range(self.n):
+        # Only agents the spatial index finds within kill distance of their target can kill it
+        grid = self.env.get_spatial_index(self.sensor.enemy_team)
+        agent_indices, enemy_indices, _ = grid.query_pairs(self.positions, self.kill_distance + PROXIMITY_TOLERANCE)
+        targeted = enemy_indices == self.controller.target_idx[agent_indices]
+        for agent_idx in np.unique(agent_indices[targeted]):
             if self.alive[agent_idx]:
                 #if type(self.controller.target) is Flags:
                 #    self.attempt_to_capture_the_flag(agent_idx)
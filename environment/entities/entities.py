@@ -14,9 +14,42 @@ import numpy as np
 from scipy.spatial.distance import cdist
 
 
+class StateField:
+    def __init__(self):
+        """An array attribute of an entity that can live inside a shared WorldState buffer. Assigning to the
+        attribute copies the new values into the existing array (so views held by a WorldState stay valid) unless
+        the shape changes, in which case a new array is bound.
+        """
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = '_' + name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return obj.__dict__.get(self.name)
+
+    def __set__(self, obj, value):
+        current = obj.__dict__.get(self.name)
+        if current is not None and value is not None and current.shape == np.shape(value):
+            current[...] = value
+        elif obj.__dict__.get('world_state') is not None:
+            raise Exception("Can't change the shape of %s since it is part of the world state." % self.name[1:])
+        else:
+            obj.__dict__[self.name] = None if value is None else np.array(value, dtype=np.double)
+
+
 class Entities:
+    # Array attributes that make up the state of the entities (see environment/world_state.py)
+    state_fields = ('positions', 'velocities', 'accelerations', 'azimuths')
+    positions = StateField()
+    velocities = StateField()
+    accelerations = StateField()
+    azimuths = StateField()
+
     def __init__(self, n, placement_choice, placement_bounds, acceleration_limit=0,
-                 initial_azimuth=0, speed=0, radius=1, color='black'):
+                 initial_azimuth=0, speed=0, radius=1, color='black', rng=None):
         """Entities in the game.
 
         :param n: Number of entities.
@@ -27,10 +60,14 @@ class Entities:
         :param speed: speed fo the entity.
         :param radius: size of entity.
         :param color: color of entity.
+        :param rng: numpy Generator used for placement (the environment replaces it when seeded).
         """
         # Number of entities
         self.n = n
 
+        # Random number generator used for placement
+        self.rng = rng if rng is not None else np.random.default_rng()
+
         # Placement considerations
         self.min_placement_distance = 4.0 * radius
         self.placement_choice = placement_choice
@@ -50,9 +87,22 @@ class Entities:
         # Angles
         self.azimuths = self.get_initial_azimuths()
 
-        # Graphics
+        # Color of the entities (drawing is done by environment/renderer.py)
         self.color = color
-        self.graphics = []
+
+        # Set when the state fields are attached to a WorldState buffer
+        self.world_state = None
+
+    def bind_state_field(self, field, view, world_state):
+        """Makes a state field a view into a WorldState buffer.
+
+        :param field: name of the state field.
+        :param view: ndarray view into the world state buffer (already holding the current values).
+        :param world_state: the WorldState the view belongs to.
+        :return: none
+        """
+        self.__dict__['_' + field] = view
+        self.world_state = world_state
 
     def reset(self):
         """Reset the characteristics of the entities. This should be individually specified for each entity.
@@ -106,12 +156,12 @@ class Entities:
 
         :return: ndarray of positions of entities.
         """
-        return np.random.uniform(self.placement_bounds[:, 0], self.placement_bounds[:, 1],  size=(self.n, 2))
+        return self.rng.uniform(self.placement_bounds[:, 0], self.placement_bounds[:, 1],  size=(self.n, 2))
 
     def randomise_same_pos(self):
         """Places all entities randomly within some bounds at the same location."""
-        x = np.random.uniform(self.placement_bounds[0, 0], self.placement_bounds[0, 1])
-        y = np.random.uniform(self.placement_bounds[1, 0], self.placement_bounds[1, 1])
+        x = self.rng.uniform(self.placement_bounds[0, 0], self.placement_bounds[0, 1])
+        y = self.rng.uniform(self.placement_bounds[1, 0], self.placement_bounds[1, 1])
         return np.array([[x, y]] * self.n)
 
     # noinspection PyArgumentList
@@ -123,8 +173,8 @@ class Entities:
         i = 0
         positions = np.array([])
         while len(positions) < self.n:
-            x = np.random.uniform(self.placement_bounds[0, 0], self.placement_bounds[0, 1])
-            y = np.random.uniform(self.placement_bounds[1, 0], self.placement_bounds[1, 1])
+            x = self.rng.uniform(self.placement_bounds[0, 0], self.placement_bounds[0, 1])
+            y = self.rng.uniform(self.placement_bounds[1, 0], self.placement_bounds[1, 1])
 
             if len(positions) > 0:
                 dist = cdist(np.array([[x, y]]), positions).min()
@@ -10,35 +10,29 @@ in Capture the Flag game" for the Advanced Topics in Computer Science course at
 University of Adelaide.
 """
 
-from matplotlib.patches import Circle
-from environment.entities.entities import Entities
+from environment.entities.entities import Entities, StateField
 import numpy as np
 
 
 class Flags(Entities):
-    def __init__(self, n_flags, bounds, color='blue'):
+    state_fields = Entities.state_fields + ('is_captured',)
+    is_captured = StateField()
+
+    def __init__(self, n_flags, bounds, color='blue', rng=None):
         """Represents the flags in the environment.
 
         :param n_flags: Number of flags in the game
         :param bounds: bounds for placement[[x_min, x_max], [y_min, y_max]]
         :param color: color of the flags.
+        :param rng: numpy Generator used for placement.
         """
-        super().__init__(n=n_flags, placement_choice="random_constraint", placement_bounds=bounds, color=color)
+        super().__init__(n=n_flags, placement_choice="random_constraint", placement_bounds=bounds, color=color,
+                         rng=rng)
 
         # Capture info
         self.is_captured = np.zeros(self.n)  # start not captured
         self.capture_distance = 10  # how close does an entity have to be to capture
 
-        # Set up the graphics
-        for flag_idx in range(self.n):
-            self.graphics.append(Circle((self.positions[flag_idx]), self.radius, color=self.color))
-
-        # Showing the capture circle
-        self.outer_circle = []
-        for flag_idx in range(self.n):
-            self.outer_circle.append(Circle((self.positions[flag_idx]), self.capture_distance, color=self.color,
-                                            fill=False, linestyle='--'))
-
     def reset(self):
         """Reset the characteristics of the flags.
 
@@ -47,8 +41,6 @@ class Flags(Entities):
         self.positions = self.get_initial_positions()
 
         self.is_captured = np.zeros(self.n)
-        for graphic in self.graphics:
-            graphic.set_alpha(1)
 
     def capture_flag(self, flag_idx):
         """Capture a flag.
@@ -57,7 +49,6 @@ class Flags(Entities):
         :return: none
         """
         self.is_captured[flag_idx] = True
-        self.graphics[flag_idx].set_alpha(0.2)
 
     def drop_flag(self, flag_idx):
         """Drop a flag.
@@ -66,7 +57,6 @@ class Flags(Entities):
         :return: none
         """
         self.is_captured[flag_idx] = False
-        self.graphics[flag_idx].set_alpha(1)
 
     def attempt_capture(self, agent_position, flag_idx):
         """Can capture the flag if on same spot
@@ -10,18 +10,47 @@ in Capture the Flag game" for the Advanced Topics in Computer Science course at
 University of Adelaide.
 """
 import numpy as np
-import matplotlib.pyplot as plt
 import actions.high_level_actions as hla
 from scipy.spatial.distance import cdist
 from scipy.stats import median_absolute_deviation
 from environment.entities.agents import Agents
 from environment.entities.flags import Flags
 from environment.entities.obstacles import Obstacles
+from environment.world_state import WorldState
+from environment.world_queries import WorldQueries
+from utils.spatial_hash import SpatialHashGrid, PROXIMITY_TOLERANCE
+from utils.utils import make_rngs
 import math
 
 
+# Keys of the dictionary returned by GameEnvironment.get_environment_state and the world state fields they hold.
+ENVIRONMENT_STATE_KEYS = [("red_team_positions", "red_team_positions"),
+                          ("red_team_velocities", "red_team_velocities"),
+                          ("red_team_azimuths", "red_team_azimuths"),
+                          ("red_team_accelerations", "red_team_accelerations"),
+                          ("red_team_has_flag", "red_team_has_flag"),
+                          ("red_team_alive", "red_team_alive"),
+                          ("red_team_tag", "red_team_is_tagged"),
+                          ("red_team_flag_positions", "red_team_flag_positions"),
+                          ("red_team_flag_is_captured", "red_team_flag_is_captured"),
+                          ("blue_team_positions", "blue_team_positions"),
+                          ("blue_team_velocities", "blue_team_velocities"),
+                          ("blue_team_azimuths", "blue_team_azimuths"),
+                          ("blue_team_accelerations", "blue_team_accelerations"),
+                          ("blue_team_has_flag", "blue_team_has_flag"),
+                          ("blue_team_alive", "blue_team_alive"),
+                          ("blue_team_tag", "blue_team_is_tagged"),
+                          ("blue_team_flag_positions", "blue_team_flag_positions"),
+                          ("blue_team_flag_is_captured", "blue_team_flag_is_captured")]
+
+# Names of the independent random number streams spawned from the environment seed (see GameEnvironment.seed).
+RNG_STREAMS = ("environment", "red_team", "red_team_flag", "blue_team", "blue_team_flag", "obstacles",
+               "red_controller", "blue_controller", "red_training", "blue_training")
+
+
 class GameEnvironment:
-    def __init__(self, game_rules, red_team_var, blue_team_var, generate_graphics=True, randomise=False):
+    def __init__(self, game_rules, red_team_var, blue_team_var, generate_graphics=True, randomise=False,
+                 termination_policy=None, seed=None, render_mode='patches'):
         """In this environment there are a number of blue agents, red agents, blue flags, red flags and obstacles. The
         game played can be customised.
 
@@ -30,6 +59,16 @@ class GameEnvironment:
         prevent this.
         In the ctf game both sides have a flag and are attempting to capture their opponents flag and bring it to their
         home base.
+
+        By default an episode runs for max_episode_length time steps. A termination_policy (see
+        environment/termination.py) can end episodes early once the result is decided.
+
+        All randomness comes from numpy Generators spawned from seed (an int, a SeedSequence or None for fresh
+        entropy), one stream per entity set, controller and training interface. See seed().
+
+        render_mode selects how the game is drawn: 'patches' draws every agent as its own labelled wedge and 'blit'
+        draws each team as one collection and redraws only the moving artists, which is much faster with many agents
+        (see environment/renderer.py).
         """
         # Difficulty 1: Naive red team - Defender loops circles
         # Difficulty 2: Red defender intercepts first blue agent in "enemies_in_territory" array
@@ -40,6 +79,15 @@ class GameEnvironment:
 
         self.rules = game_rules
         self.randomise = randomise
+        self.termination_policy = termination_policy
+
+        # Random number streams (attached to the entities and controllers once they exist)
+        self.rngs = make_rngs(seed, RNG_STREAMS)
+        self.rng = self.rngs["environment"]
+
+        # Used to build headless copies of this environment in worker processes
+        self.init_args = {"game_rules": game_rules, "red_team_var": red_team_var, "blue_team_var": blue_team_var,
+                          "randomise": randomise, "termination_policy": termination_policy}
 
         # Define the boundaries of the game and placement bounds [[x_min, x_max],[y_min, y_max]]
         self.game_boundary = np.array([[0.0, 160.0], [0.0, 80.0]])
@@ -70,15 +118,10 @@ class GameEnvironment:
         self.blue_score = 0
 
         # Graphics needs to be optional for algorithms that create multiple copies of the environment in training!
+        # The renderer (and matplotlib) is only created the first time the environment is drawn.
         self.generate_graphics = generate_graphics
-        if self.generate_graphics:
-            self.fig, self.ax = plt.subplots()
-            plt.axis([self.game_boundary[0, 0], self.game_boundary[0, 1],
-                      self.game_boundary[1, 0], self.game_boundary[1, 1]])
-            plt.gca().set_aspect('equal', adjustable='box')
-        else:
-            self.fig = None
-            self.ax = None
+        self.render_mode = render_mode
+        self.renderer = None
 
         # How often to make decisions for blue and red
         self.time_step = 0
@@ -112,13 +155,15 @@ class GameEnvironment:
 
         # Blue Flags
         if self.n_blue_flags > 0:
-            self.blue_flags = Flags(n_flags=self.n_blue_flags, bounds=self.blue_flags_bounds, color='blue')
+            self.blue_flags = Flags(n_flags=self.n_blue_flags, bounds=self.blue_flags_bounds, color='blue',
+                                    rng=self.rngs["blue_team_flag"])
         else:
             self.blue_flags = None
 
         # Red flags
         if self.n_red_flags > 0:
-            self.red_flags = Flags(n_flags=self.n_red_flags, bounds=self.red_flags_bounds, color='red')
+            self.red_flags = Flags(n_flags=self.n_red_flags, bounds=self.red_flags_bounds, color='red',
+                                   rng=self.rngs["red_team_flag"])
         else:
             self.red_flags = None
 
@@ -126,21 +171,23 @@ class GameEnvironment:
         self.n_obstacles = 0
         if self.n_obstacles > 0:
             self.obstacles = Obstacles(n_obstacles=self.n_obstacles, bounds=self.obstacle_bounds, radius=5,
-                                       color='black')
+                                       color='black', rng=self.rngs["obstacles"])
         else:
             self.obstacles = None
 
         # Blue agents
         if self.n_blue_agents > 0:
             self.blue_team = Agents(env=self, team_var=blue_team_var, placement_bounds=self.blue_agents_bounds,
-                                    azimuth=self.initial_blue_orientation, team_flags=self.blue_flags)
+                                    azimuth=self.initial_blue_orientation, team_flags=self.blue_flags,
+                                    rng=self.rngs["blue_team"])
         else:
             self.blue_team = None
 
         # Red agents
         if self.n_red_agents > 0:
             self.red_team = Agents(env=self, team_var=red_team_var, placement_bounds=self.red_agents_bounds,
-                                   azimuth=self.initial_red_orientation, team_flags=self.red_flags)
+                                   azimuth=self.initial_red_orientation, team_flags=self.red_flags,
+                                   rng=self.rngs["red_team"])
         else:
             self.red_team = None
 
@@ -149,6 +196,12 @@ class GameEnvironment:
             self.red_team.sensor.initialise_sensor_functions()
         if self.n_blue_agents > 0:
             self.blue_team.sensor.initialise_sensor_functions()
+        self._attach_rngs()
+
+        # All entity state lives in one buffer
+        self.world_state = WorldState([("red_team", self.red_team), ("red_team_flag", self.red_flags),
+                                       ("blue_team", self.blue_team), ("blue_team_flag", self.blue_flags),
+                                       ("obstacles", self.obstacles)])
 
         # Collision Detection
         self.collision_safety_dist = 1  # extra factor for safety
@@ -158,105 +211,64 @@ class GameEnvironment:
         else:
             self.obstacle_collision_dist = None
 
-        self.blue_team_override = [False] * self.n_blue_agents
-        self.red_team_override = [False] * self.n_red_agents
+        self.blue_team_override = np.zeros(self.n_blue_agents, bool)
+        self.red_team_override = np.zeros(self.n_red_agents, bool)
 
-        self.red_text = []
-        self.blue_text = []
-        if generate_graphics:
-            if self.n_blue_agents > 0:
-                for blue_idx, blue_agent_graphics in enumerate(self.blue_team.graphics):
-                    self.ax.add_patch(blue_agent_graphics)
-                    blue_text_string = "Agent %s" % blue_idx
-                    self.blue_text.append(plt.text(x=self.blue_team.positions[blue_idx, 0],
-                                                   y=self.blue_team.positions[blue_idx, 1], s=blue_text_string,
-                                                   color='blue', fontsize=6))
+        # Spatial index of each team's positions used for the tag, untag, kill and flag proximity checks. Cells are as
+        # wide as the largest of those distances so that every query only looks at the neighbouring cells.
+        self.spatial_index = {}
+        capture_distances = [flags.capture_distance for flags in (self.red_flags, self.blue_flags) if flags is not None]
+        for team in (self.red_team, self.blue_team):
+            if team is not None:
+                self.spatial_index[team.color] = SpatialHashGrid(cell_size=max([team.kill_distance] +
+                                                                                capture_distances))
 
-            if self.n_red_agents > 0:
-                for red_idx, red_agent_graphics in enumerate(self.red_team.graphics):
-                    self.ax.add_patch(red_agent_graphics)
-                    red_text_string = "Agent %s" % red_idx
-                    self.red_text.append(plt.text(x=self.red_team.positions[red_idx, 0],
-                                                  y=self.red_team.positions[red_idx, 1], s=red_text_string,
-                                                  color='red', fontsize=6))
-
-            if self.n_red_flags > 0:
-                for red_flag_graphics in self.red_flags.graphics:
-                    self.ax.add_patch(red_flag_graphics)
-                for red_flag_outer_circle in self.red_flags.outer_circle:
-                    self.ax.add_patch(red_flag_outer_circle)
-
-            if self.n_blue_flags > 0:
-                for blue_flag_graphics in self.blue_flags.graphics:
-                    self.ax.add_patch(blue_flag_graphics)
-                for blue_flag_outer_circle in self.blue_flags.outer_circle:
-                    self.ax.add_patch(blue_flag_outer_circle)
-
-            if self.n_obstacles > 0:
-                for obstacle_graphics in self.obstacles.graphics:
-                    self.ax.add_patch(obstacle_graphics)
-            plt.vlines(x=80, ymin=0, ymax=80, colors='black', linestyles='--')
-
-        if generate_graphics:
-            if self.n_blue_agents > 0:
-                for blue_agent_graphics in self.blue_team.graphics:
-                    self.ax.add_patch(blue_agent_graphics)
+        # Distances, territory masks and targets shared by the controllers, computed at most once per time step
+        self.world_queries = WorldQueries(self)
 
-            if self.n_red_agents > 0:
-                for red_agent_graphics in self.red_team.graphics:
-                    self.ax.add_patch(red_agent_graphics)
+    def seed(self, seed=None):
+        """Reseeds every random number stream of the environment. The same seed always reproduces the same
+        episodes and different seeds (e.g. SeedSequence([base_seed, episode])) give independent streams.
 
-            if self.n_red_flags > 0:
-                for red_flag_graphics in self.red_flags.graphics:
-                    self.ax.add_patch(red_flag_graphics)
+        :param seed: int, SeedSequence or None (fresh entropy).
+        :return: None.
+        """
+        self.rngs = make_rngs(seed, RNG_STREAMS)
+        self.rng = self.rngs["environment"]
+        self._attach_rngs()
 
-            if self.n_blue_flags > 0:
-                for blue_flag_graphics in self.blue_flags.graphics:
-                    self.ax.add_patch(blue_flag_graphics)
+    def _attach_rngs(self):
+        """Hands the random number streams to the entities, controllers and training interfaces.
 
-            if self. n_obstacles > 0:
-                for obstacle_graphics in self.obstacles.graphics:
-                    self.ax.add_patch(obstacle_graphics)
+        :return: None.
+        """
+        for prefix, entity in (("red_team", self.red_team), ("red_team_flag", self.red_flags),
+                               ("blue_team", self.blue_team), ("blue_team_flag", self.blue_flags),
+                               ("obstacles", self.obstacles)):
+            if entity is not None:
+                entity.rng = self.rngs[prefix]
+        for team in (self.red_team, self.blue_team):
+            if team is not None:
+                team.controller.rng = self.rngs[team.color + "_controller"]
+                if team.controller.training_env is not None:
+                    team.controller.training_env.rng = self.rngs[team.color + "_training"]
 
     def get_environment_state(self):
-        """Returns the current state of the environment.
+        """Returns the current state of the environment. The arrays are views into a single copy of the world state
+        buffer.
 
         :return: dictionary containing the state of the environment.
         """
+        views = self.world_state.views(self.world_state.snapshot())
+        return {key: views[name] for key, name in ENVIRONMENT_STATE_KEYS if name in views}
 
-        if self.red_flags is None and self.blue_team is None:
-            return {"red_team_positions": self.red_team.positions.copy(),
-                    "red_team_velocities": self.red_team.velocities.copy(),
-                    "red_team_azimuths": self.red_team.azimuths.copy(),
-                    "red_team_accelerations": self.red_team.accelerations.copy(),
-                    "red_team_has_flag": self.red_team.has_flag.copy(),
-                    "red_team_alive": self.red_team.alive.copy(),
-                    "red_team_tag": self.red_team.is_tagged.copy(),
-
-                    "blue_team_flag_positions": self.blue_flags.positions.copy(),
-                    "blue_team_flag_is_captured": self.blue_flags.is_captured.copy()}
-        else:
-            return {"red_team_positions": self.red_team.positions.copy(),
-                    "red_team_velocities": self.red_team.velocities.copy(),
-                    "red_team_azimuths": self.red_team.azimuths.copy(),
-                    "red_team_accelerations": self.red_team.accelerations.copy(),
-                    "red_team_has_flag": self.red_team.has_flag.copy(),
-                    "red_team_alive": self.red_team.alive.copy(),
-                    "red_team_tag": self.red_team.is_tagged.copy(),
-
-                    "red_team_flag_positions": self.red_flags.positions.copy(),
-                    "red_team_flag_is_captured": self.red_flags.is_captured.copy(),
-
-                    "blue_team_positions": self.blue_team.positions.copy(),
-                    "blue_team_velocities": self.blue_team.velocities.copy(),
-                    "blue_team_azimuths": self.blue_team.azimuths.copy(),
-                    "blue_team_accelerations": self.blue_team.accelerations.copy(),
-                    "blue_team_has_flag": self.blue_team.has_flag.copy(),
-                    "blue_team_alive": self.blue_team.alive.copy(),
-                    "blue_team_tag": self.blue_team.is_tagged.copy(),
-
-                    "blue_team_flag_positions": self.blue_flags.positions.copy(),
-                    "blue_team_flag_is_captured": self.blue_flags.is_captured.copy()}
+    def get_environment_state_view(self):
+        """Returns read-only views of the live state of the environment (no copy is made). The values change as the
+        environment is updated.
+
+        :return: dictionary of world state field name to ndarray view.
+        """
+        return self.world_state.views(writeable=False)
 
     def set_environment_state(self, state):
         """Sets the environment to a specified state.
@@ -264,70 +276,58 @@ class GameEnvironment:
         :param state: A dictionary containing the desired state of the environment.
         :return: None
         """
+        for key, name in ENVIRONMENT_STATE_KEYS:
+            if key in state:
+                self.world_state.view(name)[...] = state[key]
+        self.world_queries.invalidate()
 
-        if self.red_flags is None and self.blue_team is None:
-            self.red_team.positions = state["red_team_positions"]
-            self.red_team.velocities = state["red_team_velocities"]
-            self.red_team.azimuths = state["red_team_azimuths"]
-            self.red_team.accelerations = state["red_team_accelerations"]
-            self.red_team.has_flag = state["red_team_has_flag"]
-            self.red_team.alive = state["red_team_alive"]
-            self.red_team.is_tagged = state["red_team_tag"]
-
-            self.blue_flags.positions = state["blue_team_flag_positions"]
-            self.blue_flags.is_captured = state["blue_team_flag_is_captured"]
-
-        else:
-            self.red_team.positions = state["red_team_positions"]
-            self.red_team.velocities = state["red_team_velocities"]
-            self.red_team.azimuths = state["red_team_azimuths"]
-            self.red_team.accelerations = state["red_team_accelerations"]
-            self.red_team.has_flag = state["red_team_has_flag"]
-            self.red_team.alive = state["red_team_alive"]
-            self.red_team.is_tagged = state["red_team_tag"]
-
-            self.red_flags.positions = state["red_team_flag_positions"]
-            self.red_flags.is_captured = state["red_team_flag_is_captured"]
-
-            self.blue_team.positions = state["blue_team_positions"]
-            self.blue_team.velocities = state["blue_team_velocities"]
-            self.blue_team.azimuths = state["blue_team_azimuths"]
-            self.blue_team.accelerations = state["blue_team_accelerations"]
-            self.blue_team.has_flag = state["blue_team_has_flag"]
-            self.blue_team.alive = state["blue_team_alive"]
-            self.blue_team.is_tagged = state["blue_team_tag"]
-
-            self.blue_flags.positions = state["blue_team_flag_positions"]
-            self.blue_flags.is_captured = state["blue_team_flag_is_captured"]
-
-    def reset_env(self):
+    def reset_env(self, start_state=None):
         """Reset the environment.
 
+        :param start_state: optional snapshot of the world state (see WorldState.snapshot and
+        environment/start_state_bank.py) to start from instead of placing the entities.
         :return: None.
         """
-        # Reset the blue flags
-        if self.blue_flags is not None:
-            self.blue_flags.reset()
+        if start_state is not None:
+            self.world_state.restore(start_state)
+            for team in (self.red_team, self.blue_team):
+                if team is not None and team.controller is not None:
+                    team.controller.reset()
+        else:
+            # Reset the blue flags
+            if self.blue_flags is not None:
+                self.blue_flags.reset()
 
-        # Reset the red flags
-        if self.red_flags is not None:
-            self.red_flags.reset()
+            # Reset the red flags
+            if self.red_flags is not None:
+                self.red_flags.reset()
 
-        # Reset the blue team
-        if self.blue_team is not None:
-            self.blue_team.reset()
+            # Reset the blue team
+            if self.blue_team is not None:
+                self.blue_team.reset()
 
-        # Reset the red team
-        if self.red_team is not None:
-            self.red_team.reset()
+            # Reset the red team
+            if self.red_team is not None:
+                self.red_team.reset()
 
-        # Reset the obstacles
-        if self.obstacles is not None:
-            self.obstacles.reset()
+            # Reset the obstacles
+            if self.obstacles is not None:
+                self.obstacles.reset()
 
         self.time_step = 0  # Reset timestep
         self.red_score = 0  # Reset red score
         self.blue_score = 0  # Reset blue score
+        self.world_queries.invalidate()
+
+        if self.termination_policy is not None:
+            self.termination_policy.reset(self)
+
+    def is_episode_done(self):
+        """Checks the termination policy to see if the episode can end before max_episode_length.
+
+        :return: True if the episode is over else False.
+        """
+        return self.termination_policy is not None and self.termination_policy.is_done(self)
 
     def run_ctf(self, should_render=False, store_data=True):
         """Run an instance of the capture the flag game.
@@ -352,6 +352,9 @@ class GameEnvironment:
             if store_data:
                 pass
 
+            if self.is_episode_done():
+                break
+
     def run_attack(self, should_render=False, store_data=True):
         """Run an instance of the attack_defend game.
 
@@ -372,7 +375,7 @@ class GameEnvironment:
                 pass
             self.update_environment()
 
-            if self.blue_flags.is_captured[0]:
+            if self.blue_flags.is_captured[0] or self.is_episode_done():
                 break
 
             if store_data:
@@ -398,35 +401,19 @@ class GameEnvironment:
         self.get_team_accelerations_simultaneous()
 
         # Apply red acceleration commands
-        for idx in range(self.n_red_agents):
-            self.red_team.apply_acceleration(idx, self.red_acceleration[idx], self.delta_time)
+        self.red_team.apply_accelerations(self.red_acceleration, self.delta_time)
 
         # Attempt to tag agents
         self.attempt_tag()
 
         # Apply blue acceleration commands
-        for idx in range(self.n_blue_agents):
-            self.blue_team.apply_acceleration(idx, self.blue_acceleration[idx], self.delta_time)
+        self.blue_team.apply_accelerations(self.blue_acceleration, self.delta_time)
 
         # Red (flag capture)
-        if self.blue_flags.is_captured[0]:
-            for agent_idx in range(self.n_red_agents):
-                deliver = self.red_team.attempt_to_deliver_flag(agent_idx)
-                if deliver:
-                    self.red_score += 1
-        else:
-            for agent_idx in range(self.n_red_agents):
-                self.red_team.attempt_to_capture_the_flag(agent_idx)
+        self.red_score += self.capture_or_deliver_flag(self.red_team, self.blue_flags)
 
         # Blue
-        if self.red_flags.is_captured[0]:
-            for agent_idx in range(self.n_blue_agents):
-                deliver = self.blue_team.attempt_to_deliver_flag(agent_idx)
-                if deliver:
-                    self.blue_score += 1
-        else:
-            for agent_idx in range(self.n_blue_agents):
-                self.blue_team.attempt_to_capture_the_flag(agent_idx)
+        self.blue_score += self.capture_or_deliver_flag(self.blue_team, self.red_flags)
 
         # red/blue attempt to tag blue/red
         self.attempt_tag()
@@ -447,11 +434,10 @@ class GameEnvironment:
             if self.time_step % self.red_time_step == 0:
                 self.red_acceleration = self.red_team.get_acceleration()
             # Override actions if tagged
-            self.red_team_override = [False] * self.red_team.n
-            for agent_idx in range(self.n_red_agents):
-                if self.red_team.is_tagged[agent_idx]:
-                    self.red_team_override[agent_idx] = True
-                    self.red_acceleration[agent_idx] = hla.go_to_base(self.red_team, self.red_flags, agent_idx, 0, self.delta_time)
+            np.not_equal(self.red_team.is_tagged, 0, out=self.red_team_override)
+            for agent_idx in np.flatnonzero(self.red_team_override):
+                self.red_acceleration[agent_idx] = hla.go_to_base(self.red_team, self.red_flags, agent_idx, 0,
+                                                                  self.delta_time)
         else:
             self.red_acceleration = None
 
@@ -460,11 +446,10 @@ class GameEnvironment:
             if self.time_step % self.blue_time_step == 0:
                 self.blue_acceleration = self.blue_team.get_acceleration()
             # Override actions if tagged
-            self.blue_team_override = [False] * self.blue_team.n
-            for agent_idx in range(self.n_blue_agents):
-                if self.blue_team.is_tagged[agent_idx]:
-                    self.blue_team_override[agent_idx] = True
-                    self.blue_acceleration[agent_idx] = hla.go_to_base(self.blue_team, self.blue_flags, agent_idx, 0, self.delta_time)
+            np.not_equal(self.blue_team.is_tagged, 0, out=self.blue_team_override)
+            for agent_idx in np.flatnonzero(self.blue_team_override):
+                self.blue_acceleration[agent_idx] = hla.go_to_base(self.blue_team, self.blue_flags, agent_idx, 0,
+                                                                   self.delta_time)
         else:
             self.blue_acceleration = None
 
@@ -475,13 +460,11 @@ class GameEnvironment:
         """
         if self.red_team is None or self.blue_team is None:
             return
-        dist = cdist(self.red_team.positions, self.blue_team.positions, metric='euclidean')
-        indices = np.where(dist < self.red_team.kill_distance)
-
-        for i in range(len(indices[0])):
-            red_idx = indices[0][i]
-            blue_idx = indices[1][i]
+        red_indices, blue_indices, dist = self.get_spatial_index(self.blue_team).query_pairs(
+            self.red_team.positions, self.red_team.kill_distance)
+        close = dist < self.red_team.kill_distance
 
+        for red_idx, blue_idx in zip(red_indices[close], blue_indices[close]):
             if self.in_red_territory(self.red_team, red_idx) and self.in_red_territory(self.blue_team, blue_idx):
                 self.blue_team.apply_tag(blue_idx)
                 # If tagged then drop flag
@@ -502,21 +485,55 @@ class GameEnvironment:
         :return: None
         """
         if self.red_team is not None:
-            dist = cdist(self.red_team.positions, self.red_flags.positions, metric='euclidean')
-            indices = np.where(dist < self.red_flags.capture_distance)
+            _, red_indices, dist = self.get_spatial_index(self.red_team).query_pairs(
+                self.red_flags.positions, self.red_flags.capture_distance)
 
-            for i in range(len(indices[0])):
-                red_idx = indices[0][i]
+            for red_idx in red_indices[dist < self.red_flags.capture_distance]:
                 self.red_team.untag(red_idx)
 
         if self.blue_team is not None:
-            dist = cdist(self.blue_team.positions, self.blue_flags.positions, metric='euclidean')
-            indices = np.where(dist < self.blue_flags.capture_distance)
+            _, blue_indices, dist = self.get_spatial_index(self.blue_team).query_pairs(
+                self.blue_flags.positions, self.blue_flags.capture_distance)
 
-            for i in range(len(indices[0])):
-                blue_idx = indices[0][i]
+            for blue_idx in blue_indices[dist < self.blue_flags.capture_distance]:
                 self.blue_team.untag(blue_idx)
 
+    def get_spatial_index(self, team):
+        """Get the spatial index of a team's positions. It is updated if the team has moved (see Agents.moves) or the
+        world has been invalidated (see WorldQueries.invalidate) since it was last used.
+
+        :param team: Agents object.
+        :return: SpatialHashGrid object.
+        """
+        grid = self.spatial_index[team.color]
+        grid.update(team.positions, (team.moves, self.world_queries.generation))
+        return grid
+
+    def capture_or_deliver_flag(self, team, enemy_flags):
+        """If the enemy flag is held the team attempts to deliver it to their own flag, otherwise the team attempts to
+        capture the enemy flag. Only the agents the spatial index finds within capture distance are checked (in agent
+        order, with the exact checks done by the agents).
+
+        :param team: Agents object.
+        :param enemy_flags: the flags the team is trying to capture.
+        :return: number of flags delivered.
+        """
+        grid = self.get_spatial_index(team)
+        delivered = 0
+        if enemy_flags.is_captured[0]:
+            _, candidates, _ = grid.query_pairs(team.team_flags.positions[:1],
+                                                team.team_flags.capture_distance + PROXIMITY_TOLERANCE)
+            for agent_idx in candidates:
+                if team.attempt_to_deliver_flag(agent_idx):
+                    delivered += 1
+        else:
+            flag_indices, candidates, _ = grid.query_pairs(enemy_flags.positions,
+                                                           enemy_flags.capture_distance + PROXIMITY_TOLERANCE)
+            targeted = flag_indices == team.controller.target_idx[candidates]
+            for agent_idx in np.unique(candidates[targeted]):
+                team.attempt_to_capture_the_flag(agent_idx)
+        return delivered
+
     def has_left_boundary(self, team, agent_idx):
         """Checks if the agent has left the boundary.
 
@@ -533,23 +550,7 @@ class GameEnvironment:
         :param team: red or blue.
         :return: list of enemies (enemy index) in the territory.
         """
-
-        idxholder = 0
-
-
-        if team.color == 'red':
-            for enemy_idx in range(self.n_blue_agents):
-                if self.blue_team.has_flag[enemy_idx]:
-                    idxholder = enemy_idx
-
-
-        else:
-            for enemy_idx in range(self.n_red_agents):
-                if self.in_blue_territory(self.red_team, enemy_idx):
-                    if self.red_team.has_flag[enemy_idx]:
-                        idxholder = enemy_idx
-
-        return idxholder
+        return self.world_queries.flag_holder(team)
 
     def closest_to_flag(self, team):
         """returns the enemy closest to the team flag.
@@ -557,30 +558,7 @@ class GameEnvironment:
         :param team: red or blue.
         :return: list of enemies (enemy index) in the territory.
         """
-
-        bdist = cdist(self.blue_team.positions, self.red_flags.positions, metric='euclidean')
-        rdist = cdist(self.red_team.positions, self.blue_flags.positions, metric='euclidean')
-
-        distclosest = 10000
-        idxclosest = None
-
-
-
-        if team.color == 'red':
-            for enemy_idx in range(self.n_blue_agents):
-                if bdist[enemy_idx][0] < distclosest:
-                    distclosest = bdist[enemy_idx][0]
-                    idxclosest = enemy_idx
-
-
-        else:
-            for enemy_idx in range(self.n_red_agents):
-                if self.in_blue_territory(self.red_team, enemy_idx):
-                    if rdist[enemy_idx][0] < distclosest:
-                        distclosest = rdist[enemy_idx][0]
-                        idxclosest = enemy_idx
-
-        return idxclosest
+        return self.world_queries.closest_to_flag(team)
 
     def top_enemy(self, team):
         """returns the enemy thats at the highest relative to the map
@@ -589,22 +567,7 @@ class GameEnvironment:
         :param idx: 0 or 1
         :return: the idx of the enemy on top for the team of idx 0 and the enemy on bottom for idx 1
         """
-        targetidx = None
-        highest = 0
-
-        if team.color == 'red':
-            for enemy_idx in range(self.n_blue_agents):
-                if self.blue_team.positions[enemy_idx][1] > highest:
-                    highest = self.blue_team.positions[enemy_idx][1]
-                    targetidx = enemy_idx
-
-        elif team.color == 'blue':
-            for enemy_idx in range(self.n_red_agents):
-                if self.red_team.positions[enemy_idx][1] > highest:
-                    highest = self.red_team.positions[enemy_idx][1]
-                    targetidx = enemy_idx
-
-        return targetidx
+        return self.world_queries.top_enemy(team)
 
     def bot_enemy(self, team):
         """returns the enemy thats at the lowest relative to the map
@@ -613,22 +576,7 @@ class GameEnvironment:
         :param team: red or blue
         :return: the idx of the enemy on top for the team of idx 0 and the enemy on bottom for idx 1
         """
-        targetidx = None
-        lowest = 1000
-
-        if team.color == 'red':
-            for enemy_idx in range(self.n_blue_agents):
-                if self.blue_team.positions[enemy_idx][1] < lowest:
-                    lowest = self.blue_team.positions[enemy_idx][1]
-                    targetidx = enemy_idx
-
-        elif team.color == 'blue':
-            for enemy_idx in range(self.n_red_agents):
-                if self.red_team.positions[enemy_idx][1] < lowest:
-                    lowest = self.red_team.positions[enemy_idx][1]
-                    targetidx = enemy_idx
-
-        return targetidx
+        return self.world_queries.bot_enemy(team)
 
     def agent_zero_target(self, team):
         """returns the enemy closest to red 0
@@ -637,20 +585,7 @@ class GameEnvironment:
         :param team: team: red or blue.
         :return:
         """
-
-
-        bdist = cdist(self.blue_team.positions, self.red_team.positions, metric='euclidean')
-
-        closest_to_agent = 1000
-        targetidx = None
-
-        if team.color == 'red':
-            for enemy_idx in range(self.n_blue_agents):
-                if bdist[enemy_idx][0] < closest_to_agent:
-                    closest_to_agent = bdist[enemy_idx][0]
-                    targetidx = enemy_idx
-
-        return targetidx
+        return self.world_queries.agent_zero_target(team)
 
     def farthest_from_flag(self, team):
         """returns the enemy farthest from the team flag.
@@ -658,30 +593,7 @@ class GameEnvironment:
         :param team: red or blue.
         :return: idx of enemy farthest from flag.
         """
-
-        bdist = cdist(self.blue_team.positions, self.red_flags.positions, metric='euclidean')
-        rdist = cdist(self.red_team.positions, self.blue_flags.positions, metric='euclidean')
-
-        distfarthest = 0
-        idxfarthest = None
-
-
-
-        if team.color == 'red':
-            for enemy_idx in range(self.n_blue_agents):
-                if bdist[enemy_idx][0] >= distfarthest:
-                    distfarthest = bdist[enemy_idx][0]
-                    idxfarthest = enemy_idx
-
-
-        else:
-            for enemy_idx in range(self.n_red_agents):
-                if self.in_blue_territory(self.red_team, enemy_idx):
-                    if rdist[enemy_idx][0] > distfarthest:
-                        distfarthest = rdist[enemy_idx][0]
-                        idxfarthest = enemy_idx
-
-        return idxfarthest
+        return self.world_queries.farthest_from_flag(team)
     ### a1798441 end
 
     def check_for_enemies_in_territory(self, team):
@@ -690,16 +602,7 @@ class GameEnvironment:
         :param team: red or blue.
         :return: list of enemies (enemy index) in the territory.
         """
-        enemies_in_territory = []
-        if team.color == 'red':
-            for enemy_idx in range(self.n_blue_agents):#for enemy_idx in range(self.n_blue_agents):
-                if self.in_red_territory(self.blue_team, enemy_idx):
-                    enemies_in_territory.append(enemy_idx)
-        else:
-            for enemy_idx in range(self.n_red_agents):#for enemy_idx in range(self.n_red_agents):
-                if self.in_blue_territory(self.red_team, enemy_idx):
-                    enemies_in_territory.append(enemy_idx)
-        return enemies_in_territory
+        return self.world_queries.enemies_in_territory(team)
 
     def in_red_territory(self, team, agent_idx):
         """Checks if a particular agent in a particular team is in red territory.
@@ -725,72 +628,31 @@ class GameEnvironment:
                (team.positions[agent_idx, 1] > self.game_boundary[1, 0]) and \
                (team.positions[agent_idx, 1] < self.game_boundary[1, 1])
 
+    def get_renderer(self):
+        """Get the renderer, creating it on first use.
+
+        :return: Renderer object.
+        """
+        if not self.generate_graphics:
+            raise Exception("Graphics are disabled for this environment (generate_graphics=False).")
+        if self.renderer is None:
+            if self.render_mode == 'patches':
+                from environment.renderer import Renderer
+                self.renderer = Renderer(self)
+            elif self.render_mode == 'blit':
+                from environment.renderer import CollectionRenderer
+                self.renderer = CollectionRenderer(self)
+            else:
+                raise Exception("Invalid render mode")
+        return self.renderer
+
     def render(self, animate=False):
         """Render the environment.
 
         :param animate: Boolaen to determine if this render frame will be used as part of an animation.
         :return: None.
         """
-        # Update Red Flag graphics
-        if self.red_flags is not None:
-            for red_idx, red_flag_graphics in enumerate(self.red_flags.graphics):
-                red_flag_graphics.center = (self.red_flags.positions[red_idx])
-
-                for red_idx, red_flag_graphics in enumerate(self.red_flags.outer_circle):
-                    red_flag_graphics.center = (self.red_flags.positions[red_idx])
-
-        # Update Blue Flag graphics
-        if self.blue_flags is not None:
-            for blue_idx, blue_flag_graphics in enumerate(self.blue_flags.graphics):
-                blue_flag_graphics.center = (self.blue_flags.positions[blue_idx])
-
-                for blue_idx, blue_flag_graphics in enumerate(self.blue_flags.outer_circle):
-                    blue_flag_graphics.center = (self.blue_flags.positions[blue_idx])
-
-        # Update Red Agent graphics
-        if self.red_team is not None:
-            for red_idx, red_agent_graphics in enumerate(self.red_team.graphics):
-                ori_graphics_deg = self.red_team.azimuths[red_idx] * 180 / np.pi + 180  # rad to deg
-                theta1 = ori_graphics_deg - self.red_team.half_arc
-                theta2 = ori_graphics_deg + self.red_team.half_arc
-                red_agent_graphics.set_center((self.red_team.positions[red_idx]))
-                red_agent_graphics.set_theta1(theta1)
-                red_agent_graphics.set_theta2(theta2)
-
-                # Text
-                self.red_text[red_idx].set(x=self.red_team.positions[red_idx, 0],
-                                           y=self.red_team.positions[red_idx, 1])
-                if self.red_team.has_flag[red_idx]:
-                    red_agent_graphics.set_color('green')
-                else:
-                    red_agent_graphics.set_color('red')
-
-        # Update Blue Agent graphics
-        if self.blue_team is not None:
-            for blue_idx, blue_agent_graphics in enumerate(self.blue_team.graphics):
-                ori_graphics_deg = self.blue_team.azimuths[blue_idx] * 180 / np.pi + 180  # rad to deg
-                theta1 = ori_graphics_deg - self.blue_team.half_arc
-                theta2 = ori_graphics_deg + self.blue_team.half_arc
-                blue_agent_graphics.set_center((self.blue_team.positions[blue_idx]))
-                blue_agent_graphics.set_theta1(theta1)
-                blue_agent_graphics.set_theta2(theta2)
-
-                # Text
-                self.blue_text[blue_idx].set(x=self.blue_team.positions[blue_idx, 0],
-                                             y=self.blue_team.positions[blue_idx, 1])
-                if self.blue_team.has_flag[blue_idx]:
-                    blue_agent_graphics.set_color('green')
-                else:
-                    blue_agent_graphics.set_color('blue')
-
-        # Update obstacle graphics
-        if self.obstacles is not None:
-            for obs_idx, obstacle_graphics in enumerate(self.obstacles.graphics):
-                obstacle_graphics.center = (self.obstacles.positions[obs_idx])
-
-        if not animate:
-            plt.pause(0.0000001)
-            plt.draw()
+        self.get_renderer().render(animate)
 
     def load(self, team):
         """Loads a controller for a particular team.
@@ -846,7 +708,7 @@ class GameEnvironment:
         """
         return sum(self.blue_flags.is_captured)/self.n_blue_flags
 
-    def evaluate(self, evaluation_type='ctf', evaluation_eps=500, should_render=False):
+    def evaluate(self, evaluation_type='ctf', evaluation_eps=500, should_render=False, n_workers=1, seed=None):
         """Runs the environment for n episodes and prints some evaluations stats.
 
         :return: none.
@@ -854,7 +716,7 @@ class GameEnvironment:
         if evaluation_type == 'attack_defend':
             self.evaluate_attack_defend(evaluation_eps, should_render)
         elif evaluation_type == 'ctf':
-            self.evaluate_ctf(evaluation_eps, should_render)
+            self.evaluate_ctf(evaluation_eps, should_render, n_workers, seed)
 
     def evaluate_attack_defend(self, evaluation_eps=500, should_render=False):
         """Runs a specified number of episodes and collects some statistics during the runs. Prints these statistics
@@ -897,7 +759,7 @@ class GameEnvironment:
                 for idx in range(self.red_team.n):
                     if self.red_team.alive[idx]:
                         finish = False
-                if finish:
+                if finish or self.is_episode_done():
                     break
 
             # Check the winning condition
@@ -936,40 +798,75 @@ class GameEnvironment:
                                            float(median_absolute_deviation(total_score))
                                            ))
 
-    def evaluate_ctf(self, evaluation_eps=500, should_render=False):
+    def evaluate_ctf(self, evaluation_eps=500, should_render=False, n_workers=1, seed=None):
         """Runs a specified number of episodes and collects some statistics during the runs. Prints these statistics
         to the terminal after completing all episodes. The evaluation is on the ctf game.
 
+        With n_workers > 1 the episodes are shared across a pool of headless copies of this environment (see
+        environment/parallel_evaluation.py). When a seed is given every episode is seeded from (seed, episode index)
+        so the statistics are the same for any number of workers.
+
         :param evaluation_eps: Number of episodes to run.
-        :param should_render: Should the episodes be displayed as they are running.
+        :param should_render: Should the episodes be displayed as they are running (serial evaluation only).
+        :param n_workers: Number of worker processes.
+        :param seed: Base seed for the episodes. If None the episodes are not reseeded.
         :return: None
         """
-        n_evaluation_episodes = evaluation_eps
-        red_wins = []
-        tags = 0
-        for evaluation_episode in range(n_evaluation_episodes):
-            if evaluation_episode % 10 == 0:
-                print(evaluation_episode)
+        if n_workers > 1:
+            from environment.parallel_evaluation import evaluate_ctf_parallel
+            outcomes = evaluate_ctf_parallel(self, evaluation_eps, n_workers, seed)
+        else:
+            outcomes = []
+            for evaluation_episode in range(evaluation_eps):
+                if evaluation_episode % 10 == 0:
+                    print(evaluation_episode)
+                outcomes.append(self.run_ctf_episode(evaluation_episode, seed, should_render))
+        self.report_ctf(outcomes)
+
+    def run_ctf_episode(self, episode=0, seed=None, should_render=False):
+        """Runs one evaluation episode of the ctf game.
+
+        :param episode: index of the episode (used with seed).
+        :param seed: Base seed. If not None the episode is seeded from (seed, episode).
+        :param should_render: Should the episode be displayed as it is running.
+        :return: tuple (red score, blue score, whether red agent 0 got tagged, episode length).
+        """
+        if seed is not None:
+            self.seed(np.random.SeedSequence([seed, episode]))
 
-            # Reset the environment
-            ep_len = 0
-            self.reset_env()
-            got_tagged = False
-            for t in range(self.max_episode_length):
+        # Reset the environment
+        ep_len = 0
+        self.reset_env()
+        got_tagged = False
+        for t in range(self.max_episode_length):
 
-                if should_render:
-                    if t % self.render_steps == 0:
-                        self.render()
+            if should_render:
+                if t % self.render_steps == 0:
+                    self.render()
 
-                self.update_environment()
+            self.update_environment()
+            ep_len = t + 1
 
-                if self.red_team.is_tagged[0]:
-                    got_tagged = True
+            if self.red_team.is_tagged[0]:
+                got_tagged = True
 
+            if self.is_episode_done():
+                break
+        return self.red_score, self.blue_score, got_tagged, ep_len
+
+    def report_ctf(self, outcomes):
+        """Prints the statistics of a ctf evaluation.
+
+        :param outcomes: list of episode outcomes as returned by run_ctf_episode (in episode order).
+        :return: None
+        """
+        red_wins = []
+        tags = 0
+        for red_score, blue_score, got_tagged, ep_len in outcomes:
             # Check the winning condition
-            if self.red_score > self.blue_score:
+            if red_score > blue_score:
                 score = 1
-            elif self.red_score == self.blue_score:
+            elif red_score == blue_score:
                 score = 0
             else:
                 score = -1
@@ -980,6 +877,7 @@ class GameEnvironment:
             # Append to averages
             red_wins.append(score)
         red_score = np.array(red_wins)
+        game_time = np.array([outcome[3] for outcome in outcomes])
 
         print("Tags: %s" % tags)
         print("(Mean, Standard Deviation, Median, Median Absolute Deviation")
@@ -1003,6 +901,7 @@ class GameEnvironment:
         print("Red team difficulty: %d" % self.difficulty)
         print("Scoreboard: B %d - %d - %d R" % (counterB, counterD, counterR))
         ### a1708087 ends
+        print("Game Time: (%f, %f)" % (float(np.mean(game_time)), float(np.std(game_time))))
 
     def generate_animation(self, file_name):
         """Generates an animation and saves it to file.
@@ -1015,7 +914,7 @@ class GameEnvironment:
         # movie_writer = FFMpegWriter(fps=100)
         movie_writer = FFMpegWriter(fps=50)
 
-        with movie_writer.saving(plt.gcf(), file_name, dpi=100):
+        with movie_writer.saving(self.get_renderer().fig, file_name, dpi=100):
             for t in range(self.max_episode_length):
                 self.render(animate=False)
                 movie_writer.grab_frame()
@@ -1025,15 +924,29 @@ class GameEnvironment:
                 for idx in range(self.red_team.n):
                     if self.red_team.alive[idx]:
                         finish = False
-                if finish:
+                if finish or self.is_episode_done():
                     break
 
+    def generate_animations(self, file_names, n_workers=None, seed=None):
+        """Generates one animation per file name. The episodes are recorded and encoded in parallel by worker
+        processes that stream raw frames to ffmpeg (see environment/animation_export.py).
+
+        :param file_names: list of names of files to save to.
+        :param n_workers: number of worker processes (defaults to one per file up to the number of cpus).
+        :param seed: base seed for the episodes. If None a random base seed is drawn.
+        :return: None.
+        """
+        from environment.animation_export import export_animations
+        export_animations(self, file_names, n_workers, seed)
+
     def close(self):
         """Close the figure.
 
         :return: None.
         """
-        plt.close(self.fig)
+        if self.renderer is not None:
+            self.renderer.close()
+            self.renderer = None
 
     def update_environment_simultaneous_attack_defend(self):
         """Both red and blue calculate acceleration demands simultaneously and apply simultaneously.
@@ -1065,14 +978,11 @@ class GameEnvironment:
             self.blue_acceleration = None
 
         # Apply red acceleration commands
-        for idx in range(self.red_team.n):
-            if self.red_team.alive[idx]:
-                self.red_team.apply_acceleration(idx, self.red_acceleration[idx], self.delta_time)
+        self.red_team.apply_accelerations(self.red_acceleration, self.delta_time)
 
         # Apply blue acceleration commands
-        for idx in range(self.n_blue_agents):
-            if self.blue_team.alive[idx]:
-                self.blue_team.apply_acceleration(idx, self.blue_acceleration[idx], self.delta_time)
+        if self.n_blue_agents > 0:
+            self.blue_team.apply_accelerations(self.blue_acceleration, self.delta_time)
 
         if self.n_blue_agents > 0:
             self.blue_team.take_extra_actions()
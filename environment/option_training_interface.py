@@ -0,0 +1,111 @@
+"""
+capture_the_flag
+This is a wrapper to run reinforcement learning algorithms over options (semi-Markov decision process).
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import numpy as np
+from actions.high_level_actions import HighLevelActionSet
+from actions.options import OptionSet
+
+
+class OptionTrainingInterface:
+    def __init__(self, training_env, gamma=0.99, max_duration=50, arrival_radius=None):
+        """Runs the high level actions of a team as options (see actions/options.py) on top of a
+        ReinforcementLearningTrainingInterface. step runs the environment until the option of at least one agent
+        ends, so the policy is only queried, and transitions are only produced, when an agent needs a new option.
+
+        Only the rows of the agents in infos['needs_action'] are complete transitions. They are stored with
+        ReplayBuffer.add(infos['start_observations'], infos['options'], rewards, dones, observations,
+        mask=infos['needs_action'], discounts=infos['discounts']).
+
+        :param training_env: ReinforcementLearningTrainingInterface of a team with the high_level action set (not
+        joint).
+        :param gamma: discount factor the rewards of an option are summed with.
+        :param max_duration: number of steps after which any option ends.
+        :param arrival_radius: see OptionSet.
+        """
+        team = training_env.team
+        if training_env.joint or not isinstance(team.controller.action_set, HighLevelActionSet):
+            raise Exception("Options need the per agent high_level action set")
+        self.training_env = training_env
+        self.env = training_env.env
+        self.team = team
+        self.joint = False
+        self.action_space = training_env.action_space
+        self.observation_space = training_env.observation_space
+        self.gamma = gamma
+        self.option_set = OptionSet(team.controller.action_set, team.n, max_duration, arrival_radius)
+
+        self.rewards = np.zeros(team.n)
+        self.discounts = np.ones(team.n)
+        self.dones = np.zeros(team.n, bool)
+        self.needs_action = np.ones(team.n, bool)
+        self.observations = None  # Observations returned by the last reset or step
+        self.start_observations = None  # Observations each agent's option started from
+        self.infos = {'needs_action': self.needs_action, 'durations': self.option_set.durations,
+                      'discounts': self.discounts, 'options': self.option_set.options, 'start_observations': None,
+                      'override': training_env.override, 'truncated': training_env.truncated}
+
+        # Number of environment steps and of agent decisions (policy queries) so far
+        self.n_steps = 0
+        self.n_decisions = 0
+
+    def reset(self):
+        """Resets the environment (see ReinforcementLearningTrainingInterface.reset). Every agent needs an option.
+
+        :return: an observation of the state of the environment as given by the sensors.
+        """
+        observations = self.training_env.reset()
+        # The sensor reuses its buffer, so keep copies
+        self.observations = np.array(observations)
+        self.start_observations = np.array(observations)
+        self.infos['start_observations'] = self.start_observations
+        self.needs_action.fill(True)
+        self.dones.fill(False)
+        return observations
+
+    def step(self, actions):
+        """Start the options of the agents that need one and run the environment until an agent's option ends, an
+        agent is done or the episode ends.
+
+        :param actions: high level actions (team.n,), only read for the agents in infos['needs_action'] of the last
+        reset or step (the others carry on with their option).
+        :return: observations, rewards, dones and infos. For the agents in infos['needs_action'] the reward is the
+        discounted sum of the rewards over their option, infos['discounts'] is gamma ** infos['durations'] (the
+        discount of the value of the next observation), infos['options'] and infos['start_observations'] are the
+        option and the observation it started from, and they need a new action. infos['truncated'] marks the agents
+        whose option only ended because the episode reached max_episode_length. The entries of agents whose
+        option is still running are partial sums and are not transitions. The arrays are preallocated and
+        overwritten by the next step.
+        """
+        starting = self.needs_action & ~self.dones
+        self.option_set.start(starting, actions, self.team)
+        self.start_observations[starting] = self.observations[starting]
+        self.rewards[starting] = 0.0
+        self.discounts[starting] = 1.0
+        self.n_decisions += int(starting.sum())
+        active = ~self.dones
+
+        controller = self.team.controller
+        sensor = self.team.sensor
+        while True:
+            observations, rewards, dones, _ = self.training_env.step(self.option_set.options)
+            self.n_steps += 1
+            self.rewards[active] += self.discounts[active] * rewards[active]
+            self.discounts[active] *= self.gamma
+            ended = self.option_set.step(self.team, sensor.enemy_team, sensor.team_flags, sensor.enemy_flags,
+                                         controller.target_idx)
+            ended = (ended | dones) & active
+            if ended.any() or (dones | ~active).all():
+                break
+
+        np.copyto(self.needs_action, ended)
+        np.copyto(self.dones, dones)
+        np.copyto(self.observations, observations)
+        return observations, self.rewards, self.dones, self.infos
@@ -0,0 +1,100 @@
+"""
+capture_the_flag
+This file runs evaluation episodes across a pool of worker processes.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import multiprocessing
+import os
+import numpy as np
+
+# The headless environment owned by each worker process
+_worker_env = None
+
+
+def _init_worker(init_args, difficulty, shared_weights):
+    """Builds the headless environment used by a worker process.
+
+    :param init_args: arguments used to build the original environment (GameEnvironment.init_args).
+    :param difficulty: difficulty of the original environment.
+    :param shared_weights: dictionary of team color to the SharedWeights its model attaches to instead of loading.
+    Only teams whose controllers have a model are loaded.
+    :return: None.
+    """
+    global _worker_env
+    from environment.game_environment import GameEnvironment
+    _worker_env = GameEnvironment(generate_graphics=False, **init_args)
+    _worker_env.difficulty = difficulty
+    for color, team in (('red', _worker_env.red_team), ('blue', _worker_env.blue_team)):
+        if team is None or team.controller.model is None:
+            continue
+        if color in shared_weights:
+            team.controller.model.shared_weights = shared_weights[color]
+        _worker_env.load(color)
+
+
+def _run_ctf_episode(task):
+    """Runs one ctf episode in a worker process.
+
+    :param task: tuple (episode index, base seed).
+    :return: tuple (episode index, episode outcome).
+    """
+    episode, seed = task
+    return episode, _worker_env.run_ctf_episode(episode, seed)
+
+
+def _share_weights(env):
+    """Publishes the weights of the teams' models (those that support it, see TorchPolicy.share_weights) to shared
+    weights files, so workers attach to one copy rather than each loading the model.
+
+    :param env: the GameEnvironment being evaluated.
+    :return: dictionary of team color to SharedWeights.
+    """
+    from algorithms.shared_weights import default_weights_path
+    shared_weights = {}
+    for color, team in (('red', env.red_team), ('blue', env.blue_team)):
+        model = team.controller.model if team is not None else None
+        if model is None or not hasattr(model, "share_weights"):
+            continue
+        weights = model.share_weights(default_weights_path("ctf_" + color + "_" + str(os.getpid()) + ".weights"))
+        if weights is not None:
+            shared_weights[color] = weights
+    return shared_weights
+
+
+def evaluate_ctf_parallel(env, evaluation_eps, n_workers, seed=None, share_weights=True, verbose=False):
+    """Runs evaluation episodes of the ctf game across a pool of worker processes. Each worker builds its own
+    headless copy of env and every episode is seeded from (seed, episode index), so the outcomes do not depend on
+    the number of workers or on which worker ran which episode.
+
+    :param env: the GameEnvironment being evaluated.
+    :param evaluation_eps: number of episodes to run.
+    :param n_workers: number of worker processes.
+    :param seed: base seed. If None a random base seed is drawn.
+    :param share_weights: whether workers attach to shared copies of the models' weights (see _share_weights).
+    :param verbose: print the number of finished episodes every 10 episodes.
+    :return: list of episode outcomes (see GameEnvironment.run_ctf_episode) in episode order.
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    tasks = [(episode, seed) for episode in range(evaluation_eps)]
+    chunk_size = max(1, evaluation_eps // (n_workers * 8))
+
+    shared_weights = _share_weights(env) if share_weights else {}
+    outcomes = [None] * evaluation_eps
+    try:
+        with multiprocessing.Pool(n_workers, initializer=_init_worker,
+                                  initargs=(env.init_args, env.difficulty, shared_weights)) as pool:
+            for n_done, (episode, outcome) in enumerate(pool.imap_unordered(_run_ctf_episode, tasks, chunk_size)):
+                if verbose and n_done % 10 == 0:
+                    print(n_done)
+                outcomes[episode] = outcome
+    finally:
+        for weights in shared_weights.values():
+            weights.unlink()
+    return outcomes
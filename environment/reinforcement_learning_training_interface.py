@@ -9,9 +9,8 @@ Released to be used in the project entitled "Autonomous multi-agent decision mak
 in Capture the Flag game" for the Advanced Topics in Computer Science course at the
 University of Adelaide.
 """
-import random
 import numpy as np
-from scipy.spatial.distance import cdist
+from environment.reward_terms import make_reward_terms
 
 
 class ReinforcementLearningTrainingInterface:
@@ -53,36 +52,71 @@ class ReinforcementLearningTrainingInterface:
         self.action_space = action_space
         self.observation_space = observation_space
 
+        # Random number generator for the randomised starts (the environment replaces it when seeded)
+        self.rng = np.random.default_rng()
+        self.randomise_probability = 0.8
+
+        # Optional StartStateBank to reset from instead of generating start states (see environment/start_state_bank.py)
+        self.start_state_bank = None
+
         # Reward that should be punished
         self.punish_obstacle_collisions = False
         self.punish_agent_collisions = False
 
+        # Rewards are built from terms (see environment/reward_terms.py, replace self.reward_terms to change them) into
+        # arrays reused every step
+        self.reward_terms, self.default_reward = make_reward_terms(game_type)
+        n_rewards = 1 if self.joint else self.team.n
+        self.rewards = np.zeros(n_rewards)
+        self.dones = np.zeros(n_rewards, bool)
+        self.override = np.zeros(n_rewards, bool)
+        self.truncated = np.zeros(n_rewards, bool)
+        self.infos = {'override': self.override, 'truncated': self.truncated}
+        self.claimed = np.zeros(n_rewards, bool)
+        self.applies = np.zeros(n_rewards, bool)
+        self.team_scored = False
+        self.enemy_scored = False
+
     def reset(self):
-        """Resets the state of the environment. If self.randomise has been set then there is some probability that the
-        state will be set to a random state.
+        """Resets the state of the environment. If a start state bank is attached (self.start_state_bank) the state is
+        drawn from it, otherwise see reset_state.
 
         :return: an observation of the state of the environment as given by the sensors.
         """
-        # Reset environment state to an initial position
-        self.env.reset_env()
+        if self.start_state_bank is not None:
+            self.env.reset_env(start_state=self.start_state_bank.sample(self.rng))
+        else:
+            self.reset_state()
         self.current_red_score = 0
         self.current_blue_score = 0
 
+        observations = self.team.sensor.get_observations()
+        return observations
+
+    def reset_state(self):
+        """Resets the environment to an initial state. If self.randomise has been set then with probability
+        self.randomise_probability the state is then randomised (to possibly a non-initial state).
+
+        :return: None.
+        """
+        # Reset environment state to an initial position
+        self.env.reset_env()
+
         # Randomise the state (to possibly a non-initial state)
         if self.randomise:
-            random_number = random.uniform(0, 1)
-            if random_number < 0.8:
+            random_number = self.rng.random()
+            if random_number < self.randomise_probability:
                 self._randomise_state()
 
-        observations = self.team.sensor.get_observations()
-        return observations
-
     def step(self, actions):
         """Take a step in the environment. This is used in reinforcement learning.
 
         :param actions: actions for each of the agents.
         :return: observations of each of the agents, rewards associated with each agent, done for each of the agents
-        infos for each of the agents (currently nothing).
+        and infos ({'override': mask of the agents whose actions were overridden because they are tagged,
+        'truncated': mask of the agents that are only done because the episode reached max_episode_length, whose
+        next observation can still be bootstrapped from}). With joint actions there is one reward, done, override
+        and truncated for the team. The rewards, dones and infos are preallocated and overwritten by the next step.
         """
 
         # Set what actions the agents should do
@@ -100,158 +134,48 @@ class ReinforcementLearningTrainingInterface:
         # Get observations after all agents have taken their actions
         observations = self.team.sensor.get_observations()
 
-        if not self.joint:
-            rewards, dones = self._get_reward_individual()
-            infos = {'override': []}
-
-            if self.team.color == 'red':
-                for idx in range(self.team.n):
-                    infos['override'].append(self.env.red_team_override[idx])
-            elif self.team.color == 'blue':
-                for idx in range(self.team.n):
-                    infos['override'].append(self.env.blue_team_override[idx])
-            else:
-                raise Exception("Invalid team color")
-            return observations, rewards, dones, infos
+        self._compute_rewards()
+        # The episode may also be over because the termination policy says the result is decided
+        if self.env.is_episode_done():
+            self.dones[:] = True
+        # Every agent is done when the episode reaches its time limit
+        if self.env.time_step >= self.max_episode_length:
+            np.logical_not(self.dones, out=self.truncated)
+            self.dones[:] = True
         else:
-            rewards, dones = self._get_reward_joint()
-
-            # Get infos (currently nothing)
-            if self.team.color == 'red':
-                if all(self.env.red_team_override):
-                    infos = {'override': [True]}
-                else:
-                    infos = {'override': [False]}  # Unclear about override when it is joint action
-            elif self.team.color == 'blue':
-                if all(self.env.blue_team_override):
-                    infos = {'override': [True]}
-                else:
-                    infos = {'override': [False]}  # Unclear about override when it is joint action
-            else:
-                raise Exception("Invalid team color")
-            print(infos)
-            return observations, [rewards], [dones], infos
+            self.truncated.fill(False)
 
-    def _get_reward_joint(self):
-        """Calculates the joint reward for the team. The reward value for the joint actions of the team. It also
-        calculates whether the team is done (should the episode end).
-
-        :return: the joint reward for the team and whether the team is done.
-        """
-        if self.game_type == 'ctf':
-            return self._get_joint_reward_ctf()
-        elif self.game_type == 'attack_defend':
-            raise Exception("No reward function")
-        else:
-            raise Exception("No reward function for this game type")
-
-    def _get_reward_individual(self):
-        """This generates a list of rewards and dones for each of the agents in the team. The list of dones indicates
-        whether a particular agent has terminated.
-
-        :return: list of rewards and list of dones.
-        """
-
-        rewards = []
-        dones = []
-        # Get rewards and dones
-        if self.game_type == 'ctf':
-            team_scored = self._scored_flag(self.team.color)
-            enemy_scored = self._scored_flag(self.team.sensor.enemy_team.color)
-            for idx in range(self.team.n):
-                reward, done = self._get_individual_reward_ctf(idx, team_scored, enemy_scored)
-                rewards.append(reward)
-                dones.append(done)
-        elif self.game_type == 'attack_defend':
-            for idx in range(self.team.n):
-                reward, done = self._get_individual_reward_attack_defend(idx)
-                rewards.append(reward)
-                dones.append(done)
-        else:
-            raise Exception("No reward function for this game type")
-        return rewards, dones
-
-    def _get_joint_reward_ctf(self):
-        """Calculates the joint reward and joint done for a team when playing capture the flag.
-
-        :return: reward, done
-        """
-        team_scored = self._scored_flag(self.team.color)
-        enemy_scored = self._scored_flag(self.team.sensor.enemy_team.color)
-        if team_scored:
-            return 10.0, True  # 10.0, True  # False
-        elif enemy_scored:
-            return 0.0, True  # -10.0, True  # False
+        if self.team.color == 'red':
+            override = self.env.red_team_override
+        elif self.team.color == 'blue':
+            override = self.env.blue_team_override
         else:
-            for agent_idx in range(self.team.n):
-                if self.env.has_left_boundary(self.team, agent_idx):
-                    # Penalise leaving boundaries
-                    return -1.0, False
-            return 0.0, False
-
-    def _get_individual_reward_ctf(self, agent_idx, team_scored, enemy_scored):
-        """Calculates the reward and done for a particular agent on a team playing capture the flag.
-
-        :param agent_idx: agent under consideration.
-        :param team_scored: whether the team scored.
-        :param enemy_scored: whether the enemy team scored.
-        :return: reward, done
-        """
-
-        if team_scored:
-            # print("SCORED!")
-            return 10.0, True
-        elif enemy_scored:
-            return 0.0, True  # -10.0, False
+            raise Exception("Invalid team color")
+        if self.joint:
+            self.override[0] = override.all()  # Unclear about override when it is joint action
         else:
-            if self.env.has_left_boundary(self.team, agent_idx):
-                # Penalise leaving boundaries
-                return -1.0, False
-            return 0.0, False
-
-    def _get_joint_reward_attack_defend(self):
-        """Calculates the joint reward and joint done for a team when playing the attack_defend game.
-
-        :return: reward, done
-        """
-        raise NotImplementedError("The _get_joint_reward_attack_defend function has not been implemented")
+            self.override[:] = override
+        return observations, self.rewards, self.dones, self.infos
 
-    def _get_individual_reward_attack_defend(self, agent_idx):
-        """Get the reward and checks if done for a particular agent playing the attack_defend game.
+    def _compute_rewards(self):
+        """Fills self.rewards and self.dones from the reward terms. Every agent gets the reward and done of the first
+        term that applies to it (self.default_reward and not done if none do). With joint actions the team gets those
+        of the first term that applies to any agent.
 
-        :param agent_idx: which agent to consider
-        :return: tuple (reward, done)
+        :return: None.
         """
-
-        if self.env.red_team.has_flag[agent_idx]:
-            # Get the flag
-            return 10.0, True  # Previously I had normalised rewards but maybe not great for this example.
-        elif self.env.red_team.is_tagged[agent_idx]:
-            # Tagged but not dead
-            # self.red_team.tag[agent_idx] = False  # being tagged should only affect onc transition
-            return -1.0, False
-        elif not self.env.red_team.alive[agent_idx]:
-            # Penalise dying
-            return -1.0, True
-        elif self.env.has_left_boundary(self.env.red_team, agent_idx):
-            # Penalise leaving boundaries
-            return -1.0, False
-        else:
-            # Penalise collisions with obstacles
-            if self.punish_obstacle_collisions:
-                dist = cdist(self.env.obstacles.positions, self.env.red_team.positions[agent_idx].reshape(1, 2),
-                             metric='euclidean')
-                if any(dist < self.env.obstacle_collision_dist):
-                    return -1.0, False
-
-            # Penalise collisions with other agents
-            #if self.punish_agent_collisions and self.env.n_red_agents > 1:
-            #    if any(np.delete(self.env.red_team.controller.sensor.dist_matrix[agent_idx], agent_idx) <
-            #           self.env.agent_collision_dist):
-            #        return -1.0, False
-
-            # Default (Penalise prolonging the game)
-            return -0.01, False
+        self.team_scored = self._scored_flag(self.team.color)
+        self.enemy_scored = self._scored_flag(self.team.sensor.enemy_team.color)
+
+        self.rewards.fill(self.default_reward)
+        self.dones.fill(False)
+        self.claimed.fill(False)
+        for term in self.reward_terms:
+            applies = np.any(term.applies(self), keepdims=True) if self.joint else term.applies(self)
+            np.logical_and(applies, ~self.claimed, out=self.applies)
+            self.rewards[self.applies] = term.reward
+            self.dones[self.applies] = term.done
+            self.claimed |= self.applies
 
     def _scored_flag(self, team_color):
         """This checks to see if a given team managed to score a point by capturing the flag.
@@ -281,34 +205,32 @@ class ReinforcementLearningTrainingInterface:
         """
         # Randomise red team variables
         if self.randomise_red or self.randomise_both:
-            self.env.red_team.positions = np.random.uniform(self.env.game_boundary[:, 0], self.env.game_boundary[:, 1],
-                                                            size=(self.env.red_team.n, 2))
-            self.env.red_team.azimuths = np.random.uniform(-np.pi, np.pi, size=self.env.red_team.n)
-            for i in range(self.env.red_team.n):
-                self.env.red_team.velocities[i, 0] = self.env.red_team.speed * np.cos(self.env.red_team.azimuths[i])
-                self.env.red_team.velocities[i, 1] = self.env.red_team.speed * np.sin(self.env.red_team.azimuths[i])
+            self.env.red_team.positions = self.rng.uniform(self.env.game_boundary[:, 0], self.env.game_boundary[:, 1],
+                                                           size=(self.env.red_team.n, 2))
+            self.env.red_team.azimuths = self.rng.uniform(-np.pi, np.pi, size=self.env.red_team.n)
+            self.env.red_team.velocities[:, 0] = self.env.red_team.speed * np.cos(self.env.red_team.azimuths)
+            self.env.red_team.velocities[:, 1] = self.env.red_team.speed * np.sin(self.env.red_team.azimuths)
 
             # Randomise blue flag status
-            rand_number = random.uniform(0, 1)
+            rand_number = self.rng.random()
             if rand_number < 0.5:
                 self.env.blue_flags.is_captured[0] = True
-                self.env.blue_flags.graphics[0].set_alpha(0.2)
-                rand_number_2 = random.randint(0, (self.env.red_team.n - 1))
+                rand_number_2 = self.rng.integers(self.env.red_team.n)
                 self.env.red_team.has_flag[rand_number_2] = True
 
         if self.randomise_blue or self.randomise_both:
             # Randomise blue team variables
-            self.env.blue_team.positions = np.random.uniform(self.env.game_boundary[:, 0], self.env.game_boundary[:, 1],
-                                                             size=(self.env.blue_team.n, 2))
-            self.env.blue_team.azimuths = np.random.uniform(-np.pi, np.pi, size=self.env.blue_team.n)
-            for i in range(self.env.blue_team.n):
-                self.env.blue_team.velocities[i, 0] = self.env.blue_team.speed * np.cos(self.env.blue_team.azimuths[i])
-                self.env.blue_team.velocities[i, 1] = self.env.blue_team.speed * np.sin(self.env.blue_team.azimuths[i])
+            self.env.blue_team.positions = self.rng.uniform(self.env.game_boundary[:, 0], self.env.game_boundary[:, 1],
+                                                            size=(self.env.blue_team.n, 2))
+            self.env.blue_team.azimuths = self.rng.uniform(-np.pi, np.pi, size=self.env.blue_team.n)
+            self.env.blue_team.velocities[:, 0] = self.env.blue_team.speed * np.cos(self.env.blue_team.azimuths)
+            self.env.blue_team.velocities[:, 1] = self.env.blue_team.speed * np.sin(self.env.blue_team.azimuths)
 
             # Randomise red flag status
-            rand_number = random.uniform(0, 1)
+            rand_number = self.rng.random()
             if rand_number < 0.5:
                 self.env.red_flags.is_captured[0] = True
-                self.env.red_flags.graphics[0].set_alpha(0.2)
-                rand_number_2 = random.randint(0, (self.env.blue_team.n - 1))
-                self.env.blue_team.has_flag[rand_number_2] = True
\ No newline at end of file
+                rand_number_2 = self.rng.integers(self.env.blue_team.n)
+                self.env.blue_team.has_flag[rand_number_2] = True
+
+        self.env.world_queries.invalidate()
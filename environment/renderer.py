@@ -0,0 +1,351 @@
+"""
+capture_the_flag
+This file defines the renderer that draws the environment with matplotlib.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import time
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.colors import to_rgba
+from matplotlib.patches import Wedge, Circle
+from matplotlib.collections import EllipseCollection
+
+
+class Renderer:
+    # Wedges are drawn with a 40 degree arc
+    half_arc = 20.0
+
+    def __init__(self, env):
+        """Draws a GameEnvironment. The simulation knows nothing about the graphics: the renderer reads the state of
+        the entities each time render() is called and sets the patches from it (an agent carrying a flag is green,
+        a tagged agent or a captured flag is faded and a dead agent is hidden).
+
+        :param env: the GameEnvironment to draw.
+        """
+        self.env = env
+
+        self.fig, self.ax = plt.subplots()
+        self.ax.axis([env.game_boundary[0, 0], env.game_boundary[0, 1],
+                      env.game_boundary[1, 0], env.game_boundary[1, 1]])
+        self.ax.set_aspect('equal', adjustable='box')
+
+        # Patches and labels of each entity set
+        self.agent_graphics = {}
+        self.agent_text = {}
+        self.flag_graphics = {}
+        self.flag_outer_circle = {}
+        self.obstacle_graphics = []
+
+        for team in (env.blue_team, env.red_team):
+            if team is None:
+                continue
+            self.agent_graphics[team.color] = []
+            self.agent_text[team.color] = []
+            for idx in range(team.n):
+                wedge = Wedge(center=tuple(team.positions[idx]), r=team.radius, theta1=0, theta2=0,
+                              color=team.color)
+                self.ax.add_patch(wedge)
+                self.agent_graphics[team.color].append(wedge)
+                self.agent_text[team.color].append(self.ax.text(x=team.positions[idx, 0], y=team.positions[idx, 1],
+                                                                s="Agent %s" % idx, color=team.color, fontsize=6))
+
+        for flags in (env.red_flags, env.blue_flags):
+            if flags is None:
+                continue
+            self.flag_graphics[flags.color] = []
+            self.flag_outer_circle[flags.color] = []
+            for idx in range(flags.n):
+                circle = Circle(tuple(flags.positions[idx]), flags.radius, color=flags.color)
+                outer_circle = Circle(tuple(flags.positions[idx]), flags.capture_distance, color=flags.color,
+                                      fill=False, linestyle='--')
+                self.ax.add_patch(circle)
+                self.ax.add_patch(outer_circle)
+                self.flag_graphics[flags.color].append(circle)
+                self.flag_outer_circle[flags.color].append(outer_circle)
+
+        if env.obstacles is not None:
+            for idx in range(env.obstacles.n):
+                circle = Circle(tuple(env.obstacles.positions[idx]), env.obstacles.radius, color=env.obstacles.color)
+                self.ax.add_patch(circle)
+                self.obstacle_graphics.append(circle)
+
+        self.ax.vlines(x=80, ymin=0, ymax=80, colors='black', linestyles='--')
+
+    def update(self):
+        """Set every patch from the current state of the environment.
+
+        :return: None.
+        """
+        env = self.env
+        for flags in (env.red_flags, env.blue_flags):
+            if flags is None:
+                continue
+            for idx, (circle, outer_circle) in enumerate(zip(self.flag_graphics[flags.color],
+                                                             self.flag_outer_circle[flags.color])):
+                circle.center = tuple(flags.positions[idx])
+                outer_circle.center = tuple(flags.positions[idx])
+                circle.set_alpha(0.2 if flags.is_captured[idx] else 1)
+
+        for team in (env.red_team, env.blue_team):
+            if team is None:
+                continue
+            for idx, wedge in enumerate(self.agent_graphics[team.color]):
+                ori_graphics_deg = team.azimuths[idx] * 180 / np.pi + 180  # rad to deg
+                wedge.set_center(tuple(team.positions[idx]))
+                wedge.set_theta1(ori_graphics_deg - self.half_arc)
+                wedge.set_theta2(ori_graphics_deg + self.half_arc)
+                wedge.set_color('green' if team.has_flag[idx] else team.color)
+                if not team.alive[idx]:
+                    wedge.set_alpha(0)
+                elif team.is_tagged[idx]:
+                    wedge.set_alpha(0.2)
+                else:
+                    wedge.set_alpha(1)
+
+                # Text
+                self.agent_text[team.color][idx].set(x=team.positions[idx, 0], y=team.positions[idx, 1])
+
+        if env.obstacles is not None:
+            for idx, circle in enumerate(self.obstacle_graphics):
+                circle.center = tuple(env.obstacles.positions[idx])
+
+    def render(self, animate=False):
+        """Draw the current state of the environment.
+
+        :param animate: if True the figure is only updated (the caller grabs the frame) instead of being displayed.
+        :return: None.
+        """
+        self.update()
+        if not animate:
+            plt.pause(0.0000001)
+            plt.draw()
+
+    def draw_frame(self):
+        """Draw the current state of the environment into the canvas without displaying it (used to export
+        videos).
+
+        :return: None.
+        """
+        self.update()
+        self.fig.canvas.draw()
+
+    def close(self):
+        """Close the figure.
+
+        :return: None.
+        """
+        plt.close(self.fig)
+
+
+class CollectionRenderer:
+    def __init__(self, env, show_labels=False):
+        """A faster renderer for live display with many agents. All agents of a team are one scatter collection with
+        one quiver for their headings, the flags, capture circles and obstacles are ellipse collections, and each
+        frame only the moving artists are redrawn on top of a cached background (canvas blitting) when the backend
+        supports it. The achieved frame rate is shown on the figure and kept in self.fps.
+
+        :param env: the GameEnvironment to draw.
+        :param show_labels: if True each agent is labelled with its index (one text artist per agent).
+        """
+        self.env = env
+        self.show_labels = show_labels
+
+        self.fig, self.ax = plt.subplots()
+        self.ax.axis([env.game_boundary[0, 0], env.game_boundary[0, 1],
+                      env.game_boundary[1, 0], env.game_boundary[1, 1]])
+        self.ax.set_aspect('equal', adjustable='box')
+        self.ax.vlines(x=80, ymin=0, ymax=80, colors='black', linestyles='--')
+
+        # Every artist that changes between frames (drawn by blitting)
+        self.dynamic_artists = []
+
+        # Agents: one scatter and one quiver per team
+        self.teams = [team for team in (env.blue_team, env.red_team) if team is not None]
+        self.agent_scatter = {}
+        self.agent_quiver = {}
+        self.agent_text = {}
+        self.agent_colors = {}
+        for team in self.teams:
+            self.agent_colors[team.color] = np.tile(np.array(to_rgba(team.color)), (team.n, 1))
+            self.agent_scatter[team.color] = self.ax.scatter(team.positions[:, 0], team.positions[:, 1], s=12,
+                                                             color=team.color)
+            self.agent_quiver[team.color] = self.ax.quiver(team.positions[:, 0], team.positions[:, 1],
+                                                           np.cos(team.azimuths), np.sin(team.azimuths),
+                                                           color=team.color, angles='xy', scale_units='xy',
+                                                           scale=1.0 / (3 * team.radius), width=0.003)
+            self.dynamic_artists += [self.agent_scatter[team.color], self.agent_quiver[team.color]]
+            self.agent_text[team.color] = []
+            if show_labels:
+                for idx in range(team.n):
+                    text = self.ax.text(x=team.positions[idx, 0], y=team.positions[idx, 1], s="Agent %s" % idx,
+                                        color=team.color, fontsize=6)
+                    self.agent_text[team.color].append(text)
+                    self.dynamic_artists.append(text)
+
+        # Flags and their capture circles
+        self.flags = [flags for flags in (env.red_flags, env.blue_flags) if flags is not None]
+        self.flag_collection = {}
+        self.flag_outer_collection = {}
+        self.flag_colors = {}
+        for flags in self.flags:
+            self.flag_colors[flags.color] = np.tile(np.array(to_rgba(flags.color)), (flags.n, 1))
+            diameters = np.full(flags.n, 2.0 * flags.radius)
+            self.flag_collection[flags.color] = EllipseCollection(
+                diameters, diameters, np.zeros(flags.n), units='xy', offsets=flags.positions,
+                offset_transform=self.ax.transData, facecolors=flags.color)
+            diameters = np.full(flags.n, 2.0 * flags.capture_distance)
+            self.flag_outer_collection[flags.color] = EllipseCollection(
+                diameters, diameters, np.zeros(flags.n), units='xy', offsets=flags.positions,
+                offset_transform=self.ax.transData, facecolors='none', edgecolors=flags.color, linestyles='--')
+            self.ax.add_collection(self.flag_collection[flags.color])
+            self.ax.add_collection(self.flag_outer_collection[flags.color])
+            self.dynamic_artists += [self.flag_collection[flags.color], self.flag_outer_collection[flags.color]]
+
+        # Obstacles
+        self.obstacle_collection = None
+        if env.obstacles is not None:
+            obstacles = env.obstacles
+            diameters = np.full(obstacles.n, 2.0 * obstacles.radius)
+            self.obstacle_collection = EllipseCollection(
+                diameters, diameters, np.zeros(obstacles.n), units='xy', offsets=obstacles.positions,
+                offset_transform=self.ax.transData, facecolors=obstacles.color)
+            self.ax.add_collection(self.obstacle_collection)
+            self.dynamic_artists.append(self.obstacle_collection)
+
+        # Frame rate
+        self.fps = None
+        self.last_frame_time = None
+        self.game_time_per_frame = env.render_steps * env.delta_time
+        self.fps_text = self.ax.text(0.01, 1.01, "", transform=self.ax.transAxes, fontsize=8)
+        self.dynamic_artists.append(self.fps_text)
+
+        # Background used for blitting (captured after every full redraw)
+        self.background = None
+        self.can_blit = getattr(self.fig.canvas, 'supports_blit', False)
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+        self.shown = False
+
+    def update(self):
+        """Set every collection from the current state of the environment.
+
+        :return: None.
+        """
+        for team in self.teams:
+            # Agents carrying a flag are green, tagged agents are faded and dead agents are hidden
+            colors = self.agent_colors[team.color]
+            colors[:, :3] = to_rgba(team.color)[:3]
+            colors[team.has_flag.astype(bool), :3] = to_rgba('green')[:3]
+            colors[:, 3] = np.where(team.alive.astype(bool), np.where(team.is_tagged.astype(bool), 0.2, 1.0), 0.0)
+            scatter = self.agent_scatter[team.color]
+            scatter.set_offsets(team.positions)
+            scatter.set_facecolors(colors)
+            scatter.set_edgecolors(colors)
+            quiver = self.agent_quiver[team.color]
+            quiver.set_offsets(team.positions)
+            quiver.set_UVC(np.cos(team.azimuths), np.sin(team.azimuths))
+            quiver.set_color(colors)
+            for idx, text in enumerate(self.agent_text[team.color]):
+                text.set(x=team.positions[idx, 0], y=team.positions[idx, 1], alpha=colors[idx, 3])
+
+        for flags in self.flags:
+            colors = self.flag_colors[flags.color]
+            colors[:, 3] = np.where(flags.is_captured.astype(bool), 0.2, 1.0)
+            self.flag_collection[flags.color].set_offsets(flags.positions)
+            self.flag_collection[flags.color].set_facecolors(colors)
+            self.flag_outer_collection[flags.color].set_offsets(flags.positions)
+
+        if self.obstacle_collection is not None:
+            self.obstacle_collection.set_offsets(self.env.obstacles.positions)
+
+    def render(self, animate=False):
+        """Draw the current state of the environment.
+
+        :param animate: if True the figure is only updated (the caller grabs the frame) instead of being displayed.
+        Animation frames must not be mixed with live display since live display blits the moving artists.
+        :return: None.
+        """
+        self.update()
+        if animate:
+            return
+
+        self._update_fps()
+        canvas = self.fig.canvas
+        if not self.shown:
+            # From now on the moving artists are left out of full redraws and blitted on top of the background,
+            # which is captured by the first full draw
+            for artist in self.dynamic_artists:
+                artist.set_animated(True)
+            self.shown = True
+            plt.show(block=False)
+            plt.pause(0.0000001)
+        elif self.can_blit and self.background is not None:
+            canvas.restore_region(self.background)
+            self._draw_dynamic_artists()
+            canvas.blit(self.fig.bbox)
+            canvas.flush_events()
+        else:
+            canvas.draw_idle()
+            canvas.flush_events()
+
+    def draw_frame(self):
+        """Draw the current state of the environment into the canvas without displaying it (used to export
+        videos). The static background is drawn once and each frame only draws the moving artists over it.
+
+        :return: None.
+        """
+        self.update()
+        canvas = self.fig.canvas
+        if not self.can_blit:
+            canvas.draw()
+            return
+        if self.background is None:
+            for artist in self.dynamic_artists:
+                artist.set_animated(True)
+            canvas.draw()
+            self.background = canvas.copy_from_bbox(self.fig.bbox)
+        canvas.restore_region(self.background)
+        self._draw_dynamic_artists()
+
+    def close(self):
+        """Close the figure.
+
+        :return: None.
+        """
+        plt.close(self.fig)
+
+    def _on_draw(self, event):
+        """Capture the background after a full redraw (e.g. when the window is resized) and draw the moving artists
+        on top of it.
+
+        :param event: matplotlib draw event.
+        :return: None.
+        """
+        if self.can_blit and self.shown:
+            self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+            self._draw_dynamic_artists()
+
+    def _draw_dynamic_artists(self):
+        """Draw the artists that change between frames.
+
+        :return: None.
+        """
+        for artist in self.dynamic_artists:
+            self.ax.draw_artist(artist)
+
+    def _update_fps(self):
+        """Update the frame rate estimate (exponential moving average) and its label.
+
+        :return: None.
+        """
+        now = time.perf_counter()
+        if self.last_frame_time is not None and now > self.last_frame_time:
+            fps = 1.0 / (now - self.last_frame_time)
+            self.fps = fps if self.fps is None else 0.9 * self.fps + 0.1 * fps
+            self.fps_text.set_text("FPS: %.1f (%.2fx real time)" % (self.fps, self.fps * self.game_time_per_frame))
+        self.last_frame_time = now
@@ -0,0 +1,120 @@
+"""
+capture_the_flag
+This file defines the terms the rewards of reinforcement learning agents are built from.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import numpy as np
+from scipy.spatial.distance import cdist
+
+
+class RewardTerm:
+    def __init__(self, reward, done=False):
+        """Something that can happen to an agent and the reward and done it gives. The terms of a
+        ReinforcementLearningTrainingInterface are checked in order and each agent gets the reward of the first term
+        that applies to it.
+
+        :param reward: reward of the agents the term applies to.
+        :param done: whether the agents the term applies to are done.
+        """
+        self.reward = reward
+        self.done = done
+
+    def applies(self, training_env):
+        """Checks which agents of the trained team the term applies to. This is called after the environment has
+        been updated.
+
+        :param training_env: the ReinforcementLearningTrainingInterface.
+        :return: bool ndarray (team.n,) or a bool for the whole team.
+        """
+        raise NotImplementedError("Please implement the applies function on the reward term.")
+
+
+class TeamScored(RewardTerm):
+    """The team delivered a flag this step."""
+
+    def applies(self, training_env):
+        return training_env.team_scored
+
+
+class EnemyScored(RewardTerm):
+    """The enemy team delivered a flag this step."""
+
+    def applies(self, training_env):
+        return training_env.enemy_scored
+
+
+class HasFlag(RewardTerm):
+    """The agent carries a flag."""
+
+    def applies(self, training_env):
+        return training_env.team.has_flag != 0
+
+
+class Tagged(RewardTerm):
+    """The agent is tagged."""
+
+    def applies(self, training_env):
+        return training_env.team.is_tagged != 0
+
+
+class Dead(RewardTerm):
+    """The agent is dead."""
+
+    def applies(self, training_env):
+        return training_env.team.alive == 0
+
+
+class LeftBoundary(RewardTerm):
+    """The agent is outside the game boundary (see GameEnvironment.has_left_boundary)."""
+
+    def applies(self, training_env):
+        positions = training_env.team.positions
+        boundary = training_env.env.game_boundary
+        return ((positions < boundary[:, 0]) | (positions > boundary[:, 1])).any(axis=1)
+
+
+class ObstacleCollision(RewardTerm):
+    """The agent is colliding with an obstacle (only checked if training_env.punish_obstacle_collisions is set)."""
+
+    def applies(self, training_env):
+        env = training_env.env
+        if not training_env.punish_obstacle_collisions or env.obstacles is None:
+            return False
+        dist = cdist(training_env.team.positions, env.obstacles.positions, metric='euclidean')
+        return (dist < env.obstacle_collision_dist).any(axis=1)
+
+
+class AgentCollision(RewardTerm):
+    """The agent is colliding with a team mate (only checked if training_env.punish_agent_collisions is set)."""
+
+    def applies(self, training_env):
+        team = training_env.team
+        if not training_env.punish_agent_collisions or team.n < 2:
+            return False
+        dist = training_env.env.world_queries.distances(team, team)
+        return ((dist < training_env.env.agent_collision_dist) & ~np.eye(team.n, dtype=bool)).any(axis=1)
+
+
+def make_reward_terms(game_type):
+    """The reward terms of a game.
+
+    ctf: 10 and done when the team scores, 0 and done when the enemy scores, otherwise -1 for leaving the boundary.
+    attack_defend: 10 and done for getting the flag, -1 for being tagged, -1 and done for dying, -1 for leaving the
+    boundary or colliding (if punished), otherwise -0.01 for prolonging the game.
+
+    :param game_type: ctf or attack_defend.
+    :return: tuple (list of RewardTerm objects in priority order, reward when no term applies).
+    """
+    if game_type == 'ctf':
+        return [TeamScored(10.0, True), EnemyScored(0.0, True), LeftBoundary(-1.0)], 0.0
+    elif game_type == 'attack_defend':
+        return [HasFlag(10.0, True), Tagged(-1.0), Dead(-1.0, True), LeftBoundary(-1.0), ObstacleCollision(-1.0),
+                AgentCollision(-1.0)], -0.01
+    else:
+        raise Exception("No reward function for this game type")
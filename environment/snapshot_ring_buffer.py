@@ -0,0 +1,157 @@
+"""
+capture_the_flag
+This file defines a ring buffer of full game state snapshots used to rewind the environment.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import numpy as np
+
+
+class SnapshotRingBuffer:
+    def __init__(self, env, capacity=64):
+        """Keeps the last capacity snapshots of the full state of a game so that the game can be rewound. A snapshot
+        holds the world state buffer (agents, flags and obstacles), the scores, the time step, the acceleration
+        commands being held between decisions, the tag overrides and the memory of each team's controller (see
+        Controller.memory_fields). All storage is allocated here so taking and restoring snapshots only copies into
+        existing memory.
+
+        :param env: GameEnvironment to take snapshots of.
+        :param capacity: number of snapshots to keep.
+        """
+        self.env = env
+        self.capacity = capacity
+
+        self.world = np.zeros((capacity, env.world_state.size), np.double)
+        self.scores = np.zeros((capacity, 2), np.int64)
+        self.time_steps = np.zeros(capacity, np.int64)
+
+        self.teams = [team for team in (env.red_team, env.blue_team) if team is not None]
+        self.held_acceleration = {}
+        self.has_held_acceleration = {}
+        self.override = {}
+        self.controller_memory = {}
+        for team in self.teams:
+            self.held_acceleration[team.color] = np.zeros((capacity, team.n, 2), np.double)
+            self.has_held_acceleration[team.color] = np.zeros(capacity, bool)
+            self.override[team.color] = np.zeros((capacity, team.n), bool)
+            self.controller_memory[team.color] = {}
+            for field in team.controller.memory_fields:
+                value = getattr(team.controller, field)
+                if isinstance(value, np.ndarray):
+                    memory = np.empty((capacity,) + value.shape, value.dtype)
+                else:
+                    memory = np.empty((capacity, len(value)), object)
+                self.controller_memory[team.color][field] = memory
+
+        self.head = 0  # slot the next snapshot is written to
+        self.count = 0  # number of valid snapshots
+
+    def snapshot(self):
+        """Take a snapshot of the current state of the game.
+
+        :return: the slot the snapshot was written to.
+        """
+        slot = self.head
+        env = self.env
+        env.world_state.snapshot(out=self.world[slot])
+        self.scores[slot, 0] = env.red_score
+        self.scores[slot, 1] = env.blue_score
+        self.time_steps[slot] = env.time_step
+
+        for team in self.teams:
+            acceleration = self._get_held_acceleration(team.color)
+            self.has_held_acceleration[team.color][slot] = acceleration is not None
+            if acceleration is not None:
+                self.held_acceleration[team.color][slot] = acceleration
+            self.override[team.color][slot] = self._get_override(team.color)
+            for field, memory in self.controller_memory[team.color].items():
+                memory[slot] = getattr(team.controller, field)
+
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        return slot
+
+    def restore(self, slot):
+        """Set the game to the state held in a slot. The contents of the ring buffer are not changed.
+
+        :param slot: slot returned by snapshot().
+        :return: None.
+        """
+        env = self.env
+        env.world_state.restore(self.world[slot])
+        env.red_score = int(self.scores[slot, 0])
+        env.blue_score = int(self.scores[slot, 1])
+        env.time_step = int(self.time_steps[slot])
+        env.world_queries.invalidate()
+
+        for team in self.teams:
+            if self.has_held_acceleration[team.color][slot]:
+                acceleration = self._get_held_acceleration(team.color)
+                if acceleration is None:
+                    self._set_held_acceleration(team.color, self.held_acceleration[team.color][slot].copy())
+                else:
+                    acceleration[...] = self.held_acceleration[team.color][slot]
+            else:
+                self._set_held_acceleration(team.color, None)
+            self._get_override(team.color)[:] = self.override[team.color][slot]
+            for field, memory in self.controller_memory[team.color].items():
+                value = getattr(team.controller, field)
+                if isinstance(value, np.ndarray):
+                    value[...] = memory[slot]
+                else:
+                    value[:] = memory[slot]
+
+    def slot(self, k=0):
+        """Get the slot holding the snapshot taken k snapshots before the most recent one.
+
+        :param k: how many snapshots back (0 is the most recent).
+        :return: slot index.
+        """
+        if not 0 <= k < self.count:
+            raise Exception("Only %d snapshots are available." % self.count)
+        return (self.head - 1 - k) % self.capacity
+
+    def rewind(self, k=0):
+        """Rewind the game to the snapshot taken k snapshots before the most recent one. The newer snapshots are
+        discarded so that the next snapshot continues from the restored state.
+
+        :param k: how many snapshots back (0 is the most recent).
+        :return: the slot that was restored.
+        """
+        slot = self.slot(k)
+        self.restore(slot)
+        self.head = (slot + 1) % self.capacity
+        self.count -= k
+        return slot
+
+    def clear(self):
+        """Forget all snapshots.
+
+        :return: None.
+        """
+        self.head = 0
+        self.count = 0
+
+    def _get_held_acceleration(self, color):
+        """Get the acceleration commands the environment is holding for a team."""
+        if color == 'red':
+            return self.env.red_acceleration
+        return self.env.blue_acceleration
+
+    def _set_held_acceleration(self, color, acceleration):
+        """Set the acceleration commands the environment is holding for a team."""
+        if color == 'red':
+            self.env.red_acceleration = acceleration
+        else:
+            self.env.blue_acceleration = acceleration
+
+    def _get_override(self, color):
+        """Get the tag overrides of a team."""
+        if color == 'red':
+            return self.env.red_team_override
+        return self.env.blue_team_override
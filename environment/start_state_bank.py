@@ -0,0 +1,122 @@
+"""
+capture_the_flag
+This file defines a bank of pre-generated start states that environments can be reset to.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import multiprocessing
+import numpy as np
+
+
+def _generate_chunk(task):
+    """Generates start states into rows of a bank file (run in a worker process or in this process).
+
+    :param task: tuple (path, first row, number of rows, init_args, randomise_probability, seed).
+    :return: number of rows written.
+    """
+    from environment.game_environment import GameEnvironment
+    from environment.reinforcement_learning_training_interface import ReinforcementLearningTrainingInterface
+    path, first, n_rows, init_args, randomise_probability, seed = task
+    env = GameEnvironment(generate_graphics=False, seed=seed, **init_args)
+    training_env = ReinforcementLearningTrainingInterface(env, env.red_team, init_args["game_rules"], randomise=True)
+    training_env.randomise_probability = randomise_probability
+    training_env.rng = env.rngs["red_training"]
+
+    states = np.load(path, mmap_mode='r+')
+    for row in range(first, first + n_rows):
+        training_env.reset_state()
+        env.world_state.snapshot(out=states[row])
+    states.flush()
+    return n_rows
+
+
+def generate_start_states(init_args, n_states, path, n_workers=0, randomise_probability=0.8, seed=None,
+                          chunk_size=10000):
+    """Generates start states the way ReinforcementLearningTrainingInterface.reset does (an initial state that is
+    randomised, both teams and possibly with captured flags, with probability randomise_probability) and writes them
+    to a .npy file. Each row is a snapshot of the WorldState buffer. Chunk i of the rows is seeded from (seed, i), so
+    the bank does not depend on n_workers.
+
+    :param init_args: arguments used to build the environment (GameEnvironment.init_args).
+    :param n_states: number of start states.
+    :param path: .npy file to write.
+    :param n_workers: number of worker processes (0 generates in this process).
+    :param randomise_probability: probability that a start state is randomised.
+    :param seed: base seed. If None a random base seed is drawn.
+    :param chunk_size: number of rows generated per task.
+    :return: StartStateBank of the file.
+    """
+    from environment.game_environment import GameEnvironment
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    size = GameEnvironment(generate_graphics=False, **init_args).world_state.size
+    states = np.lib.format.open_memmap(path, mode='w+', dtype=np.double, shape=(n_states, size))
+    del states
+
+    tasks = [(path, first, min(chunk_size, n_states - first), init_args, randomise_probability, [seed, chunk])
+             for chunk, first in enumerate(range(0, n_states, chunk_size))]
+    if n_workers == 0:
+        for task in tasks:
+            _generate_chunk(task)
+    else:
+        with multiprocessing.Pool(n_workers) as pool:
+            for _ in pool.imap_unordered(_generate_chunk, tasks):
+                pass
+    return StartStateBank(path)
+
+
+class StartStateBank:
+    def __init__(self, path, curriculum=None):
+        """Start states generated by generate_start_states. The file is memory mapped read only, so every process
+        using the bank shares one copy of it and only the rows drawn are read from disk.
+
+        :param path: .npy file of the bank.
+        :param curriculum: relative weight of drawing each start state (None draws uniformly), see set_curriculum.
+        """
+        self.path = path
+        self.states = np.load(path, mmap_mode='r')
+        self.n = len(self.states)
+        self.cum_weights = None
+        if curriculum is not None:
+            self.set_curriculum(curriculum)
+
+    def set_curriculum(self, weights):
+        """Set how likely each start state is to be drawn, e.g. to favour states with a captured flag (see field).
+
+        :param weights: relative weight of each start state (None draws uniformly).
+        :return: None.
+        """
+        if weights is None:
+            self.cum_weights = None
+            return
+        if len(weights) != self.n:
+            raise Exception("Need a weight for every start state")
+        self.cum_weights = np.cumsum(weights, dtype=np.double)
+
+    def field(self, world_state, name):
+        """A field of every start state.
+
+        :param world_state: WorldState of an environment the bank was generated for.
+        :param name: name of the field e.g. "blue_team_flag_is_captured" (see WorldState.names).
+        :return: ndarray (n, ...) (read from the file).
+        """
+        for field_name, _, _, offset, shape in world_state.layout:
+            if field_name == name:
+                return self.states[:, offset:offset + int(np.prod(shape))].reshape((self.n,) + shape)
+        raise Exception("Invalid field " + str(name))
+
+    def sample(self, rng):
+        """Draw a start state.
+
+        :param rng: numpy Generator.
+        :return: ndarray row of the bank (read only, see GameEnvironment.reset_env).
+        """
+        if self.cum_weights is None:
+            return self.states[rng.integers(self.n)]
+        idx = np.searchsorted(self.cum_weights, rng.random() * self.cum_weights[-1], side='right')
+        return self.states[min(idx, self.n - 1)]
@@ -0,0 +1,147 @@
+"""
+capture_the_flag
+This file defines the policies that decide when an episode can end early.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import numpy as np
+
+
+class TerminationPolicy:
+    def reset(self, env):
+        """Called when the environment is reset.
+
+        :param env: the GameEnvironment.
+        :return: None.
+        """
+        pass
+
+    def is_done(self, env):
+        """Checks whether the episode is over. This is called after the environment has been updated.
+
+        :param env: the GameEnvironment.
+        :return: True if the episode should end.
+        """
+        raise NotImplementedError("Please implement the is_done function on the termination policy.")
+
+
+class FirstScore(TerminationPolicy):
+    """The episode ends as soon as either team delivers a flag (first capture wins)."""
+
+    def is_done(self, env):
+        return env.red_score > 0 or env.blue_score > 0
+
+
+class ScoreLead(TerminationPolicy):
+    def __init__(self, lead=1):
+        """The episode ends when one team leads by at least lead points.
+
+        :param lead: winning margin.
+        """
+        self.lead = lead
+
+    def is_done(self, env):
+        return abs(env.red_score - env.blue_score) >= self.lead
+
+
+class AllDead(TerminationPolicy):
+    def __init__(self, team=None):
+        """The episode ends when every agent of a team is dead.
+
+        :param team: red or blue. If None either team being wiped out ends the episode.
+        """
+        self.team = team
+
+    def is_done(self, env):
+        for team in (env.red_team, env.blue_team):
+            if team is None or (self.team is not None and team.color != self.team):
+                continue
+            if not team.alive.any():
+                return True
+        return False
+
+
+class NoProgress(TerminationPolicy):
+    def __init__(self, n_ticks=200):
+        """The episode ends when nothing that can change the result has happened for n_ticks time steps. Progress is
+        any change in the scores, in which agents are carrying a flag, are tagged or are alive, or in which flags are
+        captured.
+
+        :param n_ticks: number of time steps without progress before the episode ends.
+        """
+        self.n_ticks = n_ticks
+        self.last_progress_step = 0
+        self.last_state = None
+
+    def reset(self, env):
+        self.last_progress_step = env.time_step
+        self.last_state = self._get_state(env)
+
+    def is_done(self, env):
+        state = self._get_state(env)
+        if self.last_state is None or not np.array_equal(state, self.last_state):
+            self.last_state = state
+            self.last_progress_step = env.time_step
+            return False
+        return env.time_step - self.last_progress_step >= self.n_ticks
+
+    @staticmethod
+    def _get_state(env):
+        """Collects the parts of the state that can change the result.
+
+        :param env: the GameEnvironment.
+        :return: ndarray.
+        """
+        state = [[env.red_score, env.blue_score]]
+        for team in (env.red_team, env.blue_team):
+            if team is not None:
+                state.extend([team.has_flag, team.is_tagged, team.alive])
+        for flags in (env.red_flags, env.blue_flags):
+            if flags is not None:
+                state.append(flags.is_captured)
+        return np.concatenate(state)
+
+
+class AnyOf(TerminationPolicy):
+    def __init__(self, *policies):
+        """The episode ends when any of the policies says so.
+
+        :param policies: TerminationPolicy objects.
+        """
+        self.policies = policies
+
+    def reset(self, env):
+        for policy in self.policies:
+            policy.reset(env)
+
+    def is_done(self, env):
+        # Every policy is checked so that stateful policies see each step
+        done = False
+        for policy in self.policies:
+            if policy.is_done(env):
+                done = True
+        return done
+
+
+def make_termination_policy(name, **kwargs):
+    """Builds a termination policy from its name.
+
+    :param name: first_score, score_lead, all_dead or no_progress.
+    :param kwargs: parameters of the policy.
+    :return: TerminationPolicy object.
+    """
+    if name == 'first_score':
+        return FirstScore()
+    elif name == 'score_lead':
+        return ScoreLead(**kwargs)
+    elif name == 'all_dead':
+        return AllDead(**kwargs)
+    elif name == 'no_progress':
+        return NoProgress(**kwargs)
+    else:
+        raise Exception("Invalid termination policy")
@@ -0,0 +1,295 @@
+"""
+capture_the_flag
+This file defines a vectorised reinforcement learning training environment that steps many games at once.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import ctypes
+import multiprocessing
+import numpy as np
+from environment.reinforcement_learning_training_interface import ReinforcementLearningTrainingInterface
+from environment.start_state_bank import StartStateBank
+
+
+def make_training_interface(init_args, team_color, seed=None, difficulty=None, start_states=None, curriculum=None):
+    """Builds a headless environment and the training interface of one of its teams.
+
+    :param init_args: arguments used to build the environment (GameEnvironment.init_args).
+    :param team_color: team being trained ('red' or 'blue').
+    :param seed: seed of the environment's random number streams (see GameEnvironment).
+    :param difficulty: difficulty of the environment (None keeps the default).
+    :param start_states: optional path of a start state bank to reset from (see environment/start_state_bank.py).
+    :param curriculum: optional relative weights of the start states (see StartStateBank.set_curriculum).
+    :return: ReinforcementLearningTrainingInterface.
+    """
+    from environment.game_environment import GameEnvironment
+    env = GameEnvironment(generate_graphics=False, seed=seed, **init_args)
+    if difficulty is not None:
+        env.difficulty = difficulty
+    if team_color == 'red':
+        team = env.red_team
+    elif team_color == 'blue':
+        team = env.blue_team
+    else:
+        raise Exception("Invalid team color")
+
+    training_env = team.controller.training_env
+    if training_env is None:
+        training_env = ReinforcementLearningTrainingInterface(env, team, init_args["game_rules"], env.randomise,
+                                                              team.sensor.joint, team.controller.action_space,
+                                                              team.sensor.observation_space)
+        training_env.rng = env.rngs[team_color + "_training"]
+    if start_states is not None:
+        training_env.start_state_bank = StartStateBank(start_states, curriculum)
+    return training_env
+
+
+def _as_array(shared, dtype, shape):
+    """Numpy view of a shared memory array.
+
+    :param shared: multiprocessing RawArray.
+    :param dtype: numpy dtype of the elements.
+    :param shape: shape of the array.
+    :return: ndarray using the shared memory.
+    """
+    return np.frombuffer(shared, dtype=dtype).reshape(shape)
+
+
+class _EnvSlot:
+    def __init__(self, training_env, observations, rewards, dones):
+        """One game of a VectorCTFEnv together with its rows of the shared buffers. The game is reset automatically
+        when its episode is done (including when it reaches max_episode_length, see infos["truncated"]); the
+        observation the episode ended on is returned in the infos as "terminal_observation".
+
+        :param training_env: ReinforcementLearningTrainingInterface.
+        :param observations: row of the observation buffer.
+        :param rewards: row of the reward buffer.
+        :param dones: row of the done buffer.
+        """
+        self.training_env = training_env
+        self.observations = observations
+        self.rewards = rewards
+        self.dones = dones
+
+    def reset(self):
+        """Reset the game and write its observations.
+
+        :return: None.
+        """
+        self.observations[...] = self.training_env.reset()
+
+    def step(self, actions):
+        """Step the game, write its observations, rewards and dones and reset it if the episode is done.
+
+        :param actions: actions of the trained team.
+        :return: infos of the step.
+        """
+        observations, rewards, dones, infos = self.training_env.step(actions)
+        self.rewards[...] = rewards
+        self.dones[...] = dones
+        if np.all(self.dones):
+            infos = dict(infos, terminal_observation=np.array(observations))
+            observations = self.training_env.reset()
+        self.observations[...] = observations
+        return infos
+
+
+def _worker(pipe, parent_pipe, init_args, team_color, seeds, difficulty, start_states, curriculum, shared, shapes,
+            first):
+    """Runs games of a VectorCTFEnv in a worker process. Commands ("reset", None), ("step", actions per game) and
+    ("close", None) are received through pipe. Observations, rewards and dones are written into the shared buffers
+    and the infos are sent back.
+
+    :param pipe: worker end of the pipe.
+    :param parent_pipe: parent end of the pipe (closed in the worker).
+    :param init_args: arguments used to build the environments.
+    :param team_color: team being trained.
+    :param seeds: seeds of the games run by the worker.
+    :param difficulty: difficulty of the environments.
+    :param start_states: optional path of a start state bank.
+    :param curriculum: optional relative weights of the start states.
+    :param shared: tuple of the shared observation, reward and done buffers.
+    :param shapes: tuple of the shapes of the shared buffers.
+    :param first: index of the first game run by the worker.
+    :return: None.
+    """
+    parent_pipe.close()
+    observations, rewards, dones = (_as_array(buffer, dtype, shape) for buffer, dtype, shape in
+                                    zip(shared, (np.float32, np.float64, np.bool_), shapes))
+    slots = [_EnvSlot(make_training_interface(init_args, team_color, seed, difficulty, start_states, curriculum),
+                      observations[first + idx], rewards[first + idx], dones[first + idx])
+             for idx, seed in enumerate(seeds)]
+    pipe.send(None)
+    try:
+        while True:
+            command, data = pipe.recv()
+            if command == "step":
+                pipe.send([slot.step(actions) for slot, actions in zip(slots, data)])
+            elif command == "reset":
+                for slot in slots:
+                    slot.reset()
+                pipe.send(None)
+            elif command == "close":
+                break
+            else:
+                raise Exception("Invalid command " + str(command))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipe.close()
+
+
+class VectorCTFEnv:
+    def __init__(self, init_args, team_color, n_envs, n_workers=0, seed=None, difficulty=None, start_states=None,
+                 curriculum=None, start_method=None):
+        """Runs n_envs training interfaces of the same game and steps them together. The games are run in this
+        process (n_workers=0) or split over worker processes. Observations, rewards and dones are written by the
+        games straight into shared memory arrays with one row per game, so nothing but the actions and infos is
+        pickled between processes.
+
+        Games are reset automatically when their episode is done (see _EnvSlot). Every game is seeded from (seed, game
+        index), so the games played do not depend on n_workers.
+
+        :param init_args: arguments used to build the environments (GameEnvironment.init_args).
+        :param team_color: team being trained ('red' or 'blue').
+        :param n_envs: number of games.
+        :param n_workers: number of worker processes (0 runs the games in this process).
+        :param seed: base seed. If None a random base seed is drawn.
+        :param difficulty: difficulty of the environments (None keeps the default).
+        :param start_states: optional path of a start state bank the games reset from (shared by every worker).
+        :param curriculum: optional relative weights of the start states (see StartStateBank.set_curriculum).
+        :param start_method: multiprocessing start method (None uses the platform default).
+        """
+        if n_envs < 1:
+            raise Exception("Need at least one environment")
+        self.n_envs = n_envs
+        self.num_envs = n_envs  # gym's name
+        self.n_workers = min(n_workers, n_envs)
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        seeds = [[seed, idx] for idx in range(n_envs)]
+
+        # Work out the shapes of the buffers from the first game
+        first_env = make_training_interface(init_args, team_color, seeds[0], difficulty, start_states,
+                                            curriculum)
+        self.observation_space = first_env.observation_space
+        self.action_space = first_env.action_space
+        observation_shape = np.shape(first_env.team.sensor.get_observations())
+        reward_shape = (1,) if first_env.joint else (first_env.team.n,)
+        shapes = ((n_envs,) + observation_shape, (n_envs,) + reward_shape, (n_envs,) + reward_shape)
+
+        self.slots = []
+        self.pipes = []
+        self.processes = []
+        self.actions = None
+        self.waiting = False
+        self.closed = False
+        if self.n_workers == 0:
+            self.observations = np.zeros(shapes[0], np.float32)
+            self.rewards = np.zeros(shapes[1], np.float64)
+            self.dones = np.zeros(shapes[2], bool)
+            training_envs = [first_env] + [make_training_interface(init_args, team_color, env_seed, difficulty,
+                                                                   start_states, curriculum)
+                                           for env_seed in seeds[1:]]
+            self.slots = [_EnvSlot(training_env, self.observations[idx], self.rewards[idx], self.dones[idx])
+                          for idx, training_env in enumerate(training_envs)]
+            return
+
+        context = multiprocessing.get_context(start_method)
+        shared = tuple(context.RawArray(ctype, int(np.prod(shape)))
+                       for ctype, shape in zip((ctypes.c_float, ctypes.c_double, ctypes.c_bool), shapes))
+        self.observations, self.rewards, self.dones = (_as_array(buffer, dtype, shape) for buffer, dtype, shape in
+                                                       zip(shared, (np.float32, np.float64, np.bool_), shapes))
+        # Contiguous blocks of games per worker
+        self.worker_games = np.array_split(np.arange(n_envs), self.n_workers)
+        for games in self.worker_games:
+            parent_pipe, worker_pipe = context.Pipe()
+            process = context.Process(target=_worker, args=(worker_pipe, parent_pipe, init_args, team_color,
+                                                            [seeds[idx] for idx in games], difficulty,
+                                                            start_states, curriculum, shared, shapes,
+                                                            int(games[0])), daemon=True)
+            process.start()
+            worker_pipe.close()
+            self.pipes.append(parent_pipe)
+            self.processes.append(process)
+        for pipe in self.pipes:
+            pipe.recv()
+
+    def reset(self):
+        """Reset every game.
+
+        :return: observations, ndarray (n_envs, ...) (overwritten by the next reset or step).
+        """
+        if self.n_workers == 0:
+            for slot in self.slots:
+                slot.reset()
+        else:
+            for pipe in self.pipes:
+                pipe.send(("reset", None))
+            for pipe in self.pipes:
+                pipe.recv()
+        return self.observations
+
+    def step_async(self, actions):
+        """Start stepping every game. step_wait gets the result.
+
+        :param actions: actions of the trained team for each game (indexed by game).
+        :return: None.
+        """
+        if self.waiting:
+            raise Exception("Already waiting for a step")
+        if len(actions) != self.n_envs:
+            raise Exception("Need actions for every environment")
+        self.actions = actions
+        if self.n_workers > 0:
+            for pipe, games in zip(self.pipes, self.worker_games):
+                pipe.send(("step", [actions[idx] for idx in games]))
+        self.waiting = True
+
+    def step_wait(self):
+        """Wait for the step started by step_async to finish.
+
+        :return: tuple (observations (n_envs, ...), rewards (n_envs, n), dones (n_envs, n), list of infos). The
+        arrays and infos are reused and overwritten by the next reset or step.
+        """
+        if not self.waiting:
+            raise Exception("No step to wait for")
+        if self.n_workers == 0:
+            infos = [slot.step(actions) for slot, actions in zip(self.slots, self.actions)]
+        else:
+            infos = []
+            for pipe in self.pipes:
+                infos.extend(pipe.recv())
+        self.actions = None
+        self.waiting = False
+        return self.observations, self.rewards, self.dones, infos
+
+    def step(self, actions):
+        """Step every game.
+
+        :param actions: actions of the trained team for each game (indexed by game).
+        :return: see step_wait.
+        """
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        """Stop the worker processes.
+
+        :return: None.
+        """
+        if self.closed:
+            return
+        if self.waiting:
+            self.step_wait()
+        for pipe in self.pipes:
+            pipe.send(("close", None))
+            pipe.close()
+        for process in self.processes:
+            process.join()
+        self.closed = True
@@ -0,0 +1,259 @@
+"""
+capture_the_flag
+This file defines the per time step cache of the queries the controllers make about the world.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import numpy as np
+from scipy.spatial.distance import cdist
+
+
+class WorldQueries:
+    def __init__(self, env):
+        """Computes the distance matrices, territory masks and target selections the controllers and high level
+        actions ask for, at most once per time step. Results are memoized until env.time_step changes or
+        invalidate() is called. Anything that changes the state of the world without advancing the time step
+        (resets, setting the state, rewinding) must call invalidate().
+
+        The selectors return the same agent as the original loops in GameEnvironment, including how ties and the
+        starting thresholds of those loops are handled.
+
+        :param env: the GameEnvironment.
+        """
+        self.env = env
+        self.time_step = None
+        self.cache = {}
+        self.generation = 0  # counts the invalidations (used to version the spatial indexes)
+
+    def invalidate(self):
+        """Forget every memoized result.
+
+        :return: None.
+        """
+        self.time_step = None
+        self.cache = {}
+        self.generation += 1
+
+    def _get(self, key, compute):
+        """Get a memoized result, computing it if needed.
+
+        :param key: hashable key of the query.
+        :param compute: function computing the result.
+        :return: the result.
+        """
+        if self.time_step != self.env.time_step:
+            self.cache = {}
+            self.time_step = self.env.time_step
+        if key not in self.cache:
+            self.cache[key] = compute()
+        return self.cache[key]
+
+    def _enemy_team(self, team):
+        """Get the enemy team of a team."""
+        return self.env.blue_team if team.color == 'red' else self.env.red_team
+
+    def distances(self, entities, other_entities):
+        """Distance matrix between two sets of entities (agents or flags).
+
+        :param entities: Entities object.
+        :param other_entities: Entities object.
+        :return: ndarray (entities.n, other_entities.n) of distances (do not modify).
+        """
+        return self._get(('distances', id(entities), id(other_entities)),
+                         lambda: cdist(entities.positions, other_entities.positions, metric='euclidean'))
+
+    def in_red_territory(self, team):
+        """Mask of the agents of a team that are in red territory (see GameEnvironment.in_red_territory).
+
+        :param team: Agents object.
+        :return: boolean ndarray (team.n,).
+        """
+        def compute():
+            boundary = self.env.game_boundary
+            positions = team.positions
+            return (positions[:, 0] < boundary[0, 1]) & (positions[:, 0] > boundary[0, 1] / 2) & \
+                   (positions[:, 1] > boundary[1, 0]) & (positions[:, 1] < boundary[1, 1])
+        return self._get(('in_red_territory', id(team)), compute)
+
+    def in_blue_territory(self, team):
+        """Mask of the agents of a team that are in blue territory (see GameEnvironment.in_blue_territory).
+
+        :param team: Agents object.
+        :return: boolean ndarray (team.n,).
+        """
+        def compute():
+            boundary = self.env.game_boundary
+            positions = team.positions
+            return (positions[:, 0] > boundary[0, 0]) & (positions[:, 0] < boundary[0, 1] / 2) & \
+                   (positions[:, 1] > boundary[1, 0]) & (positions[:, 1] < boundary[1, 1])
+        return self._get(('in_blue_territory', id(team)), compute)
+
+    def enemies_in_territory(self, team):
+        """Enemy agents in a team's territory.
+
+        :param team: Agents object.
+        :return: new list of enemy indices (the caller may modify it).
+        """
+        def compute():
+            enemy_team = self._enemy_team(team)
+            if team.color == 'red':
+                return np.flatnonzero(self.in_red_territory(enemy_team)).tolist()
+            return np.flatnonzero(self.in_blue_territory(enemy_team)).tolist()
+        return list(self._get(('enemies_in_territory', team.color), compute))
+
+    def ego_frame(self):
+        """Where every agent sees every other agent and flag from, shared by the sensors of both teams. Agents are
+        ordered red then blue and flags red then blue. Offsets are in the frame of the observing agent (x along its
+        heading, y to its left) and divided by the length of the diagonal of the game boundary.
+
+        Positions and offsets are clipped to [-1, 1] (agents can leave the game boundary a little). Dead agents are
+        parked far outside the game (see Agents.kill), so the offsets and relative headings seen by and of dead agents
+        are zero.
+
+        :return: dictionary of ndarrays (do not modify): "positions" (n, 2) positions scaled to [-1, 1] in the game
+        boundary, "agent_offsets" (n, n, 2), "headings" (n, n, 2) cos and sin of the heading of each agent relative
+        to each observer, "flag_offsets" (n, n_flags, 2), "has_flag", "is_tagged", "alive" (n,) and "is_captured"
+        (n_flags,).
+        """
+        def compute():
+            teams = [team for team in (self.env.red_team, self.env.blue_team) if team is not None]
+            flags = [flag for flag in (self.env.red_flags, self.env.blue_flags) if flag is not None]
+            positions = np.concatenate([team.positions for team in teams])
+            alive = np.concatenate([team.alive for team in teams])
+            dead = alive == 0
+            azimuths = np.concatenate([team.azimuths for team in teams])
+            flag_positions = np.concatenate([flag.positions for flag in flags])
+
+            boundary = self.env.game_boundary
+            size = boundary[:, 1] - boundary[:, 0]
+            scale = 1 / np.sqrt(np.sum(size ** 2))
+            cos_azimuth = np.cos(azimuths)[:, None]
+            sin_azimuth = np.sin(azimuths)[:, None]
+
+            def to_ego_frame(points):
+                offsets = points[None, :, :] - positions[:, None, :]
+                ego = np.empty(offsets.shape)
+                ego[..., 0] = (offsets[..., 0] * cos_azimuth + offsets[..., 1] * sin_azimuth) * scale
+                ego[..., 1] = (offsets[..., 1] * cos_azimuth - offsets[..., 0] * sin_azimuth) * scale
+                ego[dead] = 0.0
+                return np.clip(ego, -1.0, 1.0, out=ego)
+
+            agent_offsets = to_ego_frame(positions)
+            agent_offsets[:, dead] = 0.0
+            headings = np.empty((len(azimuths), len(azimuths), 2))
+            headings[..., 0] = cos_azimuth.T * cos_azimuth + sin_azimuth.T * sin_azimuth
+            headings[..., 1] = sin_azimuth.T * cos_azimuth - cos_azimuth.T * sin_azimuth
+            headings[dead] = 0.0
+            headings[:, dead] = 0.0
+            return {"positions": np.clip(2 * (positions - boundary[:, 0]) / size - 1, -1.0, 1.0),
+                    "agent_offsets": agent_offsets,
+                    "headings": headings,
+                    "flag_offsets": to_ego_frame(flag_positions),
+                    "has_flag": np.concatenate([team.has_flag for team in teams]),
+                    "is_tagged": np.concatenate([team.is_tagged for team in teams]),
+                    "alive": alive,
+                    "is_captured": np.concatenate([flag.is_captured for flag in flags])}
+        return self._get('ego_frame', compute)
+
+    def flag_holder(self, team):
+        """The last enemy agent holding the team's flag (for blue only red agents in blue territory count).
+
+        :param team: Agents object.
+        :return: enemy index (0 if no enemy holds the flag).
+        """
+        def compute():
+            enemy_team = self._enemy_team(team)
+            holders = enemy_team.has_flag.astype(bool)
+            if team.color != 'red':
+                holders = holders & self.in_blue_territory(enemy_team)
+            holders = np.flatnonzero(holders)
+            return int(holders[-1]) if len(holders) > 0 else 0
+        return self._get(('flag_holder', team.color), compute)
+
+    def closest_to_flag(self, team):
+        """The first enemy agent closest to the team's flag (for blue only red agents in blue territory count).
+
+        :param team: Agents object.
+        :return: enemy index or None.
+        """
+        def compute():
+            if team.color == 'red':
+                dist = self.distances(self.env.blue_team, self.env.red_flags)[:, 0]
+            else:
+                dist = np.where(self.in_blue_territory(self.env.red_team),
+                                self.distances(self.env.red_team, self.env.blue_flags)[:, 0], np.inf)
+            return _first_below(dist, 10000)
+        return self._get(('closest_to_flag', team.color), compute)
+
+    def farthest_from_flag(self, team):
+        """The enemy agent farthest from the team's flag. For red the last of the farthest agents is returned, for
+        blue the first of the farthest red agents in blue territory.
+
+        :param team: Agents object.
+        :return: enemy index or None.
+        """
+        def compute():
+            if team.color == 'red':
+                dist = self.distances(self.env.blue_team, self.env.red_flags)[:, 0]
+                if len(dist) == 0:
+                    return None
+                return int(len(dist) - 1 - np.argmax(dist[::-1]))
+            dist = np.where(self.in_blue_territory(self.env.red_team),
+                            self.distances(self.env.red_team, self.env.blue_flags)[:, 0], -np.inf)
+            if len(dist) == 0:
+                return None
+            idx = int(np.argmax(dist))
+            return idx if dist[idx] > 0 else None
+        return self._get(('farthest_from_flag', team.color), compute)
+
+    def top_enemy(self, team):
+        """The first enemy agent nearest the top of the map.
+
+        :param team: Agents object.
+        :return: enemy index or None.
+        """
+        def compute():
+            heights = self._enemy_team(team).positions[:, 1]
+            if len(heights) == 0:
+                return None
+            idx = int(np.argmax(heights))
+            return idx if heights[idx] > 0 else None
+        return self._get(('top_enemy', team.color), compute)
+
+    def bot_enemy(self, team):
+        """The first enemy agent nearest the bottom of the map.
+
+        :param team: Agents object.
+        :return: enemy index or None.
+        """
+        return self._get(('bot_enemy', team.color),
+                         lambda: _first_below(self._enemy_team(team).positions[:, 1], 1000))
+
+    def agent_zero_target(self, team):
+        """The first blue agent closest to red agent 0 (red only).
+
+        :param team: Agents object.
+        :return: enemy index or None.
+        """
+        if team.color != 'red':
+            return None
+        return self._get(('agent_zero_target', team.color),
+                         lambda: _first_below(self.distances(self.env.blue_team, self.env.red_team)[:, 0], 1000))
+
+
+def _first_below(values, threshold):
+    """Index of the first smallest value if it is below threshold.
+
+    :param values: ndarray.
+    :param threshold: the smallest value has to be below this.
+    :return: index or None.
+    """
+    if len(values) == 0:
+        return None
+    idx = int(np.argmin(values))
+    return idx if values[idx] < threshold else None
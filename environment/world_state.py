@@ -0,0 +1,96 @@
+"""
+capture_the_flag
+This file defines the world state buffer shared by the entities in the environment.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import numpy as np
+
+
+class WorldState:
+    def __init__(self, entities):
+        """Holds the state of all entities in one contiguous buffer. Each state field of each entity (see
+        Entities.state_fields) becomes a named view into the buffer called "<prefix>_<field>", for example
+        "red_team_positions". Because the entities read and write through these views, a copy of the buffer is a
+        complete snapshot of the world and restoring a snapshot is a single copy.
+
+        :param entities: list of (prefix, Entities object) pairs. None entities are skipped.
+        """
+        self.layout = []  # (name, entity, field, offset, shape)
+        offset = 0
+        for prefix, entity in entities:
+            if entity is None:
+                continue
+            for field in entity.state_fields:
+                shape = np.shape(getattr(entity, field))
+                self.layout.append((prefix + '_' + field, entity, field, offset, shape))
+                offset += int(np.prod(shape))
+        self.size = offset
+        self.buffer = np.zeros(self.size, np.double)
+
+        # Copy in the current values and point the entities at the buffer
+        self._views = {}
+        for name, entity, field, offset, shape in self.layout:
+            view = self.buffer[offset:offset + int(np.prod(shape))].reshape(shape)
+            view[...] = getattr(entity, field)
+            entity.bind_state_field(field, view, self)
+            self._views[name] = view
+
+    def names(self):
+        """Get the names of the fields in the buffer.
+
+        :return: list of field names.
+        """
+        return [name for name, _, _, _, _ in self.layout]
+
+    def view(self, name, writeable=True):
+        """Get a view of a field in the live buffer (no copy).
+
+        :param name: name of the field e.g. "blue_team_flag_is_captured".
+        :param writeable: if False the view is read-only.
+        :return: ndarray view.
+        """
+        view = self._views[name]
+        if not writeable:
+            view = view.view()
+            view.flags.writeable = False
+        return view
+
+    def views(self, buffer=None, writeable=True):
+        """Get views of every field of a buffer.
+
+        :param buffer: a snapshot taken with snapshot() (defaults to the live buffer).
+        :param writeable: if False the views are read-only.
+        :return: dictionary of field name to ndarray view.
+        """
+        if buffer is None:
+            buffer = self.buffer
+        if not writeable:
+            buffer = buffer.view()
+            buffer.flags.writeable = False
+        return {name: buffer[offset:offset + int(np.prod(shape))].reshape(shape)
+                for name, _, _, offset, shape in self.layout}
+
+    def snapshot(self, out=None):
+        """Copy the state of the world.
+
+        :param out: optional ndarray of size self.size to copy into instead of allocating.
+        :return: ndarray holding the snapshot.
+        """
+        if out is None:
+            return self.buffer.copy()
+        np.copyto(out, self.buffer)
+        return out
+
+    def restore(self, snapshot):
+        """Set the state of the world from a snapshot.
+
+        :param snapshot: ndarray taken with snapshot().
+        :return: None.
+        """
+        np.copyto(self.buffer, snapshot)
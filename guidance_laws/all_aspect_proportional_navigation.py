@@ -1,4 +1,5 @@
 import numpy as np
+from utils.utils import norm
 
 """
 capture_the_flag
@@ -11,7 +12,6 @@ Released to be used in the project entitled "Autonomous multi-agent decision mak
 in Capture the Flag game" for the Advanced Topics in Computer Science course at the
 University of Adelaide.
 """
-from utils.acceleration_conversions import convert_angular_acceleration
 
 # Set proportionality constant
 PROPORTIONALITY_CONSTANT = 5  # 1 is actually the best to avoid going in circles.
@@ -29,35 +29,49 @@ def all_aspect_proportional_navigation(agent_position, agent_velocity, target_po
 
     :return: nd array of acceleration commands.
     """
+    return all_aspect_proportional_navigation_batch(agent_position, agent_velocity, target_position,
+                                                    target_velocity, azimuth)
 
-    # Calculate instantaneous relative position and velocity
-    relative_position = target_position - agent_position
-    relative_velocity = target_velocity - agent_velocity
-    agent_speed = np.linalg.norm(agent_velocity)
-    relative_distance = np.linalg.norm(target_position - agent_position)
 
-    unit_vector_heading = np.array([np.cos(azimuth), np.sin(azimuth)])
-    unit_vector_los = relative_position / np.linalg.norm(relative_position)
+def all_aspect_proportional_navigation_batch(agent_positions, agent_velocities, target_positions, target_velocities,
+                                             azimuths):
+    """Does the all aspect proportional navigation algorithm for many agent/target pairs at once.
+
+    :param agent_positions: ndarray (..., 2) of agent positions.
+    :param agent_velocities: ndarray (..., 2) of agent velocities.
+    :param target_positions: ndarray (..., 2) of target positions.
+    :param target_velocities: ndarray (..., 2) of target velocities.
+    :param azimuths: ndarray (...) of agent azimuths.
+    :return: ndarray (..., 2) of acceleration commands.
+    """
+    agent_velocities = np.asarray(agent_velocities)
+
+    # Calculate instantaneous relative position and velocity
+    relative_position = np.subtract(target_positions, agent_positions)
+    relative_velocity = np.subtract(target_velocities, agent_velocities)
+    agent_speed = norm(agent_velocities)
+    relative_distance = norm(relative_position)
 
-    # Check this for errors
-    heading_error = np.arctan2(unit_vector_heading[0] * unit_vector_los[1] -
-                               unit_vector_heading[1] * unit_vector_los[0],
-                               unit_vector_heading[0] * unit_vector_los[0] +
-                               unit_vector_heading[1] * unit_vector_los[1])
+    cos_azimuth = np.cos(azimuths)
+    sin_azimuth = np.sin(azimuths)
+    unit_vector_los = relative_position / relative_distance[..., None]
 
-    # Calculated dot products and cross products
-    dot_position = np.dot(relative_position, relative_position)
-    cross_position_velocity = np.cross(relative_position, relative_velocity)
+    heading_error = np.arctan2(cos_azimuth * unit_vector_los[..., 1] - sin_azimuth * unit_vector_los[..., 0],
+                               cos_azimuth * unit_vector_los[..., 0] + sin_azimuth * unit_vector_los[..., 1])
 
     # Calculate rotation vector
+    dot_position = relative_position[..., 0] * relative_position[..., 0] + \
+        relative_position[..., 1] * relative_position[..., 1]
+    cross_position_velocity = relative_position[..., 0] * relative_velocity[..., 1] - \
+        relative_position[..., 1] * relative_velocity[..., 0]
     line_of_sight_rate = cross_position_velocity / dot_position
 
     function = (0.1717 * heading_error -
                 0.3885 * (heading_error ** 2) +
                 0.1925 * (heading_error ** 3)) * (agent_speed ** 3 / relative_distance)
-    acceleration = 3 * agent_speed * line_of_sight_rate + function  # Does it need to be negative 3?
+    lateral_acceleration = 3 * agent_speed * line_of_sight_rate + function
 
-    return convert_angular_acceleration(acceleration, azimuth)
+    return np.stack((lateral_acceleration * -1 * sin_azimuth, lateral_acceleration * cos_azimuth), axis=-1)
 
 
 def get_angle_diff(current_position, desired_position, azimuth):
@@ -10,6 +10,7 @@ in Capture the Flag game" for the Advanced Topics in Computer Science course at
 University of Adelaide.
 """
 import numpy as np
+from utils.utils import norm
 
 
 def genex(agent_position, agent_velocity, target_position, target_velocity):
@@ -22,18 +23,44 @@ def genex(agent_position, agent_velocity, target_position, target_velocity):
     :return: ndarray of acceleration commands.
     """
 
+    return genex_batch(agent_position, agent_velocity, target_position, target_velocity)
+
+
+def genex_batch(agent_positions, agent_velocities, target_positions, target_velocities):
+    """Does the GENEX guidance law for many agent/target pairs at once.
+
+    :param agent_positions: ndarray (..., 2) of agent positions.
+    :param agent_velocities: ndarray (..., 2) of agent velocities.
+    :param target_positions: ndarray (..., 2) of target positions.
+    :param target_velocities: ndarray (..., 2) of target velocities.
+    :return: ndarray (..., 2) of acceleration commands.
+    """
     n = 3  # GENEX gain
     k1 = (n + 2) * (n + 3)
     k2 = -1 * (n + 1) * (n + 2)
 
-    relative_position = target_position - agent_position
-    xtm = relative_position.conj().T / np.linalg.norm(relative_position)
+    agent_velocities = np.asarray(agent_velocities)
+    target_velocities = np.asarray(target_velocities)
+    relative_position = np.subtract(target_positions, agent_positions)
+    relative_distance = norm(relative_position)[..., None]
+    agent_speed = norm(agent_velocities)[..., None]
+    xtm = relative_position / relative_distance
 
     # Unit vector representing the desired final velocity vector
-    vm_f = -1 * target_velocity.conj().T / np.linalg.norm(target_velocity)
-    vm = agent_velocity.conj().T / np.linalg.norm(agent_velocity)
+    vm_f = -1 * target_velocities / norm(target_velocities)[..., None]
+    vm = agent_velocities / agent_speed
 
-    acceleration = np.linalg.norm(agent_velocity) ** 2 / np.linalg.norm(relative_position) * \
-        (k1 * (xtm - vm * np.dot(xtm, vm)) + k2 * (vm_f - vm * np.dot(vm_f, vm)))
+    acceleration = agent_speed ** 2 / relative_distance * \
+        (k1 * (xtm - vm * _dot(xtm, vm)) + k2 * (vm_f - vm * _dot(vm_f, vm)))
 
     return acceleration
+
+
+def _dot(vectors, other_vectors):
+    """Dot product along the last axis.
+
+    :param vectors: ndarray (..., 2).
+    :param other_vectors: ndarray (..., 2).
+    :return: ndarray (..., 1).
+    """
+    return (vectors[..., 0] * other_vectors[..., 0] + vectors[..., 1] * other_vectors[..., 1])[..., None]
@@ -10,6 +10,11 @@ in Capture the Flag game" for the Advanced Topics in Computer Science course at
 University of Adelaide.
 """
 import numpy as np
+from utils.utils import norm
+
+
+# Set proportionality constant
+PROPORTIONALITY_CONSTANT = 5  # 1 is actually the best to avoid going in circles.
 
 
 def proportional_navigation(agent_position, agent_velocity, target_position, target_velocity, target_acceleration=None):
@@ -22,30 +27,44 @@ def proportional_navigation(agent_position, agent_velocity, target_position, tar
     :param target_acceleration: acceleration of the target.
     :return: nd array of acceleration commands.
     """
+    return proportional_navigation_batch(agent_position, agent_velocity, target_position, target_velocity,
+                                         target_acceleration)
 
-    proportionality_constant = 5  # 1 is actually the best to avoid going in circles.
 
-    # Calculate instantaneous relative position and velocity
-    relative_position = target_position - agent_position
-    relative_velocity = target_velocity - agent_velocity
+def proportional_navigation_batch(agent_positions, agent_velocities, target_positions, target_velocities,
+                                  target_accelerations=None):
+    """Does the proportional navigation algorithm for many agent/target pairs at once.
 
-    # Calculated dot products and cross products
-    dot_position = np.dot(relative_position, relative_position)
-    cross_position_velocity = np.cross(relative_position, relative_velocity)
+    :param agent_positions: ndarray (..., 2) of agent positions.
+    :param agent_velocities: ndarray (..., 2) of agent velocities.
+    :param target_positions: ndarray (..., 2) of target positions.
+    :param target_velocities: ndarray (..., 2) of target velocities.
+    :param target_accelerations: ndarray (..., 2) of target accelerations.
+    :return: ndarray (..., 2) of acceleration commands.
+    """
+    agent_velocities = np.asarray(agent_velocities)
+
+    # Calculate instantaneous relative position and velocity
+    relative_position = np.subtract(target_positions, agent_positions)
+    relative_velocity = np.subtract(target_velocities, agent_velocities)
 
-    # Calculate rotation vector
+    # Line of sight rate (the z component of the rotation vector)
+    dot_position = relative_position[..., 0] * relative_position[..., 0] + \
+        relative_position[..., 1] * relative_position[..., 1]
+    cross_position_velocity = relative_position[..., 0] * relative_velocity[..., 1] - \
+        relative_position[..., 1] * relative_velocity[..., 0]
     line_of_sight_rate = cross_position_velocity / dot_position
-    line_of_sight_rate = np.array([0, 0, line_of_sight_rate])
 
-    closing_velocity = np.linalg.norm(relative_velocity) * agent_velocity / np.linalg.norm(agent_velocity)
-    closing_velocity = np.array([closing_velocity[0], closing_velocity[1], 0])
+    closing_velocity = norm(relative_velocity)[..., None] * agent_velocities / norm(agent_velocities)[..., None]
 
-    acceleration = np.cross(-1 * proportionality_constant * closing_velocity, line_of_sight_rate)
-    acceleration = acceleration[0:2]
+    # -N * closing velocity crossed with the rotation vector
+    closing_velocity = -1 * PROPORTIONALITY_CONSTANT * closing_velocity
+    acceleration = np.stack((closing_velocity[..., 1] * line_of_sight_rate,
+                             -(closing_velocity[..., 0] * line_of_sight_rate)), axis=-1)
 
     # Augmented acceleration (This has problems when you use the instantaneous acceleration).
-    if target_acceleration is not None:
-        augmented_acceleration = 0.5 * proportionality_constant * target_acceleration
+    if target_accelerations is not None:
+        augmented_acceleration = 0.5 * PROPORTIONALITY_CONSTANT * np.asarray(target_accelerations)
         acceleration = acceleration + augmented_acceleration
 
     return acceleration
@@ -12,6 +12,8 @@ University of Adelaide.
 
 
 from environment.game_environment import GameEnvironment
+from environment.termination import make_termination_policy
+from algorithms.self_play_trainer import SelfPlayTrainer
 
 if __name__ == '__main__':
 
@@ -26,21 +28,34 @@ if __name__ == '__main__':
     # Runs the game multiple times and outputs some statistics on the success/failure of the teams playing the game.
     should_evaluate = True
 
+    # Number of worker processes used for evaluation and the base seed of the evaluation episodes (None for unseeded).
+    evaluation_workers = 1
+    evaluation_seed = None
+
     # Displays the game running.
     should_display = False
 
+    # How the game is displayed: 'patches' (labelled wedges) or 'blit' (fast, shows the frame rate)
+    render_mode = 'blit'
+
     # Generates an mp4 file of the game.
     should_generate_animation = False
 
     # Training parameters
     epochs = 10
+
+    # Number of rollout worker processes of the asynchronous self-play trainer (0 trains one team at a time in this
+    # process)
+    training_workers = 0
     training_iterations = 1000000
     randomise = True
 
     # Goal options are attack or defend or ctf
     # Placement options are random_same, random_constraint, "random", "flag"
-    # Control options are custom
+    # Control options are custom, nn (needs "model": {"model_path": ..., "n_threads": ...}, see TorchPolicy),
+    # remote (needs "model": {"socket_path": ...}, see algorithms/inference_server.py)
     # action sets are discrete, joint, high_level, continuous
+    # Optional observation_features are any of positions, headings, flag_states, status (default all)
     red_team_var = {"n_agents": 2,
                     "n_flags": 1,
                     "acceleration_limit": 0.1,
@@ -65,10 +80,29 @@ if __name__ == '__main__':
 
     # Generate the environment
     game_rules = 'ctf'  # The games can be CTF or attack_defend (red is attack and blue is defend)
-    env = GameEnvironment(game_rules=game_rules, red_team_var=red_team_var, blue_team_var=blue_team_var,
-                          generate_graphics=True, randomise=randomise)
 
-    if train_red or train_blue:
+    # Episodes can end early once the result is decided. Options are None, first_score, score_lead, all_dead,
+    # no_progress (see environment/termination.py)
+    termination = None
+    termination_policy = make_termination_policy(termination) if termination is not None else None
+
+    # Seed of the environment's random number streams (None for fresh entropy)
+    seed = None
+
+    env = GameEnvironment(game_rules=game_rules, red_team_var=red_team_var, blue_team_var=blue_team_var,
+                          generate_graphics=should_display, randomise=randomise,
+                          termination_policy=termination_policy, seed=seed, render_mode=render_mode)
+
+    if (train_red or train_blue) and training_workers > 0:
+        # Models are loaded once, the workers get their weights from the trainer
+        if train_existing_red or not train_red:
+            env.load("red")
+        if train_existing_blue or not train_blue:
+            env.load("blue")
+        teams = [team for team, train in (("red", train_red), ("blue", train_blue)) if train]
+        trainer = SelfPlayTrainer(env, teams, n_workers=training_workers, seed=seed)
+        trainer.train(n_updates=training_iterations * epochs, phase_updates=epochs)
+    elif train_red or train_blue:
         for i in range(training_iterations):
             if train_red:
                 if train_existing_red:
@@ -88,13 +122,12 @@ if __name__ == '__main__':
         env.load("blue")
 
     if should_evaluate:
-        env.evaluate(evaluation_type=game_rules, evaluation_eps=1000, should_render=False)
+        env.evaluate(evaluation_type=game_rules, evaluation_eps=1000, should_render=False,
+                     n_workers=evaluation_workers, seed=evaluation_seed)
 
     if should_display:
         for i in range(10):
             env.run_ctf(should_render=True)
 
     if should_generate_animation:
-        for i in range(10):
-            file_name = 'myfile_%s.mp4' % i
-            env.generate_animation(file_name)
+        env.generate_animations(['myfile_%s.mp4' % i for i in range(10)])
@@ -10,17 +10,27 @@ in Capture the Flag game" for the Advanced Topics in Computer Science course at
 University of Adelaide.
 """
 import numpy as np
+from gym import spaces
+
+# Groups of features that can make up an observation (in the order they are laid out)
+OBSERVATION_FEATURES = ("positions", "headings", "flag_states", "status")
 
 
 class Sensor:
-    def __init__(self, env, team_color):
+    def __init__(self, env, team_color, observation_features=OBSERVATION_FEATURES):
         """Interface between the agents and the environment.
 
         :param env: the environment this is an interface to.
         :param team_color: team that sensor is sensing for.
+        :param observation_features: which groups of OBSERVATION_FEATURES are observed (see get_observations).
         """
         self.env = env
         self.team_color = team_color
+        for feature in observation_features:
+            if feature not in OBSERVATION_FEATURES:
+                raise Exception("Invalid observation feature " + str(feature))
+        self.observation_features = tuple(feature for feature in OBSERVATION_FEATURES
+                                          if feature in observation_features)
 
         self.team = None
         self.team_flags = None
@@ -31,6 +41,7 @@ class Sensor:
         self.joint = False
         self.obs_dim = 0
         self.observation_space = None
+        self.observations = None  # Buffer the observations are written into every call to get_observations
         self.min_velocity = np.array([-1, -1])
         self.max_velocity = np.array([1, 1])
 
@@ -57,6 +68,86 @@ class Sensor:
             self.joint = False
         self.min_velocity = np.array([-1*self.team.speed, -1*self.team.speed])  # Make this generic later
         self.max_velocity = np.array([self.team.speed, self.team.speed])  # Make this generic later
+        self._initialise_observations()
+
+    def _initialise_observations(self):
+        """Works out the layout of the observations and allocates the buffer they are written into.
+
+        :return: None.
+        """
+        # Rows of the team and columns of the other agents (team mates then enemies) in WorldQueries.ego_frame
+        first = 0 if self.team_color == "red" or self.env.red_team is None else self.env.red_team.n
+        enemy_first = self.team_n if first == 0 else 0
+        self._rows = np.arange(first, first + self.team_n)
+        team_mates = np.array([[first + other for other in range(self.team_n) if other != idx]
+                               for idx in range(self.team_n)], dtype=np.int64).reshape(self.team_n, -1)
+        enemies = np.broadcast_to(np.arange(enemy_first, enemy_first + self.enemy_n), (self.team_n, self.enemy_n))
+        self._others = np.concatenate([team_mates, enemies], axis=1)
+        # Columns of the team flag and the enemy flag (the first flag of each team)
+        red_flag_n = 0 if self.env.red_flags is None else self.env.red_flags.n
+        self._flags = np.array([0, red_flag_n]) if self.team_color == "red" else np.array([red_flag_n, 0])
+
+        n_others = self._others.shape[1]
+        sizes = {"positions": 2 + 2 * n_others + 4,
+                 "headings": 2 + 2 * n_others,
+                 "flag_states": 2 + 1 + n_others,
+                 "status": 2 * (1 + n_others)}
+        self._slices = {}
+        start = 0
+        for feature in self.observation_features:
+            self._slices[feature] = slice(start, start + sizes[feature])
+            start += sizes[feature]
+        self.obs_dim = start
+
+        self.observations = np.zeros((self.team_n, self.obs_dim), dtype=np.float32)
+        if self.joint:
+            self.observation_space = spaces.Box(low=-1.0, high=1.0, shape=(self.team_n * self.obs_dim,),
+                                                dtype=np.float32)
+        else:
+            self.observation_space = spaces.Box(low=-1.0, high=1.0, shape=(self.obs_dim,), dtype=np.float32)
+
+    def get_observations(self):
+        """Get the observations of the team. Each agent observes, for each group of self.observation_features:
+            positions: its position in the game boundary and where its team mates, the enemies, the team flag and the
+                enemy flag are relative to it (in its frame, see WorldQueries.ego_frame).
+            headings: its heading and the headings of its team mates and the enemies relative to its own (cos, sin).
+            flag_states: whether the team flag and the enemy flag are captured and whether it, its team mates and the
+                enemies have a flag.
+            status: whether it, its team mates and the enemies are tagged and alive.
+        Both teams' observations come from the same per time step computation (env.world_queries.ego_frame). Every
+        value is in [-1, 1] (observation_space); the offsets and relative headings of dead agents are zero.
+
+        The observations are written into the same buffer every call, so copy them to keep them past the next call.
+
+        :return: float32 ndarray (team_n, obs_dim), or (team_n * obs_dim,) for joint actions.
+        """
+        frame = self.env.world_queries.ego_frame()
+        rows = self._rows
+        others = self._others
+        n = self.team_n
+        observations = self.observations
+        for feature, columns in self._slices.items():
+            out = observations[:, columns]
+            if feature == "positions":
+                out[:, :2] = frame["positions"][rows]
+                out[:, 2:-4] = frame["agent_offsets"][rows[:, None], others].reshape(n, -1)
+                out[:, -4:] = frame["flag_offsets"][rows[:, None], self._flags].reshape(n, -1)
+            elif feature == "headings":
+                out[:, 0] = np.cos(self.team.azimuths)
+                out[:, 1] = np.sin(self.team.azimuths)
+                out[:, 2:] = frame["headings"][rows[:, None], others].reshape(n, -1)
+            elif feature == "flag_states":
+                out[:, :2] = frame["is_captured"][self._flags]
+                out[:, 2] = frame["has_flag"][rows]
+                out[:, 3:] = frame["has_flag"][others]
+            else:
+                out[:, 0] = frame["is_tagged"][rows]
+                out[:, 1] = frame["alive"][rows]
+                out[:, 2::2] = frame["is_tagged"][others]
+                out[:, 3::2] = frame["alive"][others]
+        if self.joint:
+            return observations.reshape(-1)
+        return observations
 
     def get_team_speed(self):
         """Get the nominal speed of the team. We assume constant speed for whole team.
@@ -0,0 +1,71 @@
+"""
+capture_the_flag
+Vectorised kinematics for constant speed agents.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import numpy as np
+
+
+def constant_speed_turn(positions, azimuths, accelerations, speed, acceleration_limit, delta_time):
+    """Applies an instantaneous constant acceleration for delta_time to any number of agents at once. This is the
+    array form of Agents.apply_acceleration and follows the same steps: the acceleration is clamped to the
+    acceleration limit, the turn direction is taken from the sign of the cross product with the heading, and the
+    agent follows the exact circular arc (or a straight line when the yaw rate is zero).
+    https://en.wikipedia.org/wiki/Yaw_(rotation)
+
+    The results agree with Agents.apply_acceleration to within 1e-9 (the only differences are floating point
+    rounding from evaluating the same expressions on arrays).
+
+    :param positions: ndarray (..., 2) of positions.
+    :param azimuths: ndarray (...) of azimuths.
+    :param accelerations: ndarray (..., 2) of acceleration commands.
+    :param speed: tangential speed of the agents (scalar or broadcastable to azimuths).
+    :param acceleration_limit: maximum lateral acceleration (scalar or broadcastable to azimuths).
+    :param delta_time: how long to apply acceleration for.
+    :return: tuple of ndarrays (positions, velocities, accelerations, azimuths) after delta_time.
+    """
+    accelerations = np.asarray(accelerations, dtype=np.double)
+    acceleration_x = accelerations[..., 0]
+    acceleration_y = accelerations[..., 1]
+
+    # Get the lateral acceleration (Normalise)
+    lateral_acceleration = np.sqrt(acceleration_x * acceleration_x + acceleration_y * acceleration_y)
+    over_limit = lateral_acceleration > acceleration_limit
+    scale = np.where(over_limit, acceleration_limit / np.where(over_limit, lateral_acceleration, 1.0), 1.0)
+    acceleration_x = acceleration_x * scale
+    acceleration_y = acceleration_y * scale
+    lateral_acceleration = np.sqrt(acceleration_x * acceleration_x + acceleration_y * acceleration_y)
+
+    # Work out if turning left (cross product < 0) or right and adjust lateral acceleration
+    cos_azimuth = np.cos(azimuths)
+    sin_azimuth = np.sin(azimuths)
+    cross = acceleration_x * sin_azimuth - acceleration_y * cos_azimuth
+    lateral_acceleration = np.where((lateral_acceleration != 0) & (cross >= 0),
+                                    -lateral_acceleration, lateral_acceleration)
+
+    # Calculate yaw velocity and the new angle
+    yaw_velocity = lateral_acceleration / speed
+    new_angle = azimuths + yaw_velocity * delta_time
+    cos_new_angle = np.cos(new_angle)
+    sin_new_angle = np.sin(new_angle)
+
+    # Exact arc when turning, straight line otherwise
+    turning = yaw_velocity != 0.0
+    safe_yaw_velocity = np.where(turning, yaw_velocity, 1.0)
+    delta_x = np.where(turning, speed * (sin_new_angle - sin_azimuth) / safe_yaw_velocity,
+                       speed * cos_new_angle * delta_time)
+    delta_y = np.where(turning, speed * (cos_azimuth - cos_new_angle) / safe_yaw_velocity,
+                       speed * sin_new_angle * delta_time)
+
+    new_positions = np.stack((positions[..., 0] + delta_x, positions[..., 1] + delta_y), axis=-1)
+    new_velocities = np.stack((speed * cos_new_angle, speed * sin_new_angle), axis=-1)
+    new_accelerations = np.stack((speed * yaw_velocity * -1 * sin_new_angle,
+                                  speed * yaw_velocity * cos_new_angle), axis=-1)
+    new_azimuths = np.arctan2(new_velocities[..., 1], new_velocities[..., 0])
+    return new_positions, new_velocities, new_accelerations, new_azimuths
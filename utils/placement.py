@@ -0,0 +1,64 @@
+"""
+capture_the_flag
+Vectorised placement of entities for many games at once.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import numpy as np
+
+
+def sample_positions(rng, placement_choice, bounds, n_games, n, min_distance=4.0):
+    """Places n entities in each of n_games games. This follows Entities.get_initial_positions.
+
+    :param rng: numpy random Generator.
+    :param placement_choice: random_constraint, random or random_same.
+    :param bounds: bounds for placement [[x_min, x_max], [y_min, y_max]].
+    :param n_games: number of games to place entities in.
+    :param n: number of entities in each game.
+    :param min_distance: minimum distance between entities when using random_constraint.
+    :return: ndarray (n_games, n, 2) of positions.
+    """
+    if placement_choice == "random_constraint":
+        return sample_positions_with_constraint(rng, bounds, n_games, n, min_distance)
+    elif placement_choice == "random":
+        return rng.uniform(bounds[:, 0], bounds[:, 1], size=(n_games, n, 2))
+    elif placement_choice == "random_same":
+        positions = rng.uniform(bounds[:, 0], bounds[:, 1], size=(n_games, 1, 2))
+        return np.repeat(positions, n, axis=1)
+    else:
+        raise Exception("Placement choice is invalid.")
+
+
+def sample_positions_with_constraint(rng, bounds, n_games, n, min_distance):
+    """Places entities one at a time with a minimum distance to the entities already placed, the same way as
+    Entities.randomise_pos_with_constraint, but for all games at once. Only the games whose candidate position was
+    rejected are resampled.
+
+    :param rng: numpy random Generator.
+    :param bounds: bounds for placement [[x_min, x_max], [y_min, y_max]].
+    :param n_games: number of games to place entities in.
+    :param n: number of entities in each game.
+    :param min_distance: minimum distance between entities.
+    :return: ndarray (n_games, n, 2) of positions.
+    """
+    positions = np.zeros((n_games, n, 2))
+    for entity_idx in range(n):
+        pending = np.arange(n_games)
+        i = 0
+        while len(pending) > 0:
+            candidates = rng.uniform(bounds[:, 0], bounds[:, 1], size=(len(pending), 2))
+            positions[pending, entity_idx] = candidates
+            if entity_idx == 0:
+                break
+            placed = positions[pending, :entity_idx]
+            dist = np.sqrt(((placed - candidates[:, None, :]) ** 2).sum(axis=-1)).min(axis=1)
+            pending = pending[dist <= (min_distance + 0.001)]
+            if i == 10 ** 9:
+                raise Exception("Not finding a good position to place random agents")
+            i += 1
+    return positions
@@ -0,0 +1,175 @@
+"""
+capture_the_flag
+This file defines a uniform grid spatial hash used to find entities that are close to each other.
+
+Copyright: Commonwealth of Australia 2022
+Developed by: David Hubczenko CWT/WCSD/DST Group
+POC: David.Hubczenko@dst.defence.gov.au
+Released to be used in the project entitled "Autonomous multi-agent decision making
+in Capture the Flag game" for the Advanced Topics in Computer Science course at the
+University of Adelaide.
+"""
+import numpy as np
+from scipy.spatial.distance import cdist
+
+# Margin added to a search radius when the exact distance check is done by the caller, so that rounding in the
+# distance calculation can't drop a pair exactly at the limit
+PROXIMITY_TOLERANCE = 1e-9
+
+# Below this many indexed points query_pairs compares every pair directly, which is cheaper than the grid
+DIRECT_QUERY_LIMIT = 32
+
+
+class SpatialHashGrid:
+    def __init__(self, cell_size):
+        """Indexes a set of points by the cell of a uniform grid they fall in. Finding every point within a radius of
+        a set of query points then only looks at the cells around each query point, so the cost grows with the
+        number of points and neighbours instead of with the product of the two set sizes.
+
+        update() only copies the positions. The grid is built the first time a query needs it, and small sets of
+        points (fewer than DIRECT_QUERY_LIMIT) are compared directly without building it.
+
+        :param cell_size: width of a grid cell (the largest search radius, e.g. max(kill distance, capture distance)).
+        """
+        self.cell_size = float(cell_size)
+        self.positions = None
+        self.version = None  # version of the positions given to update
+        self.built = False
+        self.order = None  # indices of the points sorted by cell key
+        self.keys = None  # distinct cell keys (sorted)
+        self.starts = None  # start of each cell in order
+        self.counts = None  # number of points in each cell
+        self.offsets = {}  # cell offsets searched around a query point, per reach
+
+    def _cells(self, positions):
+        """Get the integer cell coordinates of positions.
+
+        :param positions: ndarray (n, 2).
+        :return: ndarray (n, 2) of int64.
+        """
+        return np.floor(positions / self.cell_size).astype(np.int64)
+
+    @staticmethod
+    def _keys(cells):
+        """Combine cell coordinates into one int64 key per cell.
+
+        :param cells: ndarray (n, 2) of int64.
+        :return: ndarray (n,) of int64.
+        """
+        return cells[:, 0] * (2 ** 32) + cells[:, 1]
+
+    def update(self, positions, version=None):
+        """Index a set of positions. Nothing is done if version is given and is the version already indexed.
+
+        :param positions: ndarray (n, 2).
+        :param version: hashable that changes whenever the positions may have changed (None always updates).
+        :return: None.
+        """
+        if version is not None and version == self.version:
+            return
+        self.positions = np.array(positions, dtype=np.double)
+        self.version = version
+        self.built = False
+
+    def _build(self):
+        """Sort the positions by cell.
+
+        :return: None.
+        """
+        keys = self._keys(self._cells(self.positions))
+        self.order = np.argsort(keys, kind='stable')
+        self.keys, self.starts, self.counts = np.unique(keys[self.order], return_index=True, return_counts=True)
+        self.built = True
+
+    def _offsets(self, reach):
+        """Cell offsets within reach cells of a cell.
+
+        :param reach: number of cells.
+        :return: ndarray ((2 reach + 1) ** 2, 2).
+        """
+        if reach not in self.offsets:
+            offsets = np.arange(-reach, reach + 1)
+            self.offsets[reach] = np.stack(np.meshgrid(offsets, offsets, indexing='ij'), axis=-1).reshape(-1, 2)
+        return self.offsets[reach]
+
+    def query_pairs(self, points, radius):
+        """Find every (query point, indexed point) pair closer than or equal to radius.
+
+        :param points: ndarray (m, 2) of query positions.
+        :param radius: search radius.
+        :return: tuple (query indices, indexed point indices, distances) sorted by query index then point index
+        (the order of np.where on the full distance matrix).
+        """
+        points = np.asarray(points, dtype=np.double)
+        if self.positions is not None and 0 < len(self.positions) < DIRECT_QUERY_LIMIT:
+            distances = cdist(points, self.positions, metric='euclidean')
+            query, candidates = np.nonzero(distances <= radius)
+            return query, candidates, distances[query, candidates]
+
+        empty = (np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, np.double))
+        if self.positions is None or len(self.positions) == 0 or len(points) == 0:
+            return empty
+
+        if not self.built:
+            self._build()
+        # Cells around each query point that can hold a point within the radius
+        offsets = self._offsets(int(np.ceil(radius / self.cell_size)))
+        cells = self._cells(points)[:, None, :] + offsets[None, :, :]
+        keys = self._keys(cells.reshape(-1, 2))
+        query = np.repeat(np.arange(len(points)), len(offsets))
+
+        # Look up the occupied cells
+        slots = np.searchsorted(self.keys, keys)
+        slots[slots == len(self.keys)] = 0
+        occupied = self.keys[slots] == keys
+        query = query[occupied]
+        slots = slots[occupied]
+        if len(slots) == 0:
+            return empty
+
+        # Expand each occupied cell into its points
+        counts = self.counts[slots]
+        query = np.repeat(query, counts)
+        first = np.repeat(self.starts[slots] - np.cumsum(counts) + counts, counts)
+        candidates = self.order[first + np.arange(len(first))]
+
+        # Keep the candidates within the radius
+        difference = points[query] - self.positions[candidates]
+        distances = np.sqrt(np.sum(difference ** 2, axis=1))
+        close = distances <= radius
+        query, candidates, distances = query[close], candidates[close], distances[close]
+
+        sort = np.lexsort((candidates, query))
+        return query[sort], candidates[sort], distances[sort]
+
+
+if __name__ == '__main__':
+    # Benchmark: tag checks between two swarms at a constant density (the field grows with the number of agents)
+    import time
+
+    rng = np.random.default_rng(0)
+    kill_distance = 4.0
+    density = 200 / (160.0 * 80.0)  # 200 agents on the standard field
+    print("%8s %12s %12s %8s" % ("agents", "cdist (ms)", "grid (ms)", "pairs"))
+    for n in (100, 200, 400, 800, 1600, 3200, 6400):
+        side = np.sqrt(2 * n / density)
+        red = rng.uniform(0, side, size=(n, 2))
+        blue = rng.uniform(0, side, size=(n, 2))
+        repeats = max(1, 2000 // n)
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            dense = np.where(cdist(red, blue) < kill_distance)
+        cdist_time = (time.perf_counter() - start) / repeats
+
+        grid = SpatialHashGrid(kill_distance)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            grid.update(blue)
+            red_idx, blue_idx, dist = grid.query_pairs(red, kill_distance)
+            strict = dist < kill_distance
+        grid_time = (time.perf_counter() - start) / repeats
+
+        if not (np.array_equal(dense[0], red_idx[strict]) and np.array_equal(dense[1], blue_idx[strict])):
+            raise Exception("Spatial hash pairs do not match cdist")
+        print("%8d %12.3f %12.3f %8d" % (n, cdist_time * 1000, grid_time * 1000, len(dense[0])))
@@ -9,31 +9,45 @@ Released to be used in the project entitled "Autonomous multi-agent decision mak
 in Capture the Flag game" for the Advanced Topics in Computer Science course at the
 University of Adelaide.
 """
-from itertools import accumulate as _accumulate, repeat as _repeat
-from bisect import bisect as _bisect
-import random
+import numpy as np
 
 
-def choices(population, weights=None, *, cum_weights=None, k=1):
-    """Return a k sized list of population elements chosen with replacement.
-    If the relative weights or cumulative weights are not specified,
-    the selections are made with equal probability.
+def make_rngs(seed, names):
+    """Makes an independent random number generator for each name from one seed. The streams are spawned from a
+    SeedSequence so they do not overlap, and the same seed always gives the same streams.
 
-    https://github.com/python/cpython/blob/00923c63995e34cdc25d699478f113de99a69df9/Lib/random.py#L397-L420
+    :param seed: int, SeedSequence or None (fresh entropy). A SeedSequence is not changed (spawn would advance it),
+    so passing the same one again gives the same streams.
+    :param names: names of the streams.
+    :return: dictionary of name to numpy Generator.
     """
-    n = len(population)
-    if cum_weights is None:
-        if weights is None:
-            _int = int
-            n += 0.0    # convert to float for a small speed improvement
-            return [population[_int(random.random() * n)] for _ in _repeat(None, k)]
-        cum_weights = list(_accumulate(weights))
-    elif weights is not None:
-        raise TypeError('Cannot specify both weights and cumulative weights')
-    if len(cum_weights) != n:
-        raise ValueError('The number of weights does not match the population')
-    bisect = _bisect
-    total = cum_weights[-1] + 0.0   # convert to float
-    hi = n - 1
-    return [population[bisect(cum_weights, random.random() * total, 0, hi)]
-            for _ in _repeat(None, k)]
+    if isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key, pool_size=seed.pool_size)
+    else:
+        seed = np.random.SeedSequence(seed)
+    return {name: np.random.default_rng(child) for name, child in zip(names, seed.spawn(len(names)))}
+
+
+def sample_categorical(rng, weights, size=None, uniforms=None):
+    """Samples indices of a categorical distribution for many draws at once.
+
+    :param rng: numpy Generator (unused if uniforms is given).
+    :param weights: relative weight of each category.
+    :param size: number (or shape) of draws.
+    :param uniforms: optional ndarray of uniform [0, 1) numbers to use instead of drawing from rng.
+    :return: ndarray of category indices (int if size and uniforms are None).
+    """
+    cum_weights = np.cumsum(weights, dtype=np.double)
+    if uniforms is None:
+        uniforms = rng.random(size)
+    indices = np.searchsorted(cum_weights, np.asarray(uniforms) * cum_weights[-1], side='right')
+    return np.minimum(indices, len(cum_weights) - 1)
+
+
+def norm(vectors):
+    """Euclidean norm of the last axis of 2D vectors (faster than np.linalg.norm for small arrays).
+
+    :param vectors: ndarray (..., 2).
+    :return: ndarray (...).
+    """
+    return np.sqrt(vectors[..., 0] * vectors[..., 0] + vectors[..., 1] * vectors[..., 1])